@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Asynchronous Access Log for the Pipeline Server
+Request threads enqueue structured records; a single background thread
+writes them as JSON lines so slow stdout or disk never blocks a request.
+"""
+
+import sys
+import queue
+import threading
+from typing import Optional
+
+import json_codec
+
+
+class AccessLogWriter:
+    """
+    JSON-lines writer fed from a bounded queue.
+
+    When the queue is full new records are dropped (and counted) instead of
+    blocking the request thread.
+    """
+
+    def __init__(self, path: Optional[str] = None, maxsize: int = 10000, batch_size: int = 256):
+        self.path = path
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="access-log", daemon=True)
+                    self._thread.start()
+
+    def log(self, record: dict):
+        """Enqueue a record without blocking."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        stream = open(self.path, 'a', encoding='utf-8') if self.path else sys.stdout
+        try:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                batch = [record]
+                # Drain whatever else is waiting so one write covers many requests
+                while len(batch) < self.batch_size:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is None:
+                        self._write(stream, batch)
+                        return
+                    batch.append(record)
+                self._write(stream, batch)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+    @staticmethod
+    def _write(stream, batch):
+        lines = ''.join(json_codec.dumps(r, default=str).decode('utf-8') + '\n' for r in batch)
+        try:
+            stream.write(lines)
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    def close(self, timeout: float = 2.0):
+        """Flush pending records and stop the writer thread."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+In-Memory Asset Cache for the Pipeline Server
+Holds page shells, static files and translation payloads as pre-encoded
+bytes with a precomputed ETag and gzip variant. The gzip body has its own
+strong ETag (suffix "-gz"), as content-codings must not share one. Entries are revalidated
+against the source file's mtime/size at most once per check interval.
+Entries whose file is gone are dropped, and beyond max_entries the least
+recently checked entry is evicted.
+"""
+
+import os
+import gzip
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+# Bodies smaller than this are not worth compressing
+MIN_GZIP_SIZE = 1024
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+class CachedAsset:
+    """Encoded body plus the headers derived from it."""
+
+    __slots__ = ('body', 'gzip_body', 'etag', 'gzip_etag', 'content_type', 'mtime_ns', 'size', 'checked_at')
+
+    def __init__(self, body: bytes, content_type: str, mtime_ns: int, size: int):
+        self.body = body
+        self.content_type = content_type
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.checked_at = time.monotonic()
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.gzip_body = None
+        self.gzip_etag = None
+        if len(body) >= MIN_GZIP_SIZE and content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.gzip_body = compressed
+                self.gzip_etag = self.etag[:-1] + '-gz"'
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """True if an If-None-Match header names either encoding's ETag."""
+        if not if_none_match:
+            return False
+        tags = {tag.strip() for tag in if_none_match.split(',')}
+        return '*' in tags or self.etag in tags or (self.gzip_etag is not None and self.gzip_etag in tags)
+
+
+class AssetCache:
+    """
+    Process-wide cache keyed by file path (or an explicit key for generated
+    payloads such as translations).
+
+    Usage:
+        asset = ASSET_CACHE.get_file(path, 'text/html; charset=utf-8')
+        asset = ASSET_CACHE.get_generated(('translations', 'en'), source, build, 'application/json')
+    """
+
+    def __init__(self, check_interval: float = 1.0, max_entries: int = 512):
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, key, source: Path) -> Optional[CachedAsset]:
+        """Return the cached entry if its source is unchanged."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if now - entry.checked_at < self.check_interval:
+            return entry
+        try:
+            st = os.stat(source)
+        except OSError:
+            return None
+        if st.st_mtime_ns != entry.mtime_ns or st.st_size != entry.size:
+            return None
+        entry.checked_at = now
+        return entry
+
+    def get_generated(self, key, source: Path, build: Callable[[], bytes], content_type: str) -> Optional[CachedAsset]:
+        """
+        Return the cached payload built from `source`, rebuilding it when the
+        source file changes. Returns None if the source does not exist.
+        """
+        entry = self._fresh(key, source)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        try:
+            st = os.stat(source)
+        except OSError:
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        self.misses += 1
+        entry = CachedAsset(build(), content_type, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k].checked_at)
+                del self._entries[oldest]
+        return entry
+
+    def get_file(self, path: Path, content_type: str) -> Optional[CachedAsset]:
+        """Return the cached contents of a file, or None if it is missing."""
+        path = Path(path)
+        if not path.is_file():
+            self.discard(str(path))
+            return None
+        return self.get_generated(str(path), path, path.read_bytes, content_type)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            "entries": len(entries),
+            "bytes": sum(len(e.body) + len(e.gzip_body or b'') for e in entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+ASSET_CACHE = AssetCache()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Assignment Name Mapping for Review Data Pipeline
+Resolves raw assignment names from the CSV export to canonical HW keys
+(e.g. "hw03", "Homework 3" and "作業3" all become "HW3").
+
+Names that do not follow the HW<n> convention are mapped through
+assignment_map.json:
+{
+  "aliases": {
+    "Midterm Project": "HW8",      # rename to a canonical key
+    "Final Report": 9,             # shorthand for "HW9"
+    "Practice": null               # never a numbered homework
+  }
+}
+Alias lookup is case-insensitive and whitespace-trimmed.
+"""
+
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+import json_codec
+
+ASSIGNMENT_MAP_FILE = Path(os.environ.get('PIPELINE_ASSIGNMENT_MAP') or Path(__file__).parent / "assignment_map.json")
+
+HW_NUMBER_RE = re.compile(r"^(?:hw|homework|assignment|作業)\s*[-_#]?\s*0*(\d+)$", re.IGNORECASE)
+
+
+def hw_key(number: int) -> str:
+    return f"HW{number}"
+
+
+class AssignmentMapper:
+    """Resolve raw assignment names to (canonical key, HW number or None)."""
+
+    def __init__(self, aliases: dict = None):
+        self.aliases = {}
+        for name, target in (aliases or {}).items():
+            if isinstance(target, int):
+                target = hw_key(target)
+            self.aliases[name.strip().lower()] = target
+        self._resolved = {}
+
+    def resolve(self, name: str) -> Tuple[str, Optional[int]]:
+        """
+        Returns:
+            (key, number): key is the name to group under, number the HW
+            number used for range filtering (None if it is not a homework)
+        """
+        resolved = self._resolved.get(name)
+        if resolved is not None:
+            return resolved
+
+        stripped = (name or '').strip()
+        key = stripped
+        lookup = stripped.lower()
+        if lookup in self.aliases:
+            target = self.aliases[lookup]
+            key = target if target is not None else stripped
+            match = HW_NUMBER_RE.match(key) if target is not None else None
+        else:
+            match = HW_NUMBER_RE.match(stripped)
+        number = int(match.group(1)) if match else None
+        if number is not None:
+            key = hw_key(number)
+
+        resolved = (key, number)
+        self._resolved[name] = resolved
+        return resolved
+
+    def in_range(self, name: str, hw_start: int, hw_end: int) -> bool:
+        number = self.resolve(name)[1]
+        return number is not None and hw_start <= number <= hw_end
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_assignment_map(path: Path = None) -> AssignmentMapper:
+    """Load the alias file (cached until it changes); a missing file means no aliases."""
+    path = Path(path or ASSIGNMENT_MAP_FILE)
+    try:
+        key = (str(path), path.stat().st_mtime_ns)
+    except OSError:
+        return AssignmentMapper()
+
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        return AssignmentMapper(cached)
+
+    aliases = json_codec.load(path).get("aliases", {})
+    with _cache_lock:
+        _cache[key] = aliases
+    return AssignmentMapper(aliases)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Student x Feature Correlation Matrix
+Builds one dense matrix of every student's scores (Pre, Midterm, Final, HW1-7),
+per-HW review counts and label rates, and graph centrality when
+graph_metrics.json is available. Pearson, Spearman and partial (controlling
+for Pre) correlation matrices are then computed with a few matrix products
+instead of pair by pair.
+
+The result is written next to the final_result.json it was computed from
+as correlation_matrix.json.
+
+Usage:
+    python correlation_matrix.py [final_result.json] [--csv pearson|spearman|partial_pre]
+"""
+
+import sys
+import csv
+import json
+from pathlib import Path
+from typing import List, Optional
+
+import json_codec
+
+CORRELATION_MATRIX_FILE = "correlation_matrix.json"
+METHODS = ("pearson", "spearman", "partial_pre")
+CONTROL_FEATURE = "Pre"
+HW_LIST = ['HW1', 'HW2', 'HW3', 'HW4', 'HW5', 'HW6', 'HW7']
+LABELS = ('relevance', 'concreteness', 'constructive')
+GRAPH_FEATURES = ("pagerank", "in_degree", "out_degree", "reciprocity")
+
+
+def feature_names(with_graph: bool = False) -> List[str]:
+    names = ["Pre", "Midterm", "Final"] + list(HW_LIST)
+    for hw in HW_LIST:
+        names += [f"{hw}_given", f"{hw}_received"] + [f"{hw}_{label}" for label in LABELS]
+    names += ["total_given", "total_received"] + [f"{label}_rate" for label in LABELS]
+    if with_graph:
+        names += list(GRAPH_FEATURES)
+    return names
+
+
+def build_feature_matrix(scores: dict, review_activity: dict, graph_table: Optional[dict] = None):
+    """
+    Returns:
+        (student_ids, feature names, students x features float64 matrix);
+        label rates are percentages of the reviews a student gave.
+    """
+    import numpy as np
+
+    student_ids = sorted(scores)
+    names = feature_names(graph_table is not None)
+    matrix = np.zeros((len(student_ids), len(names)))
+
+    graph_columns = {}
+    if graph_table is not None:
+        metrics = graph_table["scopes"]["ALL"]["metrics"]
+        positions = {student: i for i, student in enumerate(graph_table["students"])}
+        graph_columns = {feature: (positions, metrics[feature]) for feature in GRAPH_FEATURES}
+
+    for row, student_id in enumerate(student_ids):
+        score = scores[student_id]
+        values = [score['pre'], score['midterm'], score['final']]
+        values += [score['hw_scores'].get(hw, 0) for hw in HW_LIST]
+        activity = review_activity.get(student_id)
+        for hw in HW_LIST:
+            given = activity['reviews_given'].get(hw, []) if activity else []
+            received = activity['reviews_received'].get(hw, []) if activity else []
+            values += [len(given), len(received)]
+            values += [sum(r[label] for r in given) / len(given) * 100 if given else 0 for label in LABELS]
+        total_given = activity['total_given'] if activity else 0
+        values += [total_given, activity['total_received'] if activity else 0]
+        values += [activity['quality_given'][label] / total_given * 100 if total_given else 0 for label in LABELS]
+        for feature in graph_columns:
+            positions, column = graph_columns[feature]
+            values.append(column[positions[student_id]] if student_id in positions else 0)
+        matrix[row] = values
+
+    return student_ids, names, matrix
+
+
+def pearson_matrix(matrix):
+    """Column correlations; rows and columns of constant features are NaN."""
+    import numpy as np
+
+    centered = matrix - matrix.mean(axis=0)
+    norms = np.sqrt((centered * centered).sum(axis=0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        standardized = centered / norms
+    corr = standardized.T @ standardized
+    np.clip(corr, -1, 1, out=corr)
+    return corr
+
+
+def spearman_matrix(matrix):
+    """Pearson correlation of column ranks (ties get their average rank)."""
+    from scipy.stats import rankdata
+    return pearson_matrix(rankdata(matrix, axis=0))
+
+
+def partial_matrix(matrix, control: int):
+    """
+    Correlations after regressing every column on one control column
+    (least squares with intercept, all columns in a single solve).
+    """
+    import numpy as np
+
+    design = np.column_stack([np.ones(len(matrix)), matrix[:, control]])
+    coef, *_ = np.linalg.lstsq(design, matrix, rcond=None)
+    residuals = matrix - design @ coef
+    # The control itself (and columns it explains exactly) has no residual variance left
+    scale = np.abs(matrix - matrix.mean(axis=0)).max(axis=0)
+    residuals[:, np.abs(residuals).max(axis=0) <= 1e-9 * np.maximum(scale, 1)] = 0
+    return pearson_matrix(residuals)
+
+
+def _to_rows(corr) -> List[List[Optional[float]]]:
+    """JSON rows with NaN (undefined correlations) as null."""
+    import numpy as np
+    rounded = np.round(corr, 4)
+    return [[None if np.isnan(v) else float(v) for v in row] for row in rounded]
+
+
+def compute_correlation_matrix(scores: dict, review_activity: dict, graph_table: Optional[dict] = None) -> dict:
+    import numpy as np
+
+    student_ids, names, matrix = build_feature_matrix(scores, review_activity, graph_table)
+    constant = [name for name, std in zip(names, matrix.std(axis=0)) if std == 0]
+    return {
+        "students": len(student_ids),
+        "features": names,
+        "constant_features": constant,
+        "control": CONTROL_FEATURE,
+        "means": np.round(matrix.mean(axis=0), 4).tolist(),
+        "pearson": _to_rows(pearson_matrix(matrix)),
+        "spearman": _to_rows(spearman_matrix(matrix)),
+        "partial_pre": _to_rows(partial_matrix(matrix, names.index(CONTROL_FEATURE)))
+    }
+
+
+def load_graph_table(result_file: Path) -> Optional[dict]:
+    """graph_metrics.json next to the result file, if the pipeline wrote one."""
+    from graph_analytics import GRAPH_METRICS_FILE
+    path = Path(result_file).parent / GRAPH_METRICS_FILE
+    if not path.exists():
+        return None
+    return json_codec.load(path)
+
+
+def write_csv(table: dict, method: str, out) -> None:
+    """One correlation matrix as CSV (feature names as header row and first column)."""
+    if method not in METHODS:
+        raise ValueError(f"method must be one of: {', '.join(METHODS)}")
+    writer = csv.writer(out)
+    writer.writerow([""] + table["features"])
+    for name, row in zip(table["features"], table[method]):
+        writer.writerow([name] + ["" if v is None else v for v in row])
+
+
+def generate_correlation_matrix(scores: dict, review_activity: dict, result_file: Path, output_path: Path) -> dict:
+    """Compute the matrix for one report and cache it at output_path."""
+    table = compute_correlation_matrix(scores, review_activity, load_graph_table(result_file))
+    json_codec.dump(table, output_path)
+    print(f"Correlation matrix saved to: {output_path} ({table['students']} students x {len(table['features'])} features)")
+    return table
+
+
+if __name__ == '__main__':
+    from score_review_analysis import RESULT_FILE, load_score_data, load_review_data, analyze_review_activity
+
+    args = sys.argv[1:]
+    method = None
+    if '--csv' in args:
+        position = args.index('--csv')
+        method = args[position + 1] if len(args) > position + 1 else "pearson"
+        args = args[:position]
+    result_file = Path(args[0]) if args else RESULT_FILE
+    activity = analyze_review_activity(load_review_data(result_file))
+    table = compute_correlation_matrix(load_score_data(), activity, load_graph_table(result_file))
+    if method:
+        write_csv(table, method, sys.stdout)
+    else:
+        print(json.dumps(table, ensure_ascii=False))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Bootstrap Confidence Intervals and Permutation Tests for Score-Review Correlations
+Adds uncertainty estimates to the per-HW Pearson correlations of
+score_review_analysis.py.
+
+For each HW the scores and the five review metrics are stacked into arrays
+and resampled in batches: one (batch x students) index matrix serves all five
+metrics at once, and correlations are computed row-wise with NumPy. HWs are
+spread across a process pool. Every HW gets its own seed derived from
+STATS_SEED, so results do not depend on the number of workers.
+
+Usage:
+    python correlation_stats.py [final_result.json]
+"""
+
+import os
+import sys
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+
+BOOTSTRAP_RESAMPLES = int(os.environ.get('PIPELINE_BOOTSTRAP_RESAMPLES', '2000'))
+PERMUTATIONS = int(os.environ.get('PIPELINE_PERMUTATIONS', '2000'))
+CONFIDENCE_LEVEL = 0.95
+STATS_SEED = 42
+BATCH_SIZE = 256
+MAX_BATCH_VALUES = 2_000_000   # caps a batch's resampled metric values (~16 MB)
+
+# Correlation key suffix -> data point field, as in calculate_correlations
+METRIC_FIELDS = {
+    "given": "reviews_given",
+    "quality": "quality_score",
+    "relevance": "relevance_score",
+    "concreteness": "concreteness_score",
+    "constructive": "constructive_score",
+}
+
+
+def batched_pearson(x, y):
+    """
+    Row-wise Pearson r along the last axis; x broadcasts against y.
+
+    Rows without variance give 0, like calculate_pearson.
+    """
+    import numpy as np
+
+    xc = x - x.mean(axis=-1, keepdims=True)
+    yc = y - y.mean(axis=-1, keepdims=True)
+    numerator = (xc * yc).sum(axis=-1)
+    denominator = np.sqrt((xc * xc).sum(axis=-1) * (yc * yc).sum(axis=-1))
+    return np.divide(numerator, denominator, out=np.zeros(np.broadcast(numerator, denominator).shape),
+                     where=denominator > 0)
+
+
+def _hw_uncertainty(task: tuple) -> dict:
+    """Bootstrap CIs and permutation p-values for one HW (runs in a worker)."""
+    import numpy as np
+
+    scores, metrics, resamples, permutations, level, seed = task
+    x = np.asarray(scores, dtype=np.float64)
+    y = np.asarray(metrics, dtype=np.float64)          # metrics x students
+    n = len(x)
+    boot_rng, perm_rng = [np.random.default_rng(s) for s in seed.spawn(2)]
+
+    observed = batched_pearson(x, y)
+    batch = max(1, min(BATCH_SIZE, MAX_BATCH_VALUES // (len(y) * n)))
+
+    boot = np.empty((len(y), resamples))
+    for start in range(0, resamples, batch):
+        size = min(batch, resamples - start)
+        index = boot_rng.integers(0, n, size=(size, n))
+        # (batch, n) scores against (metrics, batch, n) metric values
+        boot[:, start:start + size] = batched_pearson(x[index], y[:, index])
+
+    exceed = np.zeros(len(y), dtype=np.int64)
+    for start in range(0, permutations, batch):
+        size = min(batch, permutations - start)
+        shuffled = perm_rng.permuted(np.broadcast_to(x, (size, n)), axis=1)
+        null = batched_pearson(shuffled, y[:, None, :])
+        exceed += (np.abs(null) >= np.abs(observed)[:, None] - 1e-12).sum(axis=1)
+
+    alpha = (1 - level) / 2
+    low, high = np.quantile(boot, [alpha, 1 - alpha], axis=1)
+    return {
+        metric: {
+            "r": round(float(observed[i]), 4),
+            "ci_low": round(float(low[i]), 4),
+            "ci_high": round(float(high[i]), 4),
+            # Two-sided, counting the observed arrangement as one permutation
+            "p_value": round(float((exceed[i] + 1) / (permutations + 1)), 4)
+        }
+        for i, metric in enumerate(METRIC_FIELDS)
+    }
+
+
+def correlation_uncertainty(correlations: Dict[str, dict], resamples: int = BOOTSTRAP_RESAMPLES,
+                            permutations: int = PERMUTATIONS, level: float = CONFIDENCE_LEVEL,
+                            seed: int = STATS_SEED, workers: int = None) -> Dict[str, dict]:
+    """
+    Uncertainty for every HW in a calculate_correlations() result.
+
+    Returns:
+        {hw: {metric: {r, ci_low, ci_high, p_value}}}
+    """
+    import numpy as np
+
+    if resamples < 1 or permutations < 1:
+        raise ValueError("resamples and permutations must be positive")
+    if not 0 < level < 1:
+        raise ValueError("level must be between 0 and 1")
+
+    hw_list = [hw for hw, entry in correlations.items() if len(entry.get('data_points', [])) > 1]
+    seeds = np.random.SeedSequence(seed).spawn(len(hw_list))
+    tasks = []
+    for hw, hw_seed in zip(hw_list, seeds):
+        points = correlations[hw]['data_points']
+        tasks.append((
+            [p['hw_score'] for p in points],
+            [[p[field] for p in points] for field in METRIC_FIELDS.values()],
+            resamples, permutations, level, hw_seed
+        ))
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        results = [_hw_uncertainty(task) for task in tasks]
+    else:
+        try:
+            # spawn: forking the multi-threaded server process is unsafe
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                results = list(pool.map(_hw_uncertainty, tasks))
+        except (OSError, RuntimeError) as e:
+            print(f"Process pool unavailable ({e}), computing sequentially")
+            results = [_hw_uncertainty(task) for task in tasks]
+    return dict(zip(hw_list, results))
+
+
+def uncertainty_settings(resamples: int = BOOTSTRAP_RESAMPLES, permutations: int = PERMUTATIONS,
+                         level: float = CONFIDENCE_LEVEL, seed: int = STATS_SEED) -> dict:
+    return {
+        "bootstrap_resamples": resamples,
+        "permutations": permutations,
+        "confidence_level": level,
+        "seed": seed,
+        "method": "percentile bootstrap, two-sided permutation test on HW score"
+    }
+
+
+if __name__ == '__main__':
+    from pathlib import Path
+    from score_review_analysis import RESULT_FILE, load_score_data, load_review_data, \
+        analyze_review_activity, calculate_correlations
+
+    result_file = Path(sys.argv[1]) if len(sys.argv) > 1 else RESULT_FILE
+    correlations = calculate_correlations(load_score_data(), analyze_review_activity(load_review_data(result_file)))
+    print(json.dumps(correlation_uncertainty(correlations), indent=2))
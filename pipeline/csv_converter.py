@@ -6,20 +6,20 @@ Converts CSV format to JSON format for further processing.
 Expected CSV format:
 Author,Reviewer,Feedback,Time,Assignment,Round
 
+Inputs may also be .csv.gz, .zip (one or more CSVs) or .xlsx; rows are
+streamed from the compressed file (see table_reader.py).
+
 Note: Author_ID, Reviewer_ID, are auto-generated during conversion.
 """
 
-import csv
-import json
-import os
-from typing import Dict, List
-
+import sys
+from itertools import chain, islice
+from typing import Iterable, Iterator, List
 
-def create_id_mapping(names: List[str]) -> Dict[str, int]:
-    """Create a mapping from unique names to sequential IDs."""
-    valid_names = [name for name in names if name and name.strip() and name.upper() != 'NULL']
-    unique_names = sorted(set(valid_names))
-    return {name: idx + 1 for idx, name in enumerate(unique_names)}
+import json_codec
+from assignment_map import AssignmentMapper, load_assignment_map
+from table_reader import iter_tables
+from time_index import DETECT_SAMPLE_SIZE, TimestampParser
 
 
 def detect_column_names(reader_fieldnames: List[str]) -> dict:
@@ -61,7 +61,143 @@ def detect_column_names(reader_fieldnames: List[str]) -> dict:
     return mapping
 
 
-def convert_csv_to_json(csv_path: str, json_path: str) -> dict:
+def iter_csv_records(csv_path: str, hw_start: int = None, hw_end: int = None,
+                     rounds: Iterable[int] = None, reviewers: Iterable[str] = None,
+                     assignment_map: AssignmentMapper = None, stats: dict = None) -> Iterator[dict]:
+    """
+    Converted records of an input file, yielded as rows are read (see
+    convert_csv_to_json for the filters). When the input is exhausted the
+    conversion statistics are stored in `stats`.
+    """
+    all_authors = set()
+    all_reviewers = set()
+    total_rows = 0
+    filtered_rows = 0
+    converted = 0
+    
+    if assignment_map is None:
+        assignment_map = load_assignment_map()
+    filter_hw = hw_start is not None or hw_end is not None
+    hw_start = int(hw_start) if hw_start is not None else 1
+    hw_end = int(hw_end) if hw_end is not None else sys.maxsize
+    rounds = {int(r) for r in rounds} if rounds else None
+    reviewers = {r.strip() for r in reviewers} if reviewers else None
+    
+    print(f"Reading input file: {csv_path}")
+    timestamp_formats = []
+    unparsed_timestamps = 0
+    tables = 0
+    for table in iter_tables(csv_path):
+        tables += 1
+        fieldnames = table.fieldnames
+        print(f"Columns found in {table.name}: {fieldnames}")
+        
+        # Detect column mappings
+        col_map = detect_column_names(fieldnames)
+        print(f"Column mapping: {col_map}")
+        
+        # Get column names (only 6 required columns)
+        author_col = col_map['author']
+        reviewer_col = col_map['reviewer']
+        feedback_col = col_map['feedback']
+        assignment_col = col_map['assignment']
+        round_col = col_map['round']
+        time_col = col_map['time']
+        
+        if not author_col or not reviewer_col:
+            print(f"WARNING: Could not find author/reviewer columns!")
+            print(f"  Looking for Author or Owner_name")
+            print(f"  Looking for Reviewer or Reviewer")
+        
+        # Detect the timestamp format once per table from its first rows, which
+        # are buffered so the (possibly compressed) stream is read only once
+        rows = iter(table.rows)
+        head = list(islice(rows, DETECT_SAMPLE_SIZE))
+        time_parser = TimestampParser.for_values(
+            [row.get(time_col, '') or '' for row in head] if time_col else []
+        )
+        print(f"Timestamp format: {time_parser.format}")
+        if time_parser.format not in timestamp_formats:
+            timestamp_formats.append(time_parser.format)
+        
+        if filter_hw:
+            upper = f"HW{hw_end}" if hw_end != sys.maxsize else "last"
+            print(f"Filtering HW{hw_start} to {upper} while reading")
+        
+        # Convert rows to records
+        for row in chain(head, rows):
+            total_rows += 1
+            
+            # Cheapest predicate first: the assignment name resolves from a cache
+            assignment_name = (row.get(assignment_col, '') if assignment_col else '') or ''
+            if filter_hw and not assignment_map.in_range(assignment_name, hw_start, hw_end):
+                filtered_rows += 1
+                continue
+            
+            author = (row.get(author_col, '') if author_col else '') or ''
+            reviewer = (row.get(reviewer_col, '') if reviewer_col else '') or ''
+            
+            # Parse round number
+            try:
+                round_num = int(row.get(round_col, '') or '1') if round_col else 1
+            except (ValueError, TypeError):
+                round_num = 1
+            
+            if (rounds is not None and round_num not in rounds) or \
+                    (reviewers is not None and reviewer.strip() not in reviewers):
+                filtered_rows += 1
+                continue
+            
+            if author.strip() and author.upper() != 'NULL':
+                all_authors.add(author.strip())
+            
+            # Skip rows with invalid reviewer (reviewer is required)
+            if not reviewer.strip() or reviewer.upper() == 'NULL':
+                continue
+            all_reviewers.add(reviewer.strip())
+            
+            # Handle NULL author (keep as NULL, visualization will handle it)
+            if not author.strip() or author.upper() == 'NULL':
+                author = 'NULL'
+            
+            feedback = (row.get(feedback_col, '') if feedback_col else '') or ''
+            if feedback.upper() == 'NULL':
+                feedback = ''
+            
+            time_value = (row.get(time_col, '') if time_col else '') or ''
+            
+            record = {            
+                "Author": author,
+                "Reviewer": reviewer,
+                "Feedback": feedback,            
+                "Time": time_value,
+                "Timestamp": time_parser.parse(time_value),
+                "Assignment": assignment_map.resolve(assignment_name)[0],
+                "Round": round_num
+            }
+            converted += 1
+            yield record
+        unparsed_timestamps += time_parser.failures
+    
+    print(f"Found {total_rows} rows in CSV ({filtered_rows} excluded by filters)")
+    print(f"Found {len(all_authors)} unique authors, {len(all_reviewers)} unique reviewers")
+    
+    if stats is not None:
+        stats.update({
+            "total_rows": total_rows,
+            "filtered_rows": filtered_rows,
+            "converted_records": converted,
+            "unique_authors": len(all_authors),
+            "unique_reviewers": len(all_reviewers),
+            "source_tables": tables,
+            "timestamp_format": timestamp_formats[0] if len(timestamp_formats) == 1 else timestamp_formats,
+            "unparsed_timestamps": unparsed_timestamps
+        })
+
+
+def convert_csv_to_json(csv_path: str, json_path: str, hw_start: int = None, hw_end: int = None,
+                        rounds: Iterable[int] = None, reviewers: Iterable[str] = None,
+                        assignment_map: AssignmentMapper = None) -> dict:
     """
     Convert CSV file to JSON format.
     
@@ -72,109 +208,33 @@ def convert_csv_to_json(csv_path: str, json_path: str) -> dict:
     - Assignment: HW1, HW2, etc.
     - Round: Review round number
     
+    Optional predicates are applied while reading, so excluded rows are
+    never converted or written:
+    - hw_start / hw_end: keep assignments whose HW number is in range
+    - rounds: keep only these round numbers
+    - reviewers: keep only these reviewers
+    Assignment names are normalized through assignment_map (see
+    assignment_map.py) before filtering. Time is kept as the raw string and
+    also parsed to epoch seconds (Timestamp, None if unparseable).
+    
     Returns:
         dict with conversion statistics
     """
-    records = []
-    all_authors = []
-    all_reviewers = []
-    
-    print(f"Reading CSV file: {csv_path}")
-    with open(csv_path, 'r', encoding='utf-8') as csv_file:
-        reader = csv.DictReader(csv_file)
-        fieldnames = reader.fieldnames
-        print(f"CSV columns found: {fieldnames}")
-        
-        # Detect column mappings
-        col_map = detect_column_names(fieldnames)
-        print(f"Column mapping: {col_map}")
-        
-        rows = list(reader)
-    
-    print(f"Found {len(rows)} rows in CSV")
-    
-    # Get column names (only 6 required columns)
-    author_col = col_map['author']
-    reviewer_col = col_map['reviewer']
-    feedback_col = col_map['feedback']
-    assignment_col = col_map['assignment']
-    round_col = col_map['round']
-    time_col = col_map['time']
-    
-    if not author_col or not reviewer_col:
-        print(f"WARNING: Could not find author/reviewer columns!")
-        print(f"  Looking for Author or Owner_name")
-        print(f"  Looking for Reviewer or Reviewer")
-    
-    # Collect unique names
-    for row in rows:
-        author = row.get(author_col, '') if author_col else ''
-        reviewer = row.get(reviewer_col, '') if reviewer_col else ''
-        
-        if author and author.strip() and author.upper() != 'NULL':
-            all_authors.append(author.strip())
-        if reviewer and reviewer.strip() and reviewer.upper() != 'NULL':
-            all_reviewers.append(reviewer.strip())
-    
-    # Create ID mappings
-    author_id_map = create_id_mapping(all_authors)
-    reviewer_id_map = create_id_mapping(all_reviewers)
-    
-    print(f"Found {len(author_id_map)} unique authors, {len(reviewer_id_map)} unique reviewers")
-    
-    # Convert rows to records
-    for row in rows:
-        author = (row.get(author_col, '') if author_col else '') or ''
-        reviewer = (row.get(reviewer_col, '') if reviewer_col else '') or ''
-        
-        # Skip rows with invalid reviewer (reviewer is required)
-        if not reviewer.strip() or reviewer.upper() == 'NULL':
-            continue
-        
-        # Handle NULL author (keep as NULL, visualization will handle it)
-        if not author.strip() or author.upper() == 'NULL':
-            author = 'NULL'
-        
-        feedback = (row.get(feedback_col, '') if feedback_col else '') or ''
-        if feedback.upper() == 'NULL':
-            feedback = ''
-        
-        # Parse round number
-        try:
-            round_num = int(row.get(round_col, '') or '1') if round_col else 1
-        except (ValueError, TypeError):
-            round_num = 1
-       
-        
-        record = {            
-            "Author": author,
-            "Reviewer": reviewer,
-            "Feedback": feedback,            
-            "Time": (row.get(time_col, '') if time_col else '') or '',
-            "Assignment": (row.get(assignment_col, '') if assignment_col else '') or '',
-            "Round": round_num
-        }
-        records.append(record)
+    stats = {}
+    records = list(iter_csv_records(csv_path, hw_start, hw_end, rounds, reviewers, assignment_map, stats))
     
     # Write JSON output
     print(f"Writing JSON file: {json_path}")
-    with open(json_path, 'w', encoding='utf-8') as json_file:
-        json.dump(records, json_file, ensure_ascii=False, indent=2)
-    
-    stats = {
-        "total_rows": len(rows),
-        "converted_records": len(records),
-        "unique_authors": len(author_id_map),
-        "unique_reviewers": len(reviewer_id_map)
-    }
+    json_codec.dump(records, json_path)
     
     print(f"Successfully converted {len(records)} records")
     return stats
 
 
 if __name__ == '__main__':
-    import sys
     if len(sys.argv) >= 3:
-        convert_csv_to_json(sys.argv[1], sys.argv[2])
+        hw_start = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        hw_end = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        convert_csv_to_json(sys.argv[1], sys.argv[2], hw_start, hw_end)
     else:
-        print("Usage: python csv_converter.py <input.csv> <output.json>")
+        print("Usage: python csv_converter.py <input.csv|.csv.gz|.zip|.xlsx> <output.json> [hw_start] [hw_end]")
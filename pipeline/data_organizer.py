@@ -2,11 +2,255 @@
 """
 Data Organizer for Review Data Pipeline
 Organizes flat JSON records into structured format grouped by assignment.
+
+Records are held column-wise while organizing: assignment names, students,
+round numbers and time strings are interned once, and each review row is a
+handful of integers in array columns (pair, round, time, timestamp, feedback
+offset) with its feedback text in one UTF-8 buffer. Rows of the same
+(assignment, author, reviewer) pair are chained in arrival order. The input
+is streamed with json_codec.iter_array and the nested
+{HW: [{"Assignment", "Author", "Reviewer", "Round": [...]}]} document is
+written one assignment entry at a time, so the legacy dict shape only exists
+for the entry being serialized.
+
+Usage:
+    python data_organizer.py <input.json> <output.json> [hw_start] [hw_end]
 """
 
-import json
-from collections import defaultdict
-from typing import Dict, List, Any
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import json_codec
+from assignment_map import AssignmentMapper, load_assignment_map
+
+# Timestamp column value for None (or a value kept in the overflow dict)
+NO_TIMESTAMP = -(1 << 63)
+# Bits per student index in the pair lookup key
+STUDENT_BITS = 32
+
+
+class _Interner:
+    """Distinct values in first-seen order, addressed by their index."""
+
+    __slots__ = ("values", "index")
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def add(self, value) -> int:
+        position = self.index.get(value)
+        if position is None:
+            position = self.index[value] = len(self.values)
+            self.values.append(value)
+        return position
+
+
+class OrganizedReviews:
+    """Review rows grouped by assignment and (author, reviewer) pair."""
+
+    __slots__ = (
+        "records", "assignments", "students", "round_values", "time_values",
+        "pair_lookup", "pair_author", "pair_reviewer", "pair_first", "pair_last", "assignment_pairs",
+        "row_round", "row_time", "row_timestamp", "row_next", "feedback", "feedback_offsets", "overflow"
+    )
+
+    def __init__(self):
+        self.records = 0
+        self.assignments = _Interner()
+        self.students = _Interner()
+        self.round_values = _Interner()
+        self.time_values = _Interner()
+        self.pair_lookup = {}
+        self.pair_author = array('q')
+        self.pair_reviewer = array('q')
+        self.pair_first = array('q')
+        self.pair_last = array('q')
+        self.assignment_pairs = []  # per assignment: pair ids in first-seen order
+        self.row_round = array('q')
+        self.row_time = array('q')
+        self.row_timestamp = array('q')
+        self.row_next = array('q')  # next row of the same pair, -1 at the end
+        self.feedback = bytearray()
+        self.feedback_offsets = array('Q', [0])
+        self.overflow = {}  # (row, field) -> Timestamp/Feedback values the columns cannot hold
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> "OrganizedReviews":
+        organized = cls()
+        for record in records:
+            organized.add(record)
+        return organized
+
+    def __len__(self) -> int:
+        return len(self.row_next)
+
+    def add(self, record: Dict) -> Optional[int]:
+        """Store one flat record; returns its row, or None if it has no author or reviewer."""
+        self.records += 1
+        author = record.get("Author", "")
+        reviewer = record.get("Reviewer", "")
+        if not author or not reviewer:
+            return None
+
+        assignment = self.assignments.add(record.get("Assignment", "Unknown"))
+        if assignment == len(self.assignment_pairs):
+            self.assignment_pairs.append(array('q'))
+        author = self.students.add(author)
+        reviewer = self.students.add(reviewer)
+
+        row = len(self.row_next)
+        key = (assignment << (2 * STUDENT_BITS)) | (author << STUDENT_BITS) | reviewer
+        pair = self.pair_lookup.get(key)
+        if pair is None:
+            pair = self.pair_lookup[key] = len(self.pair_author)
+            self.pair_author.append(author)
+            self.pair_reviewer.append(reviewer)
+            self.pair_first.append(row)
+            self.pair_last.append(row)
+            self.assignment_pairs[assignment].append(pair)
+        else:
+            self.row_next[self.pair_last[pair]] = row
+            self.pair_last[pair] = row
+        self.row_next.append(-1)
+
+        self.row_round.append(self.round_values.add(record.get("Round", 1)))
+        self.row_time.append(self.time_values.add(record.get("Time", "")))
+
+        timestamp = record.get("Timestamp")
+        if type(timestamp) is int and NO_TIMESTAMP < timestamp < (1 << 63):
+            self.row_timestamp.append(timestamp)
+        else:
+            self.row_timestamp.append(NO_TIMESTAMP)
+            if timestamp is not None:
+                self.overflow[(row, "Timestamp")] = timestamp
+
+        feedback = record.get("Feedback", "")
+        if type(feedback) is str:
+            self.feedback += feedback.encode('utf-8', 'surrogatepass')
+        else:
+            self.overflow[(row, "Feedback")] = feedback
+        self.feedback_offsets.append(len(self.feedback))
+        return row
+
+    def _round_entry(self, row: int, round_fields: Callable = None) -> Dict[str, Any]:
+        timestamp = self.row_timestamp[row]
+        if timestamp == NO_TIMESTAMP:
+            timestamp = self.overflow.get((row, "Timestamp"))
+        if self.overflow and (row, "Feedback") in self.overflow:
+            feedback = self.overflow[(row, "Feedback")]
+        else:
+            start, end = self.feedback_offsets[row], self.feedback_offsets[row + 1]
+            feedback = self.feedback[start:end].decode('utf-8', 'surrogatepass')
+        entry = {
+            "Round": self.round_values.values[self.row_round[row]],
+            "Time": self.time_values.values[self.row_time[row]],
+            "Timestamp": timestamp,
+            "Feedback": feedback,
+        }
+        if round_fields is not None:
+            entry.update(round_fields(row))
+        return entry
+
+    def pair_rows(self, pair: int) -> Iterator[int]:
+        row = self.pair_first[pair]
+        while row != -1:
+            yield row
+            row = self.row_next[row]
+
+    def entries(self, assignment: int, round_fields: Callable = None) -> Iterator[Dict[str, Any]]:
+        """
+        Legacy assignment entries of one interned assignment, built on
+        demand; round_fields(row) adds fields (e.g. labels) to each round.
+        """
+        name = self.assignments.values[assignment]
+        students = self.students.values
+        for pair in self.assignment_pairs[assignment]:
+            rounds = [self._round_entry(row, round_fields) for row in self.pair_rows(pair)]
+            yield {
+                "Assignment": name,
+                "Author": students[self.pair_author[pair]],
+                "Reviewer": students[self.pair_reviewer[pair]],
+                "Round": rounds
+            }
+
+    def to_dict(self) -> Dict[str, List]:
+        """Everything in the shape organize_data has always returned."""
+        return {
+            name: list(self.entries(assignment))
+            for assignment, name in enumerate(self.assignments.values)
+        }
+
+    def select(self, start_hw: int, end_hw: int,
+               assignment_map: AssignmentMapper = None) -> Dict[str, List[int]]:
+        """
+        Canonical HW key -> interned assignments in that HW range, ordered
+        like filter_assignments orders its output.
+        """
+        if assignment_map is None:
+            assignment_map = load_assignment_map()
+
+        selected = []
+        for assignment, name in enumerate(self.assignments.values):
+            key, number = assignment_map.resolve(name)
+            if number is not None and start_hw <= number <= end_hw:
+                selected.append((number, key, assignment))
+
+        selection = {}
+        for _, key, assignment in sorted(selected, key=lambda s: s[0]):
+            selection.setdefault(key, []).append(assignment)
+        return selection
+
+    def document(self, selection: Dict[str, List[int]], round_fields: Callable = None) -> Dict[str, List]:
+        """The selected HW groups as the nested dict that write_json writes."""
+        return {
+            key: [entry for assignment in assignments for entry in self.entries(assignment, round_fields)]
+            for key, assignments in selection.items()
+        }
+
+    def rows(self, selection: Dict[str, List[int]]) -> Iterator[int]:
+        """Rows of the selected HW groups in document order."""
+        for assignments in selection.values():
+            for assignment in assignments:
+                for pair in self.assignment_pairs[assignment]:
+                    yield from self.pair_rows(pair)
+
+    def pair_count(self, assignments: List[int]) -> int:
+        return sum(len(self.assignment_pairs[a]) for a in assignments)
+
+    def summary(self, selection: Dict[str, List[int]]) -> dict:
+        """Organization statistics of a selection (organize_json_file's return value)."""
+        hw_counts = {key: self.pair_count(assignments) for key, assignments in selection.items()}
+        return {
+            "input_records": self.records,
+            "homework_count": len(selection),
+            "total_assignments": sum(hw_counts.values()),
+            "hw_breakdown": hw_counts
+        }
+
+    def write_json(self, path, selection: Dict[str, List[int]]) -> int:
+        """
+        Write the selected HW groups as compact JSON, one entry at a time;
+        the bytes match json_codec.dump of the equivalent dict.
+        """
+        written = 0
+        with open(path, 'wb') as f:
+            def write(data: bytes):
+                nonlocal written
+                f.write(data)
+                written += len(data)
+
+            write(b"{")
+            for i, (key, assignments) in enumerate(selection.items()):
+                write((b"," if i else b"") + json_codec.dumps(key) + b":[")
+                first = True
+                for assignment in assignments:
+                    for entry in self.entries(assignment):
+                        write((b"" if first else b",") + json_codec.dumps(entry))
+                        first = False
+                write(b"]")
+            write(b"}")
+        return written
 
 
 def organize_data(input_data: List[Dict]) -> Dict[str, List]:
@@ -19,43 +263,11 @@ def organize_data(input_data: List[Dict]) -> Dict[str, List]:
     Returns:
         Dictionary with assignments as keys
     """
-    assignment_dict = defaultdict(lambda: defaultdict(lambda: {
-        "Assignment": "",
-        "Author": "",
-        "Reviewer": "",
-        "Round": []
-    }))
-
-    for record in input_data:
-        assignment_name = record.get("Assignment", "Unknown")
-        author = record.get("Author", "")
-        reviewer = record.get("Reviewer", "")
-        
-        if not author or not reviewer:
-            continue
-
-        key = (author, reviewer)
-
-        # Initialize structure
-        if not assignment_dict[assignment_name][key]["Assignment"]:
-            assignment_dict[assignment_name][key]["Assignment"] = assignment_name
-            assignment_dict[assignment_name][key]["Author"] = author
-            assignment_dict[assignment_name][key]["Reviewer"] = reviewer
-
-        # Add Round data
-        assignment_dict[assignment_name][key]["Round"].append({
-            "Round": record.get("Round", 1),
-            "Time": record.get("Time", ""),
-            "Feedback": record.get("Feedback", ""),            
-        })
+    return OrganizedReviews.from_records(input_data).to_dict()
 
-    return {
-        assignment: list(records.values()) 
-        for assignment, records in assignment_dict.items()
-    }
 
-
-def filter_assignments(organized_data: Dict, start_hw: int, end_hw: int) -> Dict:
+def filter_assignments(organized_data: Dict, start_hw: int, end_hw: int,
+                       assignment_map: AssignmentMapper = None) -> Dict:
     """
     Filter data to include only specified homework range.
     
@@ -63,16 +275,24 @@ def filter_assignments(organized_data: Dict, start_hw: int, end_hw: int) -> Dict
         organized_data: Organized data dictionary
         start_hw: Starting homework number (e.g., 1 for HW1)
         end_hw: Ending homework number (e.g., 7 for HW7)
+        assignment_map: Resolves assignment names to HW numbers
+            (defaults to assignment_map.json)
         
     Returns:
-        Filtered dictionary
+        Filtered dictionary keyed by canonical HW key, in HW order
     """
-    filtered_data = {}
+    if assignment_map is None:
+        assignment_map = load_assignment_map()
+    
+    selected = []
+    for name, assignments in organized_data.items():
+        key, number = assignment_map.resolve(name)
+        if number is not None and start_hw <= number <= end_hw:
+            selected.append((number, key, assignments))
     
-    for hw in range(start_hw, end_hw + 1):
-        key = f"HW{hw}"
-        if key in organized_data:
-            filtered_data[key] = organized_data[key]
+    filtered_data = {}
+    for _, key, assignments in sorted(selected, key=lambda s: s[0]):
+        filtered_data.setdefault(key, []).extend(assignments)
     
     return filtered_data
 
@@ -85,31 +305,19 @@ def organize_json_file(input_path: str, output_path: str, hw_start: int = 1, hw_
         dict with organization statistics
     """
     print(f"Reading input file: {input_path}")
-    with open(input_path, 'r', encoding='utf-8') as f:
-        input_data = json.load(f)
+    organized = OrganizedReviews.from_records(json_codec.iter_array(input_path))
     
-    print(f"Organizing {len(input_data)} records...")
-    organized_data = organize_data(input_data)
+    print(f"Organized {organized.records} records into {len(organized.pair_author)} review pairs "
+          f"({len(organized.students.values)} students)")
     
     print(f"Filtering HW{hw_start} to HW{hw_end}...")
-    filtered_data = filter_assignments(organized_data, hw_start, hw_end)
+    selection = organized.select(hw_start, hw_end)
     
     print(f"Writing output file: {output_path}")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(filtered_data, f, ensure_ascii=False, indent=2)
-    
-    # Calculate statistics
-    total_assignments = sum(len(v) for v in filtered_data.values())
-    hw_counts = {k: len(v) for k, v in filtered_data.items()}
-    
-    stats = {
-        "input_records": len(input_data),
-        "homework_count": len(filtered_data),
-        "total_assignments": total_assignments,
-        "hw_breakdown": hw_counts
-    }
+    organized.write_json(output_path, selection)
     
-    print(f"Organized into {len(filtered_data)} homework sets with {total_assignments} assignments")
+    stats = organized.summary(selection)
+    print(f"Organized into {len(selection)} homework sets with {stats['total_assignments']} assignments")
     return stats
 
 
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Full-Text Index over Review Feedback
+Inverted index of every non-empty Feedback in final_result.json, searched
+with BM25 ranking.
+
+Tokenization: runs of CJK characters are split into character bigrams (and
+single characters, so one-character queries still match); other scripts are
+split into lower-cased words. A query is tokenized the same way, except that
+CJK runs of two or more characters only use their bigrams.
+
+Storage (output/<user>/feedback_index/): the index is a list of immutable
+segments, each a JSON file with the term dictionary and document columns
+(HW, author, reviewer, round, length, text, fingerprint) plus a binary
+postings file. A term's postings are varint-encoded (doc-id gap, term
+frequency) pairs. Updating the index only adds a segment for new or changed
+feedback and lists replaced or removed documents as deleted in older
+segments. Segments are merged by a full rebuild once deletions or the segment
+count grow too large. Updates and reloads hold an flock on update.lock in the
+index directory, so worker processes of a multi-process server never build
+or read a segment another one is writing; files are written to a temporary
+name and renamed into place.
+
+Usage:
+    python feedback_index.py build <final_result.json>
+    python feedback_index.py search <final_result.json> <query> [HW1,HW2]
+"""
+
+import os
+import re
+import sys
+import math
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import json_codec
+
+try:
+    import fcntl
+except ImportError:  # Windows: the in-process lock still applies
+    fcntl = None
+
+INDEX_DIR_NAME = "feedback_index"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "update.lock"
+INDEX_VERSION = 1
+MAX_SEGMENTS = 8
+MAX_DELETED_RATIO = 0.3
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+SNIPPET_CHARS = 160
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"  # kana, CJK ideographs
+TOKEN_RE = re.compile(rf"(?P<cjk>[{_CJK}]+)|(?P<word>(?:(?![{_CJK}])[^\W_])+)")
+
+
+def tokenize(text: str, query: bool = False) -> List[str]:
+    """Index terms of a text (CJK bigrams and unigrams, lower-cased words)."""
+    terms = []
+    for match in TOKEN_RE.finditer(text or ''):
+        word = match.group('word')
+        if word is not None:
+            terms.append(word.casefold())
+            continue
+        run = match.group('cjk')
+        if len(run) == 1:
+            terms.append(run)
+            continue
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        if not query:
+            terms.extend(run)
+    return terms
+
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_postings(data: bytes):
+    """Yield (doc id, term frequency) from a varint (gap, tf) stream."""
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    doc = 0
+    for i in range(0, len(values), 2):
+        doc += values[i]
+        yield doc, values[i + 1]
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def iter_documents(data: dict):
+    """
+    (key, document) for every round with feedback. The key is
+    HW|author|reviewer|round|n, where n counts repeats of the same tuple.
+    """
+    seen = {}
+    for hw_key, assignments in data.items():
+        for assignment in assignments:
+            author = assignment.get('Author', '')
+            reviewer = assignment.get('Reviewer', '')
+            for round_entry in assignment.get('Round', []):
+                text = round_entry.get('Feedback', '') or ''
+                if not text.strip():
+                    continue
+                base = f"{hw_key}|{author}|{reviewer}|{round_entry.get('Round')}"
+                occurrence = seen.get(base, 0)
+                seen[base] = occurrence + 1
+                yield f"{base}|{occurrence}", {
+                    "hw": hw_key,
+                    "author": author,
+                    "reviewer": reviewer,
+                    "round": round_entry.get('Round'),
+                    "text": text
+                }
+
+
+class Segment:
+    """One immutable batch of documents with its term dictionary and postings."""
+
+    def __init__(self, meta: dict, postings: bytes, deleted: Iterable[int] = ()):
+        self.name = meta["name"]
+        self.terms = meta["terms"]            # term -> [offset, length, df]
+        self.docs = meta["docs"]              # column -> list
+        self.postings = postings
+        self.deleted = set(deleted)
+
+    @property
+    def size(self) -> int:
+        return len(self.docs["key"])
+
+    @classmethod
+    def build(cls, name: str, documents: List[tuple]) -> "Segment":
+        columns = {column: [] for column in ("key", "hw", "author", "reviewer", "round", "length", "text", "fingerprint")}
+        term_docs = {}
+        for doc_id, (key, document) in enumerate(documents):
+            terms = tokenize(document["text"])
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                term_docs.setdefault(term, []).append((doc_id, tf))
+            columns["key"].append(key)
+            for column in ("hw", "author", "reviewer", "round", "text"):
+                columns[column].append(document[column])
+            columns["length"].append(len(terms))
+            columns["fingerprint"].append(_fingerprint(document["text"]))
+
+        postings = bytearray()
+        terms = {}
+        for term in sorted(term_docs):
+            start = len(postings)
+            previous = 0
+            for doc_id, tf in term_docs[term]:
+                _encode_varint(doc_id - previous, postings)
+                _encode_varint(tf, postings)
+                previous = doc_id
+            terms[term] = [start, len(postings) - start, len(term_docs[term])]
+        return cls({"name": name, "terms": terms, "docs": columns}, bytes(postings))
+
+    def save(self, directory: Path):
+        meta_path = directory / f"{self.name}.json"
+        postings_path = directory / f"{self.name}.postings"
+        temp_meta = meta_path.with_name(f"{meta_path.name}.{os.getpid()}.tmp")
+        temp_postings = postings_path.with_name(f"{postings_path.name}.{os.getpid()}.tmp")
+        json_codec.dump({"name": self.name, "terms": self.terms, "docs": self.docs}, temp_meta)
+        with open(temp_postings, 'wb') as f:
+            f.write(self.postings)
+        os.replace(temp_postings, postings_path)
+        os.replace(temp_meta, meta_path)
+
+    @classmethod
+    def load(cls, directory: Path, name: str, deleted: Iterable[int]) -> "Segment":
+        meta = json_codec.load(directory / f"{name}.json")
+        with open(directory / f"{name}.postings", 'rb') as f:
+            postings = f.read()
+        return cls(meta, postings, deleted)
+
+    def postings_for(self, term: str):
+        entry = self.terms.get(term)
+        if entry is None:
+            return ()
+        offset, length, _ = entry
+        return _decode_postings(self.postings[offset:offset + length])
+
+
+class FeedbackIndex:
+    """All segments of one index directory, with live-document statistics."""
+
+    def __init__(self, directory: Path, segments: List[Segment]):
+        self.directory = Path(directory)
+        self.segments = segments
+        self.live_docs = sum(s.size - len(s.deleted) for s in segments)
+        total_length = sum(
+            length for s in segments for doc_id, length in enumerate(s.docs["length"]) if doc_id not in s.deleted
+        )
+        self.avg_length = total_length / self.live_docs if self.live_docs else 0.0
+
+    @classmethod
+    def load(cls, directory) -> "FeedbackIndex":
+        directory = Path(directory)
+        manifest = json_codec.load(directory / MANIFEST_FILE)
+        if manifest.get("version") != INDEX_VERSION:
+            raise ValueError("Index version changed, rebuild required")
+        segments = [Segment.load(directory, s["name"], s["deleted"]) for s in manifest["segments"]]
+        return cls(directory, segments)
+
+    def search(self, query: str, hw_keys: Optional[List[str]] = None, limit: int = DEFAULT_LIMIT) -> dict:
+        """BM25-ranked documents matching any query term."""
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        started = time.perf_counter()
+        terms = list(dict.fromkeys(tokenize(query, query=True)))
+        hw_filter = set(hw_keys) if hw_keys else None
+
+        # Live document frequency of each term across segments
+        matches = {}
+        for term in terms:
+            postings = []
+            for s_idx, segment in enumerate(self.segments):
+                postings.extend((s_idx, doc_id, tf) for doc_id, tf in segment.postings_for(term)
+                                if doc_id not in segment.deleted)
+            matches[term] = postings
+
+        scores = {}
+        matched_terms = {}
+        for term, postings in matches.items():
+            if not postings:
+                continue
+            idf = math.log(1 + (self.live_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for s_idx, doc_id, tf in postings:
+                docs = self.segments[s_idx].docs
+                if hw_filter is not None and docs["hw"][doc_id] not in hw_filter:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * docs["length"][doc_id] / (self.avg_length or 1))
+                key = (s_idx, doc_id)
+                scores[key] = scores.get(key, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+                matched_terms[key] = matched_terms.get(key, 0) + 1
+
+        ranked = sorted(scores, key=lambda k: (-matched_terms[k], -scores[k], k))[:limit]
+        hits = []
+        for s_idx, doc_id in ranked:
+            docs = self.segments[s_idx].docs
+            hits.append({
+                "hw": docs["hw"][doc_id],
+                "author": docs["author"][doc_id],
+                "reviewer": docs["reviewer"][doc_id],
+                "round": docs["round"][doc_id],
+                "score": round(scores[(s_idx, doc_id)], 4),
+                "matched_terms": matched_terms[(s_idx, doc_id)],
+                "feedback": _snippet(docs["text"][doc_id], query)
+            })
+        return {
+            "query": query,
+            "terms": terms,
+            "total": len(scores),
+            "took_ms": round((time.perf_counter() - started) * 1000, 2),
+            "hits": hits
+        }
+
+
+def _snippet(text: str, query: str) -> str:
+    """Up to SNIPPET_CHARS of text around the first query term."""
+    if len(text) <= SNIPPET_CHARS:
+        return text
+    lowered = text.casefold()
+    positions = [lowered.find(term) for term in tokenize(query, query=True)]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - SNIPPET_CHARS // 4) if positions else 0
+    end = min(len(text), start + SNIPPET_CHARS)
+    return ("…" if start else "") + text[start:end] + ("…" if end < len(text) else "")
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_update_lock = threading.RLock()
+
+
+def index_dir_for(result_path) -> Path:
+    return Path(result_path).parent / INDEX_DIR_NAME
+
+
+@contextmanager
+def _index_lock(directory: Path):
+    """Exclusive access to an index directory, within and across processes."""
+    with _update_lock:
+        directory.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(directory / LOCK_FILE, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_manifest(directory: Path, segments: List[Segment], next_segment: int):
+    manifest = {
+        "version": INDEX_VERSION,
+        "next_segment": next_segment,
+        "segments": [{"name": s.name, "docs": s.size, "deleted": sorted(s.deleted)} for s in segments]
+    }
+    temp_path = directory / f"{MANIFEST_FILE}.{os.getpid()}.tmp"
+    json_codec.dump(manifest, temp_path)
+    os.replace(temp_path, directory / MANIFEST_FILE)
+
+
+def update_index(result_path, data: dict = None) -> dict:
+    """
+    Bring the index next to a result file up to date, adding a segment only
+    for new or changed feedback.
+
+    Returns:
+        dict with statistics
+    """
+    with _index_lock(index_dir_for(result_path)):
+        return _update_index(result_path, data)
+
+
+def _update_index(result_path, data: dict = None) -> dict:
+    started = time.perf_counter()
+    directory = index_dir_for(result_path)
+    if data is None:
+        data = json_codec.load_result(result_path)
+    documents = list(iter_documents(data))
+
+    try:
+        manifest = json_codec.load(directory / MANIFEST_FILE)
+        if manifest.get("version") != INDEX_VERSION:
+            raise ValueError("index version changed")
+        segments = [Segment.load(directory, s["name"], s["deleted"]) for s in manifest["segments"]]
+        next_segment = manifest["next_segment"]
+    except (OSError, ValueError, KeyError):
+        segments, next_segment = [], 0
+
+    live = {}
+    for s_idx, segment in enumerate(segments):
+        for doc_id, (key, fingerprint) in enumerate(zip(segment.docs["key"], segment.docs["fingerprint"])):
+            if doc_id not in segment.deleted:
+                live[key] = (s_idx, doc_id, fingerprint)
+
+    added = []
+    removed = 0
+    for key, document in documents:
+        existing = live.pop(key, None)
+        if existing is not None and existing[2] == _fingerprint(document["text"]):
+            continue
+        if existing is not None:
+            segments[existing[0]].deleted.add(existing[1])
+            removed += 1
+        added.append((key, document))
+    for s_idx, doc_id, _ in live.values():
+        segments[s_idx].deleted.add(doc_id)
+    removed += len(live)
+
+    # Drop fully deleted segments; merge everything when the index gets fragmented
+    segments = [s for s in segments if s.size > len(s.deleted)]
+    total = sum(s.size for s in segments) + len(added)
+    deleted_total = sum(len(s.deleted) for s in segments)
+    rebuild = bool(len(segments) + bool(added) > MAX_SEGMENTS
+                   or (total and deleted_total / total > MAX_DELETED_RATIO))
+    if rebuild:
+        added = documents
+        segments = []
+    if added:
+        segment = Segment.build(f"seg{next_segment:05d}", added)
+        segment.save(directory)
+        segments.append(segment)
+        next_segment += 1
+    _write_manifest(directory, segments, next_segment)
+
+    # Remove segment files no longer referenced by the manifest, and temporary
+    # files left by an interrupted update (the lock is held, so none is in use)
+    kept = {s.name for s in segments}
+    for path in directory.iterdir():
+        if path.suffix == ".tmp" or (path.suffix in (".json", ".postings")
+                                     and path.stem not in kept and path.name != MANIFEST_FILE):
+            path.unlink()
+
+    stats = {
+        "documents": sum(s.size - len(s.deleted) for s in segments),
+        "added": len(added),
+        "removed": removed,
+        "segments": len(segments),
+        "rebuilt": rebuild,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+    print(f"Feedback index: {stats}")
+    return stats
+
+
+def get_index(result_path) -> FeedbackIndex:
+    """
+    Loaded index for a result file. The index is updated first when the
+    result file is newer than it, and reloaded when its manifest changes.
+    """
+    directory = index_dir_for(result_path)
+    manifest_path = directory / MANIFEST_FILE
+    with _indexes_lock:
+        cached = _indexes.get(str(directory))
+    if cached is not None:
+        try:
+            st = os.stat(manifest_path)
+            if cached[0] == (st.st_mtime_ns, st.st_size) and st.st_mtime_ns >= os.stat(result_path).st_mtime_ns:
+                return cached[1]
+        except FileNotFoundError:
+            pass
+
+    # Another process may be updating the index and removing old segments
+    with _index_lock(directory):
+        if (not manifest_path.exists()
+                or manifest_path.stat().st_mtime_ns < os.stat(result_path).st_mtime_ns):
+            _update_index(result_path)
+        st = os.stat(manifest_path)
+        version = (st.st_mtime_ns, st.st_size)
+        with _indexes_lock:
+            cached = _indexes.get(str(directory))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        index = FeedbackIndex.load(directory)
+    with _indexes_lock:
+        _indexes[str(directory)] = (version, index)
+    return index
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == 'build':
+        update_index(sys.argv[2])
+    elif len(sys.argv) >= 4 and sys.argv[1] == 'search':
+        selected = sys.argv[4].split(',') if len(sys.argv) > 4 else None
+        print(json_codec.dumps(get_index(sys.argv[2]).search(sys.argv[3], selected), pretty=True).decode('utf-8'))
+    else:
+        print("Usage: python feedback_index.py build <final_result.json>")
+        print("       python feedback_index.py search <final_result.json> <query> [HW1,HW2]")
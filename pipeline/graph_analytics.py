@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Review Network Analytics
+Builds the reviewer -> author network as scipy.sparse CSR matrices, one per
+HW and one across all HWs, and computes per-student PageRank, in/out degree,
+reciprocity, connected components and label-propagation communities.
+
+Edges are weighted by the number of non-empty review rounds; label quality
+is the mean round score with the graph view's weights (Relevance 30,
+Concreteness 30, Constructive 40, scaled to 0-1).
+
+The result is written as a column-oriented table next to final_result.json:
+{
+  "students": ["D0001", ...],
+  "scopes": {
+    "ALL": {"summary": {...}, "metrics": {"pagerank": [...], ...}},
+    "HW1": {...}
+  }
+}
+
+Usage:
+    python graph_analytics.py <final_result.json> [output.json]
+"""
+
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import json_codec
+
+GRAPH_METRICS_FILE = "graph_metrics.json"
+ALL_SCOPE = "ALL"
+
+LABEL_WEIGHTS = {"Relevance": 0.3, "Concreteness": 0.3, "Constructive": 0.4}
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOL = 1e-10
+PAGERANK_MAX_ITER = 200
+COMMUNITY_MAX_ITER = 50
+COMMUNITY_SEED = 42
+
+METRIC_COLUMNS = [
+    "in_degree", "out_degree", "reviews_received", "reviews_given", "pagerank",
+    "reciprocity", "quality_given", "quality_received", "component", "component_size", "community"
+]
+
+
+class EdgeList:
+    """
+    One row per (HW, reviewer, author) assignment, gathered in a single pass
+    over the result document.
+    """
+
+    def __init__(self, data: dict):
+        import numpy as np
+
+        students = {}
+        hw_keys = list(data)
+        relevance_weight = LABEL_WEIGHTS["Relevance"]
+        concreteness_weight = LABEL_WEIGHTS["Concreteness"]
+        constructive_weight = LABEL_WEIGHTS["Constructive"]
+        hw_col, src_col, dst_col, rounds_col, quality_col = [], [], [], [], []
+
+        def student_index(name):
+            index = students.get(name)
+            if index is None:
+                index = students[name] = len(students)
+            return index
+
+        for h, hw_key in enumerate(hw_keys):
+            for assignment in data[hw_key]:
+                reviewer = assignment.get('Reviewer', '')
+                author = assignment.get('Author', '')
+                if not reviewer or not author or author == 'NULL' or reviewer == author:
+                    continue
+                valid = 0
+                quality = 0.0
+                for round_entry in assignment.get('Round', []):
+                    feedback = round_entry.get('Feedback', '')
+                    if feedback and feedback.strip():
+                        valid += 1
+                        quality += (relevance_weight * (round_entry.get('Relevance') or 0)
+                                    + concreteness_weight * (round_entry.get('Concreteness') or 0)
+                                    + constructive_weight * (round_entry.get('Constructive') or 0))
+                hw_col.append(h)
+                src_col.append(student_index(reviewer))
+                dst_col.append(student_index(author))
+                rounds_col.append(valid)
+                quality_col.append(quality)
+
+        self.students = list(students)
+        self.hw_keys = hw_keys
+        self.hw = np.asarray(hw_col, dtype=np.int32)
+        self.src = np.asarray(src_col, dtype=np.int32)
+        self.dst = np.asarray(dst_col, dtype=np.int32)
+        self.rounds = np.asarray(rounds_col, dtype=np.float64)
+        self.quality = np.asarray(quality_col, dtype=np.float64)
+
+    def select(self, hw_key: Optional[str] = None):
+        """Boolean edge mask for one HW (all edges for None)."""
+        import numpy as np
+        if hw_key is None:
+            return np.ones(len(self.src), dtype=bool)
+        return self.hw == self.hw_keys.index(hw_key)
+
+
+def _csr(n: int, src, dst, weights):
+    """n x n CSR matrix; duplicate (src, dst) pairs are summed."""
+    from scipy import sparse
+    return sparse.csr_matrix((weights, (src, dst)), shape=(n, n))
+
+
+def pagerank(weights, damping: float = PAGERANK_DAMPING, tol: float = PAGERANK_TOL,
+             max_iter: int = PAGERANK_MAX_ITER):
+    """
+    Weighted PageRank by power iteration on a CSR matrix (row = source).
+
+    Rank mass of nodes without out-edges is spread uniformly.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    n = weights.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    out_weight = np.asarray(weights.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inverse = np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)
+    transition = (sparse.diags(inverse) @ weights).T.tocsr()
+
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        updated = damping * (transition @ rank + rank[dangling].sum() / n) + (1 - damping) / n
+        if np.abs(updated - rank).sum() < tol:
+            rank = updated
+            break
+        rank = updated
+    return rank / rank.sum()
+
+
+def label_propagation(adjacency, max_iter: int = COMMUNITY_MAX_ITER, seed: int = COMMUNITY_SEED):
+    """
+    Community labels by weighted label propagation on a symmetric CSR matrix.
+
+    Each iteration updates a random half of the nodes at once (semi-synchronous
+    updates avoid the two-label oscillation of fully synchronous propagation);
+    a node keeps its label on ties. Communities are numbered largest first.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    n = adjacency.shape[0]
+    labels = np.arange(n)
+    if n == 0:
+        return labels
+    rng = np.random.default_rng(seed)
+    rows = np.arange(n)
+    for _ in range(max_iter):
+        one_hot = sparse.csr_matrix((np.ones(n), (rows, labels)), shape=(n, n))
+        # Neighbour weight per (node, label), plus a small bonus for keeping the current label
+        votes = (adjacency @ one_hot + one_hot * 1e-9).tocsr()
+        best = _row_argmax(votes)
+        isolated = np.diff(adjacency.indptr) == 0
+        best[isolated] = labels[isolated]
+        if (best == labels).all():
+            break
+        labels = np.where(rng.random(n) < 0.5, best, labels)
+
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[inverse]
+
+
+def _row_argmax(matrix):
+    """Column of the largest entry in each row of a CSR matrix with no empty rows."""
+    import numpy as np
+
+    starts = matrix.indptr[:-1]
+    row_max = np.maximum.reduceat(matrix.data, starts)
+    is_max = matrix.data == np.repeat(row_max, np.diff(matrix.indptr))
+    positions = np.where(is_max, np.arange(len(matrix.data)), len(matrix.data))
+    return matrix.indices[np.minimum.reduceat(positions, starts)]
+
+
+def scope_metrics(edges: EdgeList, mask) -> dict:
+    """Metric columns and a summary for the edges selected by `mask`."""
+    import numpy as np
+    from scipy.sparse.csgraph import connected_components
+
+    n = len(edges.students)
+    src, dst = edges.src[mask], edges.dst[mask]
+    rounds, quality = edges.rounds[mask], edges.quality[mask]
+
+    reviews = _csr(n, src, dst, rounds)
+    presence = _csr(n, src, dst, np.ones(len(src)))
+    presence.data[:] = 1.0
+    quality_matrix = _csr(n, src, dst, quality)
+
+    out_degree = np.diff(presence.indptr)
+    in_degree = np.diff(presence.tocsc().indptr)
+    reviews_given = np.asarray(reviews.sum(axis=1)).ravel()
+    reviews_received = np.asarray(reviews.sum(axis=0)).ravel()
+    quality_given = np.asarray(quality_matrix.sum(axis=1)).ravel()
+    quality_received = np.asarray(quality_matrix.sum(axis=0)).ravel()
+
+    mutual = presence.multiply(presence.T).tocsr()
+    mutual_out = np.diff(mutual.indptr)
+
+    # Students absent from this scope get rank 0 rather than a share of the teleport mass
+    active = (out_degree + in_degree) > 0
+    rank = np.zeros(n)
+    if active.any():
+        active_index = np.flatnonzero(active)
+        sub = reviews[active_index][:, active_index]
+        # Assignments without a written round still link reviewer and author
+        sub = sub + presence[active_index][:, active_index] * 1e-3
+        rank[active_index] = pagerank(sub.tocsr())
+
+    symmetric = (presence + presence.T).tocsr()
+    n_components, component = connected_components(symmetric, directed=False)
+    component_size = np.bincount(component, minlength=n_components)[component]
+    community = label_propagation((reviews + reviews.T + symmetric * 1e-3).tocsr())
+
+    # Inactive students form singleton components/communities; mark them -1
+    component = np.where(active, component, -1)
+    community = np.where(active, community, -1)
+    component_size = np.where(active, component_size, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        reciprocity = np.where(out_degree > 0, mutual_out / np.maximum(out_degree, 1), 0.0)
+        mean_given = np.where(reviews_given > 0, quality_given / np.maximum(reviews_given, 1), 0.0)
+        mean_received = np.where(reviews_received > 0, quality_received / np.maximum(reviews_received, 1), 0.0)
+
+    active_components = np.unique(component[active]) if active.any() else np.zeros(0)
+    active_communities = np.unique(community[active]) if active.any() else np.zeros(0)
+    summary = {
+        "students": int(active.sum()),
+        "edges": int(presence.nnz),
+        "reviews": int(reviews_given.sum()),
+        "reciprocity": round(float(mutual.nnz / presence.nnz), 4) if presence.nnz else 0.0,
+        "components": int(len(active_components)),
+        "largest_component": int(component_size.max()) if n else 0,
+        "communities": int(len(active_communities))
+    }
+
+    metrics = {
+        "in_degree": in_degree.tolist(),
+        "out_degree": out_degree.tolist(),
+        "reviews_received": reviews_received.astype(int).tolist(),
+        "reviews_given": reviews_given.astype(int).tolist(),
+        "pagerank": np.round(rank, 6).tolist(),
+        "reciprocity": np.round(reciprocity, 4).tolist(),
+        "quality_given": np.round(mean_given, 4).tolist(),
+        "quality_received": np.round(mean_received, 4).tolist(),
+        "component": component.tolist(),
+        "component_size": component_size.tolist(),
+        "community": community.tolist()
+    }
+    return {"summary": summary, "metrics": metrics}
+
+
+def compute_graph_metrics(data: dict, hw_keys: List[str] = None) -> dict:
+    """Per-student metric table for every HW and across all HWs."""
+    edges = EdgeList(data)
+    scopes = {ALL_SCOPE: scope_metrics(edges, edges.select())}
+    for hw_key in (hw_keys or edges.hw_keys):
+        scopes[hw_key] = scope_metrics(edges, edges.select(hw_key))
+    return {"students": edges.students, "columns": METRIC_COLUMNS, "scopes": scopes}
+
+
+def generate_graph_metrics(result_path: str, output_path: str = None) -> dict:
+    """
+    Compute graph metrics for a result file and write them next to it.
+
+    Returns:
+        dict with statistics
+    """
+    started = time.perf_counter()
+    result_path = Path(result_path)
+    output_path = Path(output_path) if output_path else result_path.parent / GRAPH_METRICS_FILE
+
+    print(f"Reading result file: {result_path}")
+    data = json_codec.load_result(result_path)
+
+    table = compute_graph_metrics(data)
+    print(f"Writing graph metrics: {output_path}")
+    json_codec.dump(table, output_path)
+
+    overall = table["scopes"][ALL_SCOPE]["summary"]
+    stats = {
+        "students": len(table["students"]),
+        "edges": overall["edges"],
+        "reciprocity": overall["reciprocity"],
+        "communities": overall["communities"],
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+    print(f"Graph metrics: {stats}")
+    return stats
+
+
+def student_rows(table: dict, scope: str = ALL_SCOPE) -> List[Dict]:
+    """Convert one scope of the column table into per-student dicts."""
+    if scope not in table["scopes"]:
+        raise KeyError(f"Unknown scope: {scope}")
+    metrics = table["scopes"][scope]["metrics"]
+    return [
+        dict({"student": student}, **{column: metrics[column][i] for column in table["columns"]})
+        for i, student in enumerate(table["students"])
+        if metrics["in_degree"][i] or metrics["out_degree"][i]
+    ]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        generate_graph_metrics(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        print("Usage: python graph_analytics.py <final_result.json> [output.json]")
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Level-of-Detail Clustering for Large Review Graphs
+Aggregates students into a hierarchy of super-nodes so a client only
+receives a bounded number of nodes and can expand clusters on demand.
+
+Hierarchy: the students active in the selected HWs are split recursively.
+Each split uses label-propagation communities (graph_analytics.py), or
+student-ID prefixes (group="prefix", e.g. enrolment year) at the top level.
+When a split yields more than BRANCHING groups, the groups are merged in
+reverse Cuthill-McKee order of the group graph, so neighbouring groups stay
+together. Clusters with at most LEAF_SIZE students expand into students.
+
+Edges between visible units are aggregated with sparse indicator products
+(P^T W P), carrying review counts and mean label quality.
+
+Usage:
+    python graph_clusters.py <final_result.json> [HW1,HW2,...] [expand_id ...]
+"""
+
+import os
+import sys
+import json
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import json_codec
+
+BRANCHING = 12
+LEAF_SIZE = 24
+DEFAULT_MAX_NODES = 200
+MAX_NODES_LIMIT = 2000
+GROUP_MODES = ("community", "prefix")
+DEFAULT_PREFIX_LENGTH = 3
+ROOT_ID = "c"
+MAX_CACHED_HIERARCHIES = 32
+
+
+class Cluster:
+    """A node of the cluster hierarchy."""
+
+    __slots__ = ("id", "members", "children", "depth")
+
+    def __init__(self, cluster_id: str, members, depth: int):
+        self.id = cluster_id
+        self.members = members
+        self.children = None
+        self.depth = depth
+
+
+class ClusterHierarchy:
+    """Cluster tree plus the sparse review matrices it aggregates."""
+
+    def __init__(self, data: dict, hw_keys: Optional[List[str]] = None, group: str = "community",
+                 prefix_length: int = DEFAULT_PREFIX_LENGTH):
+        import numpy as np
+        from graph_analytics import EdgeList, _csr
+
+        if group not in GROUP_MODES:
+            raise ValueError(f"group must be one of: {', '.join(GROUP_MODES)}")
+
+        edges = EdgeList(data)
+        mask = np.zeros(len(edges.src), dtype=bool)
+        for hw_key in (edges.hw_keys if hw_keys is None else hw_keys):
+            if hw_key in edges.hw_keys:
+                mask |= edges.select(hw_key)
+
+        n = len(edges.students)
+        src, dst = edges.src[mask], edges.dst[mask]
+        self.students = edges.students
+        self.reviews = _csr(n, src, dst, edges.rounds[mask])
+        self.quality = _csr(n, src, dst, edges.quality[mask])
+        self.assignments = _csr(n, src, dst, np.ones(len(src)))
+        self.symmetric = (self.assignments + self.assignments.T).tocsr()
+        self.hw = [hw for hw in edges.hw_keys if hw_keys is None or hw in hw_keys]
+        self.all_hw = edges.hw_keys
+        self.group = group
+
+        active = np.flatnonzero(np.diff(self.symmetric.indptr) > 0)
+        self.clusters = {}
+        self.root = self._add(ROOT_ID, active, 0)
+        if group == "prefix":
+            self._split_by_prefix(self.root, prefix_length)
+
+    def _add(self, cluster_id: str, members, depth: int) -> Cluster:
+        cluster = Cluster(cluster_id, members, depth)
+        self.clusters[cluster_id] = cluster
+        return cluster
+
+    def _split_by_prefix(self, cluster: Cluster, prefix_length: int):
+        import numpy as np
+
+        prefixes = np.array([self.students[i][:prefix_length] for i in cluster.members])
+        _, labels = np.unique(prefixes, return_inverse=True)
+        if len(labels) and labels.max() > 0:
+            self._assign_children(cluster, labels)
+        # One shared prefix: children() splits the cluster into communities
+
+    def children(self, cluster: Cluster) -> List[Cluster]:
+        """Child clusters, computed on first use (empty for leaf clusters)."""
+        if cluster.children is None:
+            if len(cluster.members) <= LEAF_SIZE:
+                cluster.children = []
+            else:
+                self._split(cluster)
+        return cluster.children
+
+    def _split(self, cluster: Cluster):
+        import numpy as np
+        from graph_analytics import label_propagation
+
+        members = cluster.members
+        sub = self.symmetric[members][:, members].tocsr()
+        labels = label_propagation(sub)
+        if labels.max() == 0:
+            # One community: fall back to locality-preserving chunks
+            labels = np.arange(len(members))
+        self._assign_children(cluster, labels)
+
+    def _assign_children(self, cluster: Cluster, labels):
+        """Create at most BRANCHING children from per-member group labels."""
+        import numpy as np
+        from scipy import sparse
+        from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+        members = cluster.members
+        n_groups = int(labels.max()) + 1 if len(labels) else 0
+        if n_groups > BRANCHING:
+            # Merge groups: order the group graph by RCM and cut it into
+            # BRANCHING runs of roughly equal student counts
+            indicator = sparse.csr_matrix((np.ones(len(members)), (np.arange(len(members)), labels)),
+                                          shape=(len(members), n_groups))
+            sub = self.symmetric[members][:, members]
+            group_graph = (indicator.T @ sub @ indicator).tocsr()
+            order = reverse_cuthill_mckee(group_graph, symmetric_mode=True)
+            sizes = np.bincount(labels, minlength=n_groups)[order]
+            run = np.minimum((np.cumsum(sizes) - sizes) * BRANCHING // len(members), BRANCHING - 1)
+            merged = np.empty(n_groups, dtype=np.int64)
+            merged[order] = run
+            _, labels = np.unique(merged[labels], return_inverse=True)
+            n_groups = int(labels.max()) + 1
+
+        if n_groups <= 1:
+            cluster.children = []
+            return
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(n_groups + 1))
+        cluster.children = [
+            self._add(f"{cluster.id}.{g}", members[order[bounds[g]:bounds[g + 1]]], cluster.depth + 1)
+            for g in range(n_groups)
+        ]
+
+    def view(self, expand: List[str] = None, level: int = 0, max_nodes: int = DEFAULT_MAX_NODES) -> dict:
+        """
+        Visible units after expanding the root, `level` further levels
+        breadth-first, then the clusters listed in `expand`, as long as the
+        node count stays within max_nodes. Expansions that would exceed it
+        are skipped and the view is marked truncated.
+        """
+        if not 1 <= max_nodes <= MAX_NODES_LIMIT:
+            raise ValueError(f"max_nodes must be between 1 and {MAX_NODES_LIMIT}")
+        visible = [self.root]
+        truncated = False
+
+        def expand_cluster(cluster) -> bool:
+            nonlocal visible
+            children = self.children(cluster)
+            units = children if children else [int(i) for i in cluster.members]
+            if len(visible) - 1 + len(units) > max_nodes:
+                return False
+            position = next(i for i, unit in enumerate(visible) if unit is cluster)
+            visible = visible[:position] + units + visible[position + 1:]
+            return True
+
+        if not expand_cluster(self.root):
+            truncated = True
+        for _ in range(max(level, 0)):
+            for cluster in [u for u in visible if isinstance(u, Cluster)]:
+                if not expand_cluster(cluster):
+                    truncated = True
+        for cluster_id in expand or []:
+            cluster = self.clusters.get(cluster_id)
+            if cluster is None:
+                # Children are created lazily: resolve the path from the root
+                cluster = self._resolve(cluster_id)
+            if cluster is None:
+                raise KeyError(f"Unknown cluster: {cluster_id}")
+            if any(unit is cluster for unit in visible) and not expand_cluster(cluster):
+                truncated = True
+
+        return self._describe(visible, truncated)
+
+    def _resolve(self, cluster_id: str) -> Optional[Cluster]:
+        if not cluster_id.startswith(ROOT_ID):
+            return None
+        cluster = self.root
+        for part in cluster_id.split(".")[1:]:
+            children = self.children(cluster)
+            if not part.isdigit() or int(part) >= len(children):
+                return None
+            cluster = children[int(part)]
+        return cluster
+
+    def _describe(self, visible: list, truncated: bool) -> dict:
+        """Nodes and aggregated edges for the visible units."""
+        import numpy as np
+        from scipy import sparse
+
+        n = len(self.students)
+        unit_of = np.full(n, -1, dtype=np.int64)
+        for u, unit in enumerate(visible):
+            unit_of[unit.members if isinstance(unit, Cluster) else unit] = u
+        covered = np.flatnonzero(unit_of >= 0)
+        indicator = sparse.csr_matrix((np.ones(len(covered)), (covered, unit_of[covered])), shape=(n, len(visible)))
+
+        reviews = (indicator.T @ self.reviews @ indicator).tocsr()
+        quality = (indicator.T @ self.quality @ indicator).tocsr()
+        # Every review pair is also an assignment pair, so the assignment
+        # pattern covers all edges
+        assignments = (indicator.T @ self.assignments @ indicator).tocoo()
+        rows, cols = assignments.row, assignments.col
+        edge_reviews = np.asarray(reviews[rows, cols]).ravel()
+        edge_quality = np.asarray(quality[rows, cols]).ravel()
+
+        given = np.asarray(self.reviews.sum(axis=1)).ravel()
+        quality_given = np.asarray(self.quality.sum(axis=1)).ravel()
+        unit_given = indicator.T @ given
+        unit_quality = indicator.T @ quality_given
+        internal = reviews.diagonal()
+
+        nodes = []
+        for u, unit in enumerate(visible):
+            node = {
+                "reviews_given": int(unit_given[u]),
+                "quality_given": round(float(unit_quality[u] / unit_given[u]), 4) if unit_given[u] else 0.0
+            }
+            if isinstance(unit, Cluster):
+                node.update({
+                    "id": unit.id,
+                    "type": "cluster",
+                    "size": int(len(unit.members)),
+                    "depth": unit.depth,
+                    "internal_reviews": int(internal[u]),
+                    "expandable": True
+                })
+            else:
+                node.update({"id": self.students[unit], "type": "student"})
+            nodes.append(node)
+
+        edges = []
+        for row, col, count, n_reviews, total_quality in zip(rows, cols, assignments.data, edge_reviews, edge_quality):
+            if row == col:
+                continue
+            edges.append({
+                "from": nodes[row]["id"],
+                "to": nodes[col]["id"],
+                "reviews": int(n_reviews),
+                "assignments": int(count),
+                "quality": round(float(total_quality / n_reviews), 4) if n_reviews else 0.0
+            })
+
+        return {
+            "hw": self.hw,
+            "group": self.group,
+            "students": int(len(self.root.members)),
+            "truncated": truncated,
+            "nodes": nodes,
+            "edges": edges
+        }
+
+
+_hierarchies = {}  # (path, HWs, group, prefix length) -> (file version, hierarchy), least recently used first
+_hierarchies_lock = threading.Lock()
+
+
+def get_hierarchy(result_path, hw_keys: Optional[List[str]] = None, group: str = "community",
+                  prefix_length: int = DEFAULT_PREFIX_LENGTH) -> ClusterHierarchy:
+    """
+    Cluster hierarchy for a result file and HW selection, cached until the
+    file changes. The selection is reduced to HWs present in the file, and
+    at most MAX_CACHED_HIERARCHIES hierarchies are kept.
+    """
+    result_path = Path(result_path)
+    st = os.stat(result_path)
+    version = (st.st_mtime_ns, st.st_size)
+    with _hierarchies_lock:
+        known_hw = next((hierarchy.all_hw for key, (cached_version, hierarchy) in _hierarchies.items()
+                         if key[0] == str(result_path) and cached_version == version), None)
+    data = None
+    if known_hw is None:
+        data = json_codec.load_result(result_path)
+        known_hw = list(data)
+    selected = tuple(hw for hw in known_hw if not hw_keys or hw in hw_keys)
+    key = (str(result_path), selected, group, prefix_length if group == "prefix" else None)
+    with _hierarchies_lock:
+        cached = _hierarchies.pop(key, None)
+        if cached is not None and cached[0] == version:
+            _hierarchies[key] = cached
+            return cached[1]
+
+    if data is None:
+        data = json_codec.load_result(result_path)
+    hierarchy = ClusterHierarchy(data, list(selected), group, prefix_length)
+    with _hierarchies_lock:
+        # Drop hierarchies of older versions of this result file
+        for stale in [k for k, v in _hierarchies.items() if k[0] == key[0] and v[0] != version]:
+            del _hierarchies[stale]
+        _hierarchies[key] = (version, hierarchy)
+        while len(_hierarchies) > MAX_CACHED_HIERARCHIES:
+            del _hierarchies[next(iter(_hierarchies))]
+    return hierarchy
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        selected = sys.argv[2].split(',') if len(sys.argv) > 2 and sys.argv[2] else None
+        view = get_hierarchy(sys.argv[1], selected).view(sys.argv[3:])
+        print(json.dumps(view, indent=2, ensure_ascii=False))
+    else:
+        print("Usage: python graph_clusters.py <final_result.json> [HW1,HW2,...] [expand_id ...]")
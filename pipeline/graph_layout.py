@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Server-Side Graph Layout for the Review Network
+Precomputes vis.js node coordinates so graph.html can draw the network with
+physics disabled instead of stabilizing it in the browser.
+
+Layout: spectral initialization (Laplacian eigenvectors) refined by a NumPy
+Fruchterman-Reingold force simulation. Repulsion is exact for up to
+EXACT_REPULSION_MAX_NODES nodes; larger graphs use a Barnes-Hut style grid
+approximation (exact within a node's own cell, cell centroids elsewhere).
+
+The layout depends only on the network topology of the selected HWs (the
+graph mode only recolors nodes), so layouts are cached by a hash of the edge
+list in a directory shared by all users and reused across page loads. The
+directory keeps the MAX_CACHED_LAYOUTS most recently used layouts; older
+ones are deleted and recomputed if asked for again.
+
+Usage:
+    python graph_layout.py <final_result.json> <cache_dir> [HW1,HW2,...]
+"""
+
+import os
+import sys
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import json_codec
+
+LAYOUT_VERSION = 1
+LAYOUT_DIR_NAME = "_layouts"
+LAYOUT_ITERATIONS = 150
+LAYOUT_SEED = 42
+EXACT_REPULSION_MAX_NODES = 500
+NODES_PER_CELL = 16
+MAX_CACHED_LAYOUTS = int(os.environ.get('PIPELINE_LAYOUT_CACHE_FILES', '256'))
+MAX_MEMO_SELECTIONS = 64  # per result file
+
+# vis.js coordinates: roughly NODE_SPACING pixels between neighbouring nodes
+NODE_SPACING = 60
+
+
+def selection_edges(data: dict, hw_keys: List[str]):
+    """
+    Nodes and weighted undirected edges of the reviewer -> author network
+    for the selected HWs (matching processReviewerData in graph_func.js).
+
+    Returns:
+        (nodes, src, dst, weight) with nodes sorted and edges as index arrays
+    """
+    import numpy as np
+
+    pairs = {}
+    names = set()
+    for hw_key in hw_keys:
+        for assignment in data.get(hw_key, []):
+            reviewer = assignment.get('Reviewer', '')
+            author = assignment.get('Author', '')
+            if not reviewer:
+                continue
+            names.add(reviewer)
+            if not author or author == 'NULL' or author == reviewer:
+                continue
+            names.add(author)
+            key = (reviewer, author) if reviewer < author else (author, reviewer)
+            pairs[key] = pairs.get(key, 0) + 1
+
+    nodes = sorted(names)
+    index = {name: i for i, name in enumerate(nodes)}
+    edges = sorted(pairs.items())
+    src = np.asarray([index[a] for (a, _), _ in edges], dtype=np.int64)
+    dst = np.asarray([index[b] for (_, b), _ in edges], dtype=np.int64)
+    weight = np.asarray([w for _, w in edges], dtype=np.float64)
+    return nodes, src, dst, weight
+
+
+def layout_key(nodes: List[str], src, dst, weight) -> str:
+    """Content hash of the topology and layout parameters."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"v{LAYOUT_VERSION}:{LAYOUT_ITERATIONS}:{LAYOUT_SEED}\n".encode())
+    digest.update("\x00".join(nodes).encode('utf-8'))
+    for array in (src, dst, weight):
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def spectral_layout(n: int, src, dst, weight, seed: int = LAYOUT_SEED):
+    """
+    Initial positions from the two smallest non-trivial eigenvectors of the
+    normalized Laplacian; random positions if the solver does not converge.
+    """
+    import numpy as np
+    from scipy import sparse
+    from scipy.sparse.linalg import eigsh, ArpackError
+
+    rng = np.random.default_rng(seed)
+    if n <= 3 or len(src) == 0:
+        return rng.random((n, 2)) - 0.5
+
+    adjacency = sparse.csr_matrix((np.concatenate([weight, weight]),
+                                   (np.concatenate([src, dst]), np.concatenate([dst, src]))), shape=(n, n))
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    inv_sqrt = np.where(degree > 0, 1.0 / np.sqrt(np.maximum(degree, 1e-12)), 0.0)
+    # Largest eigenvectors of I + D^-1/2 A D^-1/2 are the smallest of the normalized Laplacian
+    shifted = sparse.identity(n) + sparse.diags(inv_sqrt) @ adjacency @ sparse.diags(inv_sqrt)
+    try:
+        _, vectors = eigsh(shifted, k=3, which='LA', v0=rng.random(n), maxiter=n * 20, tol=1e-4)
+        positions = vectors[:, :2] * inv_sqrt[:, None]
+    except (ArpackError, ValueError):
+        return rng.random((n, 2)) - 0.5
+    positions -= positions.mean(axis=0)
+    scale = np.abs(positions).max()
+    if not np.isfinite(scale) or scale == 0:
+        return rng.random((n, 2)) - 0.5
+    # Jitter separates nodes the spectral embedding puts on the same point
+    return positions / scale * 0.5 + (rng.random((n, 2)) - 0.5) * 1e-3
+
+
+def _exact_repulsion(positions, k2: float):
+    import numpy as np
+
+    dx = positions[:, 0:1] - positions[None, :, 0]
+    dy = positions[:, 1:2] - positions[None, :, 1]
+    strength = k2 / np.maximum(dx * dx + dy * dy, 1e-9)
+    np.fill_diagonal(strength, 0.0)
+    return np.stack([(dx * strength).sum(axis=1), (dy * strength).sum(axis=1)], axis=1)
+
+
+def _grid_repulsion(positions, k2: float):
+    """
+    Barnes-Hut style approximation: exact repulsion from nodes in the same
+    grid cell, cell centroids (weighted by node count) for every other cell.
+    """
+    import numpy as np
+
+    n = len(positions)
+    side = max(1, int(np.ceil(np.sqrt(n / NODES_PER_CELL))))
+    low = positions.min(axis=0)
+    span = np.maximum(positions.max(axis=0) - low, 1e-9)
+    cell_xy = np.minimum(((positions - low) / span * side).astype(np.int64), side - 1)
+    cell = cell_xy[:, 0] * side + cell_xy[:, 1]
+    n_cells = side * side
+
+    counts = np.bincount(cell, minlength=n_cells).astype(np.float64)
+    occupied = np.flatnonzero(counts)
+    centroids = np.stack([np.bincount(cell, weights=positions[:, d], minlength=n_cells)[occupied]
+                          for d in range(2)], axis=1) / counts[occupied, None]
+    masses = counts[occupied]
+
+    # Far field: every node against every occupied cell except its own
+    dx = positions[:, 0:1] - centroids[None, :, 0]
+    dy = positions[:, 1:2] - centroids[None, :, 1]
+    strength = masses[None, :] * k2 / np.maximum(dx * dx + dy * dy, 1e-9)
+    strength[cell[:, None] == occupied[None, :]] = 0.0
+    force = np.stack([(dx * strength).sum(axis=1), (dy * strength).sum(axis=1)], axis=1)
+
+    # Near field: exact pairs within each cell
+    order = np.argsort(cell, kind='stable')
+    sorted_cells = cell[order]
+    cell_start = np.searchsorted(sorted_cells, np.arange(n_cells))
+    size = counts[cell].astype(np.int64)
+    left = np.repeat(np.arange(n), size)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(size) - size, size)
+    right = order[cell_start[cell[left]] + offsets]
+    keep = left != right
+    left, right = left[keep], right[keep]
+    pair_delta = positions[left] - positions[right]
+    pair_distance2 = np.maximum((pair_delta ** 2).sum(axis=-1), 1e-9)
+    pair_force = pair_delta * (k2 / pair_distance2)[:, None]
+    for d in range(2):
+        force[:, d] += np.bincount(left, weights=pair_force[:, d], minlength=n)
+    return force
+
+
+def force_layout(n: int, src, dst, weight, initial=None, iterations: int = LAYOUT_ITERATIONS,
+                 seed: int = LAYOUT_SEED):
+    """Fruchterman-Reingold refinement in a unit square, fully vectorized per iteration."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    positions = np.array(initial if initial is not None else rng.random((n, 2)) - 0.5, dtype=np.float64)
+    if n <= 1:
+        return positions
+
+    k = 1.0 / np.sqrt(n)
+    k2 = k * k
+    repulsion = _exact_repulsion if n <= EXACT_REPULSION_MAX_NODES else _grid_repulsion
+    edge_weight = weight / weight.max() if len(weight) else weight
+    temperature = 0.1
+
+    for step in range(iterations):
+        force = repulsion(positions, k2)
+
+        delta = positions[src] - positions[dst]
+        distance = np.sqrt(np.maximum((delta ** 2).sum(axis=-1), 1e-12))
+        pull = delta * (distance * edge_weight / k)[:, None]
+        for d in range(2):
+            force[:, d] -= np.bincount(src, weights=pull[:, d], minlength=n)
+            force[:, d] += np.bincount(dst, weights=pull[:, d], minlength=n)
+
+        # Weak gravity keeps disconnected components in view
+        force -= positions * (k * 0.1 * n ** 0.5)
+
+        length = np.sqrt(np.maximum((force ** 2).sum(axis=-1), 1e-12))
+        positions += force / length[:, None] * np.minimum(length, temperature)[:, None]
+        temperature = 0.1 * (1 - (step + 1) / iterations) + 1e-3
+    return positions
+
+
+def compute_layout(nodes: List[str], src, dst, weight) -> dict:
+    """Node id -> [x, y] in vis.js pixel coordinates."""
+    import numpy as np
+
+    n = len(nodes)
+    initial = spectral_layout(n, src, dst, weight)
+    positions = force_layout(n, src, dst, weight, initial)
+    if n:
+        positions -= positions.mean(axis=0)
+        radius = np.abs(positions).max() or 1.0
+        positions *= NODE_SPACING * np.sqrt(n) / 2 / radius
+    return {name: [round(float(x), 1), round(float(y), 1)] for name, (x, y) in zip(nodes, positions)}
+
+
+def normalize_selection(data: dict, hw_keys: Optional[List[str]]) -> List[str]:
+    """Selected HWs that exist in the data, in a canonical order."""
+    if not hw_keys:
+        return list(data)
+    wanted = set(hw_keys)
+    return [hw for hw in data if hw in wanted]
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(key: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _release_lock(key: str):
+    with _locks_guard:
+        _locks.pop(key, None)
+
+
+def prune_layout_cache(cache_dir, keep: int = MAX_CACHED_LAYOUTS) -> int:
+    """Delete all but the `keep` most recently used layout files; returns the number deleted."""
+    files = []
+    for path in Path(cache_dir).glob("*.json"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        files.append((max(st.st_atime, st.st_mtime), path))
+    files.sort(reverse=True)
+    removed = 0
+    for _, path in files[keep:]:
+        try:
+            path.unlink()
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def get_layout_file(data: dict, hw_keys: Optional[List[str]], cache_dir) -> Path:
+    """
+    Return the cached layout file for a HW selection, computing it first if
+    no layout for the same topology exists yet.
+    """
+    cache_dir = Path(cache_dir)
+    selection = normalize_selection(data, hw_keys)
+    nodes, src, dst, weight = selection_edges(data, selection)
+    key = layout_key(nodes, src, dst, weight)
+    path = cache_dir / f"{key}.json"
+    if _touch(path):
+        return path
+
+    # One computation per topology even when several requests ask at once
+    with _lock_for(key):
+        if _touch(path):
+            return path
+        started = time.perf_counter()
+        positions = compute_layout(nodes, src, dst, weight)
+        layout = {
+            "key": key,
+            "hw": selection,
+            "nodes": len(nodes),
+            "edges": int(len(src)),
+            "algorithm": "spectral+fruchterman-reingold" +
+                         ("" if len(nodes) <= EXACT_REPULSION_MAX_NODES else " (grid approximation)"),
+            "seconds": round(time.perf_counter() - started, 3),
+            "positions": positions
+        }
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        json_codec.dump(layout, temp_path)
+        os.replace(temp_path, path)
+    _release_lock(key)
+    prune_layout_cache(cache_dir)
+    return path
+
+
+def _touch(path: Path) -> bool:
+    """Mark a cached layout as used (for pruning); False if it does not exist."""
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+_result_layouts = {}  # result path -> (file version, {selection: layout path})
+_result_layouts_lock = threading.Lock()
+
+
+def layout_for_result(result_path, hw_keys: Optional[List[str]], cache_dir, data: dict = None) -> Path:
+    """
+    Layout file for a HW selection of a result file. The selection -> file
+    mapping is memoized for the current version of the result file, so
+    repeat requests do not re-read it; pass data when it is already loaded.
+    """
+    result_path = Path(result_path)
+    st = os.stat(result_path)
+    version = (st.st_mtime_ns, st.st_size)
+    selection = tuple(sorted(hw_keys or []))
+    with _result_layouts_lock:
+        memo_version, paths = _result_layouts.get(str(result_path), (None, {}))
+        path = paths.get(selection) if memo_version == version else None
+    if path is not None and _touch(path):
+        return path
+
+    if data is None:
+        data = json_codec.load_result(result_path)
+    path = get_layout_file(data, hw_keys, cache_dir)
+    with _result_layouts_lock:
+        memo_version, paths = _result_layouts.get(str(result_path), (None, {}))
+        if memo_version != version or len(paths) >= MAX_MEMO_SELECTIONS:
+            paths = {}
+        paths[selection] = path
+        _result_layouts[str(result_path)] = (version, paths)
+    return path
+
+
+def precompute_layouts(result_path: str, cache_dir) -> dict:
+    """
+    Compute the layouts graph.html opens with: all HWs and each single HW.
+
+    Returns:
+        dict with statistics
+    """
+    started = time.perf_counter()
+    data = json_codec.load_result(result_path)
+    selections = [None] + [[hw] for hw in data]
+    for selection in selections:
+        layout_for_result(result_path, selection, cache_dir, data)
+    stats = {"layouts": len(selections), "seconds": round(time.perf_counter() - started, 3)}
+    print(f"Precomputed graph layouts: {stats}")
+    return stats
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3:
+        result = json_codec.load(sys.argv[1])
+        selected = sys.argv[3].split(',') if len(sys.argv) > 3 else None
+        print(get_layout_file(result, selected, sys.argv[2]))
+    else:
+        print("Usage: python graph_layout.py <final_result.json> <cache_dir> [HW1,HW2,...]")
@@ -2,22 +2,41 @@
 """
 Internationalization (i18n) module for the Pipeline Server.
 Uses python-i18n package to provide multi-language support.
+The python-i18n package is imported and configured on first use, so importing
+this module stays cheap for the server's startup path.
 """
 
-import i18n
-import json
+import threading
 from pathlib import Path
 
+import json_codec
+
 # Configuration
 TRANSLATIONS_DIR = Path(__file__).parent / "translations"
 
+_i18n = None
+_setup_lock = threading.Lock()
+
+
 def setup_i18n(default_locale: str = 'en'):
     """Initialize i18n with translation files."""
+    global _i18n
+    import i18n
     i18n.set('load_path', [str(TRANSLATIONS_DIR)])
     i18n.set('fallback', 'en')
     i18n.set('locale', default_locale)
     i18n.set('file_format', 'json')
     i18n.set('enable_memoization', True)
+    _i18n = i18n
+
+
+def _get_i18n():
+    """Return the configured i18n package, setting it up on first use."""
+    if _i18n is None:
+        with _setup_lock:
+            if _i18n is None:
+                setup_i18n()
+    return _i18n
 
 
 def get_translation(key: str, locale: str = None, **kwargs) -> str:
@@ -31,6 +50,7 @@ def get_translation(key: str, locale: str = None, **kwargs) -> str:
     Returns:
         Translated string
     """
+    i18n = _get_i18n()
     if locale:
         return i18n.t(key, locale=locale, **kwargs)
     return i18n.t(key, **kwargs)
@@ -47,9 +67,7 @@ def get_all_translations(locale: str = 'en') -> dict:
     """
     translation_file = TRANSLATIONS_DIR / f"{locale}.json"
     if translation_file.exists():
-        with open(translation_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data.get(locale, {})
+        return json_codec.load(translation_file).get(locale, {})
     return {}
 
 
@@ -63,16 +81,12 @@ def get_available_locales() -> list:
 
 def set_locale(locale: str):
     """Set the current locale."""
-    i18n.set('locale', locale)
+    _get_i18n().set('locale', locale)
 
 
 def get_current_locale() -> str:
     """Get the current locale."""
-    return i18n.get('locale')
-
-
-# Initialize on import
-setup_i18n()
+    return _get_i18n().get('locale')
 
 
 # Convenience function for templates
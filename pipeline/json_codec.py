@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+JSON Codec for Review Data Pipeline
+One place for every stage and the server to encode and decode JSON.
+
+Uses orjson or msgspec when installed and falls back to the standard library.
+Set PIPELINE_JSON_BACKEND=orjson|msgspec|stdlib to force one. Output is
+compact UTF-8 by default; pass pretty=True for 2-space indented output.
+All backends decode to the same values; orjson and msgspec write NaN and
+Infinity as null (pipeline outputs contain neither), and integers beyond
+64 bits fall back to stdlib.
+
+dump_result() also writes the review document as NDJSON next to it
+(final_result.ndjson): a header line with the HW keys and assignment
+counts, then one assignment per line tagged with its "HW", so readers can
+start on the first assignments before the file is complete.
+
+load_result() decodes final_result.json-shaped documents for read-only
+consumers. With msgspec it validates them against ResultDocument while
+decoding and skips undeclared fields; the values are still plain dicts and
+lists, so callers do not change.
+
+Usage:
+    python json_codec.py bench <output_dir>     # per-stage codec benchmark
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TypedDict
+
+BACKENDS = ("orjson", "msgspec", "stdlib")
+NDJSON_FORMAT = "review-ndjson"
+NDJSON_VERSION = 1
+JSON_BACKEND = os.environ.get('PIPELINE_JSON_BACKEND', 'auto')
+
+
+class RoundEntry(TypedDict, total=False):
+    Round: Any
+    Time: str
+    Timestamp: Optional[int]
+    Feedback: str
+    Relevance: Any
+    Concreteness: Any
+    Constructive: Any
+    DupCluster: str
+
+
+class AssignmentEntry(TypedDict, total=False):
+    Assignment: str
+    Author: str
+    Reviewer: str
+    Round: List[RoundEntry]
+
+
+ResultDocument = Dict[str, List[AssignmentEntry]]
+
+
+class _Stdlib:
+    name = "stdlib"
+
+    @staticmethod
+    def dumps(obj, pretty: bool = False, default: Callable = None) -> bytes:
+        if pretty:
+            text = json.dumps(obj, ensure_ascii=False, indent=2, default=default)
+        else:
+            text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=default)
+        return text.encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode('utf-8-sig')
+        return json.loads(data)
+
+
+class _Orjson:
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+        self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(self, obj, pretty: bool = False, default: Callable = None) -> bytes:
+        option = self.options | (self.orjson.OPT_INDENT_2 if pretty else 0)
+        try:
+            return self.orjson.dumps(obj, default=default, option=option)
+        except TypeError:
+            # e.g. integers beyond 64 bits
+            return _Stdlib.dumps(obj, pretty, default)
+
+    def loads(self, data):
+        try:
+            return self.orjson.loads(data)
+        except self.orjson.JSONDecodeError:
+            # BOM or NaN literals written by other tools
+            return _Stdlib.loads(data)
+
+
+class _Msgspec:
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self.msgspec = msgspec
+        self.decoder = msgspec.json.Decoder()
+        self.result_decoder = msgspec.json.Decoder(ResultDocument)
+
+    def dumps(self, obj, pretty: bool = False, default: Callable = None) -> bytes:
+        try:
+            data = self.msgspec.json.encode(obj, enc_hook=default)
+        except (TypeError, self.msgspec.EncodeError):
+            return _Stdlib.dumps(obj, pretty, default)
+        return self.msgspec.json.format(data, indent=2) if pretty else data
+
+    def loads(self, data):
+        try:
+            return self.decoder.decode(data)
+        except self.msgspec.DecodeError:
+            return _Stdlib.loads(data)
+
+
+def _create(name: str):
+    return {"orjson": _Orjson, "msgspec": _Msgspec, "stdlib": _Stdlib}[name]()
+
+
+def available_backends() -> List[str]:
+    names = []
+    for name in BACKENDS:
+        try:
+            _create(name)
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+def _select(preference: str):
+    if preference != 'auto':
+        if preference not in BACKENDS:
+            raise ValueError(f"PIPELINE_JSON_BACKEND must be one of: auto, {', '.join(BACKENDS)}")
+        return _create(preference)
+    for name in BACKENDS:
+        try:
+            return _create(name)
+        except ImportError:
+            continue
+
+
+_codec = _select(JSON_BACKEND)
+BACKEND = _codec.name
+
+try:
+    _result_codec = _codec if BACKEND == "msgspec" else _Msgspec()
+except ImportError:
+    _result_codec = None
+
+
+def dumps(obj, pretty: bool = False, default: Callable = None) -> bytes:
+    """Encode to UTF-8 JSON bytes (non-ASCII characters are not escaped)."""
+    return _codec.dumps(obj, pretty, default)
+
+
+def loads(data):
+    """Decode JSON from bytes or str."""
+    return _codec.loads(data)
+
+
+def load(path):
+    """Decode a JSON file."""
+    with open(path, 'rb') as f:
+        return _codec.loads(f.read())
+
+
+def dump(obj, path, pretty: bool = False, default: Callable = None) -> int:
+    """Encode obj into a file; returns the number of bytes written."""
+    data = _codec.dumps(obj, pretty, default)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def iter_array(path, chunk_chars: int = 1 << 20):
+    """
+    Elements of a file holding one top-level JSON array, decoded one at a
+    time from a bounded text buffer instead of loading the whole array.
+    """
+    decoder = json.JSONDecoder()
+    whitespace = " \t\r\n"
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        buffer, position, eof = "", 0, False
+
+        def refill():
+            nonlocal buffer, position, eof
+            more = f.read(chunk_chars)
+            eof = not more
+            buffer, position = buffer[position:] + more, 0
+            return not eof
+
+        def next_token():
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position] in whitespace:
+                    position += 1
+                if position < len(buffer) or not refill():
+                    return buffer[position] if position < len(buffer) else ""
+
+        if next_token() != "[":
+            raise ValueError(f"{path} does not contain a JSON array")
+        position += 1
+        expect_value = True
+        while True:
+            token = next_token()
+            if token == "":
+                raise ValueError(f"Unexpected end of {path}")
+            if token == "]":
+                return
+            if not expect_value:
+                if token != ",":
+                    raise ValueError(f"Expected ',' in {path}")
+                position += 1
+                expect_value = True
+                continue
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if refill():
+                    continue
+                raise
+            # A number may continue in the next chunk
+            if end == len(buffer) and not eof and refill():
+                continue
+            position = end
+            expect_value = False
+            yield value
+
+
+def load_result(path) -> dict:
+    """
+    Decode a review document ({HW: [assignment]}) for reading; with
+    msgspec it is validated and fields outside ResultDocument are dropped,
+    so do not write it back.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if _result_codec is not None:
+        try:
+            return _result_codec.result_decoder.decode(data)
+        except _result_codec.msgspec.ValidationError as e:
+            raise ValueError(f"Invalid review document {path}: {e}") from e
+        except _result_codec.msgspec.DecodeError:
+            pass
+    return _codec.loads(data)
+
+
+def ndjson_path(result_path) -> Path:
+    return Path(result_path).with_suffix(".ndjson")
+
+
+def iter_ndjson(data: dict):
+    """NDJSON lines (bytes, newline-terminated) for a review document."""
+    yield _codec.dumps({
+        "format": NDJSON_FORMAT,
+        "version": NDJSON_VERSION,
+        "hw": {hw_key: len(assignments) for hw_key, assignments in data.items()}
+    }) + b"\n"
+    for hw_key, assignments in data.items():
+        for assignment in assignments:
+            yield _codec.dumps(dict({"HW": hw_key}, **assignment)) + b"\n"
+
+
+def read_ndjson(lines) -> dict:
+    """Rebuild the review document from NDJSON lines."""
+    data = {}
+    header = None
+    for line in lines:
+        if not line.strip():
+            continue
+        record = _codec.loads(line)
+        if header is None:
+            header = record
+            if header.get("format") != NDJSON_FORMAT:
+                raise ValueError("Not a review NDJSON file")
+            data = {hw_key: [] for hw_key in header["hw"]}
+            continue
+        hw_key = record.pop("HW")
+        data.setdefault(hw_key, []).append(record)
+    return data
+
+
+def dump_result(data: dict, path, pretty: bool = False) -> int:
+    """
+    Write a review document and its NDJSON variant; the NDJSON file is
+    swapped in atomically so streaming readers never see a partial file.
+    """
+    size = dump(data, path, pretty)
+    _write_ndjson(data, ndjson_path(path))
+    return size
+
+
+def _write_ndjson(data: dict, target: Path):
+    temp_path = target.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_path, 'wb') as f:
+        f.writelines(iter_ndjson(data))
+    os.replace(temp_path, target)
+
+
+def ensure_ndjson(result_path) -> Path:
+    """NDJSON path for a result file, (re)built if missing or older than the JSON."""
+    result_path = Path(result_path)
+    target = ndjson_path(result_path)
+    if not target.exists() or target.stat().st_mtime_ns < result_path.stat().st_mtime_ns:
+        _write_ndjson(load(result_path), target)
+    return target
+
+
+# Stage outputs in a user's output directory, in pipeline order
+BENCH_FILES = [
+    ("step1_convert", "step1_converted.json"),
+    ("step2_organize", "step2_organized.json"),
+    ("step3_inference", "final_result.json"),
+    ("step4_graph", "graph_metrics.json"),
+    ("step4_analysis", "score_review_analysis.json"),
+]
+
+
+def benchmark(output_dir, repeat: int = 5) -> List[dict]:
+    """
+    Decode/encode time and output size of each stage file for every
+    installed backend, against stdlib with indent=2 (the previous format).
+    """
+    rows = []
+    for stage, filename in BENCH_FILES:
+        path = Path(output_dir) / filename
+        if not path.exists() and filename == "score_review_analysis.json":
+            path = Path(output_dir).parent / filename
+        if not path.exists():
+            continue
+        raw = path.read_bytes()
+        obj = json.loads(raw)
+
+        def best(fn):
+            times = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - started)
+            return min(times) * 1000
+
+        baseline_encode = best(lambda: json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8'))
+        baseline_decode = best(lambda: json.loads(raw))
+        baseline_size = len(json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8'))
+        for name in available_backends():
+            codec = _create(name)
+            encoded = codec.dumps(obj)
+            if codec.loads(encoded) != obj:
+                raise ValueError(f"{name} round trip differs for {filename}")
+            encode_ms = best(lambda: codec.dumps(obj))
+            decode_ms = best(lambda: codec.loads(raw))
+            rows.append({
+                "stage": stage,
+                "file": filename,
+                "backend": name,
+                "encode_ms": round(encode_ms, 2),
+                "decode_ms": round(decode_ms, 2),
+                "speedup": round((baseline_encode + baseline_decode) / (encode_ms + decode_ms), 2),
+                "bytes": len(encoded),
+                "size_vs_indented": round(len(encoded) / baseline_size, 3)
+            })
+    return rows
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == 'bench':
+        print(f"Active backend: {BACKEND} (installed: {', '.join(available_backends())})")
+        print(f"{'stage':<16}{'backend':<9}{'encode ms':>10}{'decode ms':>10}{'speedup':>9}{'bytes':>11}{'size':>7}")
+        for row in benchmark(sys.argv[2]):
+            print(f"{row['stage']:<16}{row['backend']:<9}{row['encode_ms']:>10}{row['decode_ms']:>10}"
+                  f"{row['speedup']:>8}x{row['bytes']:>11}{row['size_vs_indented']:>7}")
+    else:
+        print("Usage: python json_codec.py bench <output_dir>")
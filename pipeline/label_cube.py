@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Label-Combination Cube
+Encodes each round's three labels as a 3-bit mask (bit 0 relevance, bit 1
+concreteness, bit 2 constructive) and counts rounds per (HW, reviewer,
+round number, mask). Co-occurrence, conditional-probability and correlation
+matrices of any slice then come from summing cube cells into eight mask
+counts, so they cost O(cells) rather than O(reviews).
+
+Like the label charts, only rounds with non-empty feedback are counted.
+The cube is stored sparsely as label_cube.json next to the result file and
+rebuilt when the result file changes (e.g. after re-thresholding).
+
+Usage:
+    python label_cube.py <final_result.json> [HW1,HW2] [--by hw|reviewer|round]
+"""
+
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import json_codec
+
+LABEL_CUBE_FILE = "label_cube.json"
+LABELS = ["relevance", "concreteness", "constructive"]
+LABEL_FIELDS = ["Relevance", "Concreteness", "Constructive"]
+MASKS = 1 << len(LABELS)
+GROUP_BY = ("hw", "reviewer", "round")
+
+
+def round_mask(round_entry: dict) -> int:
+    mask = 0
+    for bit, field in enumerate(LABEL_FIELDS):
+        if round_entry.get(field) == 1:
+            mask |= 1 << bit
+    return mask
+
+
+class LabelCube:
+    """Dense (HW x reviewer x round x mask) count array with its axis keys."""
+
+    def __init__(self, hw: List[str], reviewers: List[str], rounds: List, counts, source: list = None):
+        self.hw = hw
+        self.reviewers = reviewers
+        self.rounds = rounds
+        self.counts = counts
+        self.source = source
+
+    @classmethod
+    def from_result(cls, data: dict, source: list = None) -> "LabelCube":
+        import numpy as np
+
+        hw_index, reviewer_index, round_index = {}, {}, {}
+        cells = []
+        for hw_key, assignments in data.items():
+            h = hw_index.setdefault(hw_key, len(hw_index))
+            for assignment in assignments:
+                r = reviewer_index.setdefault(assignment.get('Reviewer', ''), len(reviewer_index))
+                for round_entry in assignment.get('Round', []):
+                    feedback = round_entry.get('Feedback', '')
+                    if not feedback or not feedback.strip():
+                        continue
+                    k = round_index.setdefault(round_entry.get('Round'), len(round_index))
+                    cells.append((h, r, k, round_mask(round_entry)))
+
+        shape = (len(hw_index), len(reviewer_index), len(round_index), MASKS)
+        counts = np.zeros(shape, dtype=np.int64)
+        if cells:
+            np.add.at(counts, tuple(np.asarray(cells, dtype=np.int64).T), 1)
+        return cls(list(hw_index), list(reviewer_index), list(round_index), counts, source)
+
+    def to_dict(self) -> dict:
+        """Sparse form: [hw, reviewer, round, mask, count] for non-zero cells."""
+        import numpy as np
+        nonzero = np.argwhere(self.counts)
+        cells = np.column_stack([nonzero, self.counts[tuple(nonzero.T)]]) if len(nonzero) else nonzero
+        return {
+            "labels": LABELS,
+            "hw": self.hw,
+            "reviewers": self.reviewers,
+            "rounds": self.rounds,
+            "cells": cells.tolist(),
+            "source": self.source
+        }
+
+    @classmethod
+    def from_dict(cls, table: dict) -> "LabelCube":
+        import numpy as np
+        counts = np.zeros((len(table["hw"]), len(table["reviewers"]), len(table["rounds"]), MASKS), dtype=np.int64)
+        if table["cells"]:
+            cells = np.asarray(table["cells"], dtype=np.int64)
+            counts[tuple(cells[:, :4].T)] = cells[:, 4]
+        return cls(table["hw"], table["reviewers"], table["rounds"], counts, table.get("source"))
+
+    def _selection(self, axis_keys: list, selected: Optional[list], name: str):
+        if not selected:
+            return slice(None)
+        lookup = {str(key): i for i, key in enumerate(axis_keys)}
+        unknown = [key for key in selected if str(key) not in lookup]
+        if unknown:
+            raise KeyError(f"Unknown {name}: {', '.join(map(str, unknown))}")
+        return [lookup[str(key)] for key in selected]
+
+    def slice(self, hw: Optional[list] = None, reviewers: Optional[list] = None, rounds: Optional[list] = None):
+        """Sub-cube of the selected keys (all keys of an axis when None)."""
+        sub = self.counts[self._selection(self.hw, hw, "HW")]
+        sub = sub[:, self._selection(self.reviewers, reviewers, "reviewer")]
+        return sub[:, :, self._selection(self.rounds, rounds, "round")]
+
+    def query(self, hw: Optional[list] = None, reviewers: Optional[list] = None,
+              rounds: Optional[list] = None, by: Optional[str] = None) -> dict:
+        """Statistics of a slice, or of each key along `by` within it."""
+        sub = self.slice(hw, reviewers, rounds)
+        result = {"labels": LABELS, "selection": {"hw": hw or [], "reviewer": reviewers or [], "round": rounds or []}}
+        result.update(mask_statistics(sub.sum(axis=(0, 1, 2)).tolist()))
+        if by is not None:
+            if by not in GROUP_BY:
+                raise ValueError(f"by must be one of: {', '.join(GROUP_BY)}")
+            axis = GROUP_BY.index(by)
+            keys = {"hw": self.hw, "reviewer": self.reviewers, "round": self.rounds}[by]
+            selected = {"hw": hw, "reviewer": reviewers, "round": rounds}[by]
+            if selected:
+                keys = [keys[i] for i in self._selection(keys, selected, by)]
+            per_key = sub.sum(axis=tuple(a for a in range(3) if a != axis))
+            result["groups"] = {str(key): mask_statistics(masks) for key, masks in zip(keys, per_key.tolist())}
+        return result
+
+
+def mask_statistics(masks: List[int]) -> dict:
+    """Label counts and matrices from the eight mask counts of a slice."""
+    total = sum(masks)
+
+    def count_with(*bits):
+        required = sum(1 << bit for bit in bits)
+        return sum(c for mask, c in enumerate(masks) if mask & required == required)
+
+    n = len(LABELS)
+    single = [count_with(i) for i in range(n)]
+    pair = [[count_with(i, j) for j in range(n)] for i in range(n)]
+
+    def ratio(a, b):
+        return round(a / b, 4) if b else 0
+
+    def phi(i, j):
+        if i == j:
+            return 1.0
+        denominator = ((total * single[i] - single[i] ** 2) * (total * single[j] - single[j] ** 2)) ** 0.5
+        return round((total * pair[i][j] - single[i] * single[j]) / denominator, 4) if denominator else 0
+
+    relevance, concreteness, constructive = range(n)
+    return {
+        "total": total,
+        "masks": list(masks),
+        "labeled": total - masks[0],
+        "single": dict(zip(LABELS, single)),
+        "rates": {label: ratio(count * 100, total) for label, count in zip(LABELS, single)},
+        "pairs": {f"{LABELS[i]}+{LABELS[j]}": pair[i][j] for i in range(n) for j in range(i + 1, n)},
+        "triple": count_with(*range(n)),
+        "cooccurrence": pair,
+        # P(column label | row label)
+        "conditional": [[ratio(pair[i][j], single[i]) for j in range(n)] for i in range(n)],
+        "correlation": [[phi(i, j) for j in range(n)] for i in range(n)],
+        "combined": {
+            "rel→const": ratio(pair[relevance][constructive], single[relevance]),
+            "conc→const": ratio(pair[concreteness][constructive], single[concreteness]),
+            "rel+conc→const": ratio(count_with(relevance, concreteness, constructive),
+                                    pair[relevance][concreteness])
+        }
+    }
+
+
+def _source_version(result_path) -> list:
+    st = os.stat(result_path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def write_label_cube(result_path) -> LabelCube:
+    """Build the cube for a result file and store it next to it."""
+    result_path = Path(result_path)
+    source = _source_version(result_path)
+    cube = LabelCube.from_result(json_codec.load_result(result_path), source)
+    json_codec.dump(cube.to_dict(), result_path.parent / LABEL_CUBE_FILE)
+    print(f"Label cube: {len(cube.hw)} HW x {len(cube.reviewers)} reviewers x {len(cube.rounds)} rounds, "
+          f"{int(cube.counts.sum())} rounds counted")
+    return cube
+
+
+_cubes = {}
+_cubes_lock = threading.Lock()
+
+
+def get_cube(result_path) -> LabelCube:
+    """Cube for a result file, from memory, label_cube.json or a rebuild."""
+    result_path = Path(result_path)
+    source = _source_version(result_path)
+    with _cubes_lock:
+        cached = _cubes.get(str(result_path))
+    if cached is not None and cached.source == source:
+        return cached
+
+    cube = None
+    cube_path = result_path.parent / LABEL_CUBE_FILE
+    if cube_path.exists():
+        stored = LabelCube.from_dict(json_codec.load(cube_path))
+        if stored.source == source:
+            cube = stored
+    if cube is None:
+        cube = write_label_cube(result_path)
+    with _cubes_lock:
+        _cubes[str(result_path)] = cube
+    return cube
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        args = sys.argv[2:]
+        by = None
+        if '--by' in args:
+            position = args.index('--by')
+            by = args[position + 1] if len(args) > position + 1 else "hw"
+            args = args[:position]
+        selected = args[0].split(',') if args and args[0] else None
+        print(json_codec.dumps(get_cube(sys.argv[1]).query(hw=selected, by=by), pretty=True).decode('utf-8'))
+    else:
+        print("Usage: python label_cube.py <final_result.json> [HW1,HW2] [--by hw|reviewer|round]")
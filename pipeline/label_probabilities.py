@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Label Probability Store for Review Data Pipeline
+Persists per-feedback label probabilities from model inference so
+thresholds can be re-applied (and swept) without re-running BERT.
+
+Probabilities are stored as a float16 (n x 3) array in the traversal order
+of final_result.json (HW key, assignment, round), next to the result file.
+float16 keeps about three significant digits, so a probability just below a
+threshold can round onto it. The exact labels of the model run are stored
+as well and are used for every label whose threshold is unchanged, so
+re-thresholding at the run's thresholds reproduces its result exactly.
+
+Usage:
+    python label_probabilities.py rethreshold <output_dir> <relevance> <concreteness> <constructive>
+    python label_probabilities.py sweep <output_dir>
+    python label_probabilities.py check <output_dir>
+"""
+
+import sys
+import json
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import json_codec
+
+LABEL_KEYS = ["relevance", "concreteness", "constructive"]
+LABEL_FIELDS = ["Relevance", "Concreteness", "Constructive"]
+DEFAULT_THRESHOLDS = [0.5, 0.5, 0.7]  # relevance, concreteness, constructiveness
+MAX_LENGTH = 128
+PARITY_SAMPLE = 64  # texts per run checked against function.inference.batch_predict
+
+PROBS_FILE = "label_probabilities.npy"
+PROBS_META_FILE = "label_probabilities.json"
+PROBS_LABELS_FILE = "label_probabilities_labels.npy"
+DEFAULT_SWEEP_GRID = [round(0.1 * i, 1) for i in range(1, 10)]
+
+
+def predict_proba_torch(model, tokenizer, device, texts: List[str], batch_size: int = 32) -> List[List[float]]:
+    """
+    Sigmoid probabilities from the PyTorch model, one [r, c, s] row per text.
+
+    Texts are batched in length order so each batch pads to a similar length.
+    """
+    import torch
+
+    model.eval()
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    probabilities = [None] * len(texts)
+    with torch.no_grad():
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start:start + batch_size]
+            encoded = tokenizer([texts[i] or "" for i in batch_idx], padding=True, truncation=True,
+                                max_length=MAX_LENGTH, return_tensors="pt").to(device)
+            accepted = _forward_parameters(model)
+            outputs = model(**{k: v for k, v in encoded.items() if k in accepted})
+            logits = outputs.logits if hasattr(outputs, 'logits') else outputs
+            for i, row in zip(batch_idx, torch.sigmoid(logits).cpu().tolist()):
+                probabilities[i] = row
+    return probabilities
+
+
+def torch_reference(model, tokenizer, device, thresholds: List[float] = DEFAULT_THRESHOLDS):
+    """Labels from the production function.inference.batch_predict(), as a texts -> label dicts callable."""
+    from function.inference import batch_predict
+    return lambda texts: batch_predict(model, tokenizer, device, texts, thresholds=thresholds, batch_size=32)
+
+
+def label_parity(texts: List[str], predictions: List[dict], reference, sample: int = PARITY_SAMPLE) -> dict:
+    """
+    Compare thresholded probabilities with reference labels on the first
+    `sample` non-empty texts. predict_proba_torch() assumes a sigmoid head
+    and MAX_LENGTH tokens; a mismatch means the model does not fit that.
+    """
+    picked = [i for i, text in enumerate(texts) if text and text.strip()][:sample]
+    expected = reference([texts[i] for i in picked]) if picked else []
+    mismatches = sum(
+        any(bool(ref[key]) != bool(predictions[i][key]) for key in LABEL_KEYS)
+        for i, ref in zip(picked, expected)
+    )
+    return {"samples": len(picked), "mismatches": mismatches}
+
+
+def _forward_parameters(model) -> set:
+    import inspect
+    return set(inspect.signature(model.forward).parameters)
+
+
+def apply_thresholds(probabilities, thresholds: List[float] = DEFAULT_THRESHOLDS) -> List[dict]:
+    """Convert probabilities into batch_predict-style label dicts."""
+    return [
+        {key: bool(p[k] >= thresholds[k]) for k, key in enumerate(LABEL_KEYS)}
+        for p in probabilities
+    ]
+
+
+def iter_round_entries(data: dict):
+    """Rounds of a result document in storage order."""
+    for hw_key in data:
+        for assignment in data[hw_key]:
+            for round_entry in assignment.get('Round', []):
+                yield round_entry
+
+
+def probability_paths(output_dir) -> tuple:
+    output_dir = Path(output_dir)
+    return output_dir / PROBS_FILE, output_dir / PROBS_META_FILE, output_dir / PROBS_LABELS_FILE
+
+
+def save_probabilities(output_path: str, probabilities, thresholds: List[float], model: str) -> Optional[str]:
+    """
+    Store probabilities next to `output_path` (the final result file).
+
+    Returns the array path, or None when numpy is not installed.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        print("Warning: numpy not installed, label probabilities not stored")
+        return None
+
+    probs_path, meta_path, labels_path = probability_paths(Path(output_path).parent)
+    exact = np.asarray(probabilities, dtype=np.float64).reshape(-1, len(LABEL_KEYS))
+    array = exact.astype(np.float16)
+    np.save(probs_path, array)
+    # Same comparison as apply_thresholds(), before float16 rounding
+    np.save(labels_path, (exact >= np.asarray(thresholds, dtype=np.float64)).astype(np.uint8))
+    json_codec.dump({
+        "count": int(array.shape[0]),
+        "labels": LABEL_FIELDS,
+        "thresholds": list(thresholds),
+        "model_thresholds": list(thresholds),
+        "model": model,
+        "result_file": Path(output_path).name,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+    }, meta_path)
+    print(f"Stored label probabilities: {probs_path} ({array.nbytes} bytes)")
+    return str(probs_path)
+
+
+def clear_probabilities(output_path: str):
+    """Remove stored probabilities that no longer match the result file."""
+    for path in probability_paths(Path(output_path).parent):
+        if path.exists():
+            path.unlink()
+
+
+def load_probabilities(output_dir):
+    """Return (array, meta) or raise FileNotFoundError."""
+    import numpy as np
+
+    probs_path, meta_path, _ = probability_paths(output_dir)
+    if not probs_path.exists() or not meta_path.exists():
+        raise FileNotFoundError("No stored label probabilities. Run the pipeline with the ML model first.")
+    meta = json_codec.load(meta_path)
+    return np.load(probs_path), meta
+
+
+def label_matrix(output_dir, probs, meta: dict, thresholds: List[float]):
+    """
+    Boolean (n x 3) labels at `thresholds`. A label whose threshold is the
+    model run's comes from the stored exact labels; other thresholds are
+    compared with the float16 probabilities.
+    """
+    import numpy as np
+
+    positive = probs.astype(np.float64) >= np.asarray(thresholds, dtype=np.float64)
+    _, _, labels_path = probability_paths(output_dir)
+    model_thresholds = meta.get("model_thresholds")
+    if model_thresholds and labels_path.exists():
+        exact = np.load(labels_path)
+        if exact.shape == positive.shape:
+            for k, threshold in enumerate(thresholds):
+                if threshold == model_thresholds[k]:
+                    positive[:, k] = exact[:, k].astype(bool)
+    return positive
+
+
+def _validate_thresholds(thresholds) -> List[float]:
+    values = [float(t) for t in thresholds]
+    if len(values) != len(LABEL_KEYS) or not all(0.0 <= t <= 1.0 for t in values):
+        raise ValueError("thresholds must be three numbers between 0 and 1")
+    return values
+
+
+def rethreshold(output_dir, thresholds: List[float], run_analysis: bool = True) -> dict:
+    """
+    Re-apply thresholds to the stored probabilities, rewrite final_result.json,
+    rebuild the graph metrics (their quality scores come from the labels) and
+    regenerate the score-review analysis.
+
+    Returns:
+        dict with label counts and timing
+    """
+    thresholds = _validate_thresholds(thresholds)
+    started = time.perf_counter()
+    output_dir = Path(output_dir)
+    probs, meta = load_probabilities(output_dir)
+    result_path = output_dir / meta.get("result_file", "final_result.json")
+
+    data = json_codec.load(result_path)
+    round_entries = list(iter_round_entries(data))
+    if len(round_entries) != probs.shape[0]:
+        raise ValueError(f"Stored probabilities ({probs.shape[0]}) do not match {result_path.name} "
+                         f"({len(round_entries)} rounds). Re-run the pipeline.")
+
+    import numpy as np
+    positive = label_matrix(output_dir, probs, meta, thresholds)
+    labels = positive.astype(np.uint8).tolist()
+    for round_entry, row in zip(round_entries, labels):
+        for field, value in zip(LABEL_FIELDS, row):
+            round_entry[field] = value
+
+    json_codec.dump_result(data, result_path)
+
+    meta["thresholds"] = thresholds
+    _, meta_path, _ = probability_paths(output_dir)
+    json_codec.dump(meta, meta_path)
+
+    counts = [int(c) for c in positive.sum(axis=0)]
+    stats = {
+        "total_feedbacks": len(round_entries),
+        "thresholds": thresholds,
+        "label_counts": dict(zip(LABEL_FIELDS, counts)),
+        "relabel_seconds": round(time.perf_counter() - started, 3)
+    }
+
+    from graph_analytics import generate_graph_metrics
+    generate_graph_metrics(str(result_path))
+
+    if run_analysis:
+        from score_review_analysis import generate_analysis_report
+        report = generate_analysis_report(str(result_path))
+        stats["analysis"] = 'error' not in report
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def check_labels(output_dir) -> dict:
+    """
+    Compare the result file's labels with the stored labels at the stored
+    thresholds; re-thresholding at those thresholds must be the identity.
+    """
+    output_dir = Path(output_dir)
+    probs, meta = load_probabilities(output_dir)
+    result_path = output_dir / meta.get("result_file", "final_result.json")
+    round_entries = list(iter_round_entries(json_codec.load(result_path)))
+    if len(round_entries) != probs.shape[0]:
+        raise ValueError(f"Stored probabilities ({probs.shape[0]}) do not match {result_path.name} "
+                         f"({len(round_entries)} rounds). Re-run the pipeline.")
+    positive = label_matrix(output_dir, probs, meta, meta["thresholds"])
+    mismatches = sum(
+        any(int(round_entry.get(field) or 0) != int(value) for field, value in zip(LABEL_FIELDS, row))
+        for round_entry, row in zip(round_entries, positive.tolist())
+    )
+    return {"rounds": len(round_entries), "thresholds": meta["thresholds"], "mismatches": mismatches}
+
+
+def threshold_sweep(output_dir, grid: List[float] = None) -> dict:
+    """
+    Label rates and score correlations across a threshold grid.
+
+    Each label is swept on its own while the other two keep their stored
+    thresholds. Correlations follow calculate_correlations(): per HW, the
+    Pearson r between HW score and the reviewer's rate of that label over
+    non-empty feedback, with 0 for students who gave no reviews.
+    """
+    import numpy as np
+    from score_review_analysis import load_score_data
+
+    grid = [float(g) for g in (grid or DEFAULT_SWEEP_GRID)]
+    if not all(0.0 <= g <= 1.0 for g in grid):
+        raise ValueError("grid thresholds must be between 0 and 1")
+    output_dir = Path(output_dir)
+    probs, meta = load_probabilities(output_dir)
+    result_path = output_dir / meta.get("result_file", "final_result.json")
+    data = json_codec.load(result_path)
+
+    scores = load_score_data()
+    students = list(scores)
+    student_index = {s: i for i, s in enumerate(students)}
+    hw_names = sorted({hw for s in scores.values() for hw in s['hw_scores']})
+    hw_index = {hw: i for i, hw in enumerate(hw_names)}
+
+    # Index the rounds the analysis counts: non-empty feedback from a scored reviewer
+    rows, cells = [], []
+    position = 0
+    for hw_key in data:
+        for assignment in data[hw_key]:
+            reviewer = assignment.get('Reviewer', '')
+            for round_entry in assignment.get('Round', []):
+                feedback = round_entry.get('Feedback', '')
+                if (feedback and feedback.strip() and hw_key in hw_index and reviewer in student_index):
+                    rows.append(position)
+                    cells.append(hw_index[hw_key] * len(students) + student_index[reviewer])
+                position += 1
+    if position != probs.shape[0]:
+        raise ValueError("Stored probabilities do not match the result file. Re-run the pipeline.")
+
+    n_cells = len(hw_names) * len(students)
+    rows = np.asarray(rows, dtype=np.int64)
+    cells = np.asarray(cells, dtype=np.int64)
+    given = np.bincount(cells, minlength=n_cells).reshape(len(hw_names), len(students))
+    hw_scores = np.array([[scores[s]['hw_scores'].get(hw, 0) for s in students] for hw in hw_names], dtype=float)
+
+    def pearson_rows(x, y):
+        x = x - x.mean(axis=1, keepdims=True)
+        y = y - y.mean(axis=1, keepdims=True)
+        denominator = np.sqrt((x * x).sum(axis=1) * (y * y).sum(axis=1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r = np.where(denominator > 0, (x * y).sum(axis=1) / denominator, 0.0)
+        return np.round(r, 4)
+
+    current = [float(t) for t in meta.get("thresholds", DEFAULT_THRESHOLDS)]
+    sweep = {}
+    for k, field in enumerate(LABEL_FIELDS):
+        points = []
+        for threshold in grid:
+            point_thresholds = current[:k] + [threshold] + current[k + 1:]
+            positive = label_matrix(output_dir, probs, meta, point_thresholds)[rows, k]
+            hits = np.bincount(cells, weights=positive, minlength=n_cells).reshape(given.shape)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                rates = np.where(given > 0, hits / np.maximum(given, 1) * 100, 0.0)
+            correlations = pearson_rows(hw_scores, rates)
+            points.append({
+                "threshold": threshold,
+                "label_rate": round(float(positive.mean()) if positive.size else 0.0, 4),
+                "correlation": {hw: float(r) for hw, r in zip(hw_names, correlations)}
+            })
+        sweep[field] = points
+
+    return {
+        "grid": grid,
+        "current_thresholds": meta.get("thresholds"),
+        "feedbacks": int(len(rows)),
+        "students": len(students),
+        "labels": sweep
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 6 and sys.argv[1] == 'rethreshold':
+        print(json.dumps(rethreshold(sys.argv[2], sys.argv[3:6]), indent=2))
+    elif len(sys.argv) >= 3 and sys.argv[1] == 'sweep':
+        print(json.dumps(threshold_sweep(sys.argv[2]), indent=2, ensure_ascii=False))
+    elif len(sys.argv) >= 3 and sys.argv[1] == 'check':
+        print(json.dumps(check_labels(sys.argv[2]), indent=2))
+    else:
+        print("Usage: python label_probabilities.py rethreshold <output_dir> <relevance> <concreteness> <constructive>")
+        print("       python label_probabilities.py sweep <output_dir>")
+        print("       python label_probabilities.py check <output_dir>")
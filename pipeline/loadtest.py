@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+HTTP Load Tester for the Pipeline Server
+Starts server.py against a throwaway data directory, logs in N simulated
+TAs and drives a weighted mix of status polling, result/output downloads,
+score analysis, uploads and pipeline runs. Reports throughput, latency
+percentiles and error rates, and can compare saved reports side by side.
+
+Usage:
+    python loadtest.py --users 20 --duration 30
+    python loadtest.py --users 20 --label baseline --save baseline.json
+    python loadtest.py --users 20 --server-arg=--some-mode --label tuned --save tuned.json
+    python loadtest.py --compare baseline.json tuned.json
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+from collections import defaultdict
+
+PIPELINE_DIR = Path(__file__).parent.absolute()
+DEFAULT_CSV = PIPELINE_DIR / "uploads" / "114-Data_Example.csv"
+
+# Default traffic mix: mostly dashboard polling, occasional heavy operations
+DEFAULT_MIX = "status=50,result=15,output=15,analysis=8,upload=6,run=6"
+
+# Statuses that count as success per operation (a second /run while one is
+# in progress is rejected with 409 by design; any 400 is a real error)
+ACCEPTED_STATUS = {
+    "run": {200, 409},
+}
+
+OUTPUT_FILES = ["final_result.json", "step2_organized.json"]
+
+
+def parse_mix(spec: str) -> dict:
+    """Parse 'status=50,result=15,...' into operation weights."""
+    weights = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operations in mix: {sorted(unknown)}")
+    return weights
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def find_free_port() -> int:
+    """Ask the OS for an unused TCP port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Client:
+    """One simulated user holding its own session cookie."""
+
+    def __init__(self, host: str, port: int, username: str, password: str, timeout: float = 60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.cookie = ''
+
+    def request(self, method: str, path: str, body: bytes = None, headers: dict = None):
+        """Send one request and return (status, body)."""
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            all_headers = {'Cookie': self.cookie} if self.cookie else {}
+            all_headers.update(headers or {})
+            conn.request(method, path, body=body, headers=all_headers)
+            response = conn.getresponse()
+            data = response.read()
+            cookie = response.getheader('Set-Cookie')
+            if cookie and cookie.startswith('session='):
+                self.cookie = cookie.split(';', 1)[0]
+            return response.status, data
+        finally:
+            conn.close()
+
+    def login(self):
+        body = json.dumps({"username": self.username, "password": self.password}).encode('utf-8')
+        status, _ = self.request('POST', '/api/login', body, {'Content-Type': 'application/json'})
+        if status != 200:
+            raise RuntimeError(f"Login failed for {self.username}: HTTP {status}")
+
+    def upload(self, csv_bytes: bytes, filename: str):
+        boundary = uuid.uuid4().hex
+        body = (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: text/csv\r\n\r\n'
+        ).encode('utf-8') + csv_bytes + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        return self.request('POST', '/upload', body, {
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+            'Content-Length': str(len(body))
+        })
+
+    def run_pipeline(self, filename: str):
+        body = json.dumps({"filename": filename, "use_ml": False}).encode('utf-8')
+        return self.request('POST', '/run', body, {'Content-Type': 'application/json'})
+
+    def wait_for_pipeline(self, timeout: float = 300):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            status, data = self.request('GET', '/status')
+            if status == 200:
+                state = json.loads(data)
+                if not state.get('running') and (state.get('step') == 5 or state.get('error')):
+                    return state
+            time.sleep(0.5)
+        raise RuntimeError(f"Pipeline for {self.username} did not finish in {timeout}s")
+
+
+# Operation name -> callable(client, context) returning (status, body)
+OPERATIONS = {
+    "status": lambda c, ctx: c.request('GET', '/status'),
+    "result": lambda c, ctx: c.request('GET', '/result'),
+    "output": lambda c, ctx: c.request('GET', '/output/' + random.choice(OUTPUT_FILES)),
+    "analysis": lambda c, ctx: c.request('GET', '/api/run-analysis'),
+    "upload": lambda c, ctx: c.upload(ctx['csv_bytes'], ctx['filename']),
+    "run": lambda c, ctx: c.run_pipeline(ctx['filename']),
+}
+
+
+class Recorder:
+    """Thread-safe collection of per-operation latencies and failures."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def add(self, op: str, seconds: float, ok: bool, size: int):
+        with self.lock:
+            self.latencies[op].append(seconds)
+            self.bytes[op] += size
+            if not ok:
+                self.errors[op] += 1
+
+    def report(self, elapsed: float) -> dict:
+        operations = {}
+        total = 0
+        total_errors = 0
+        for op in sorted(self.latencies):
+            values = sorted(self.latencies[op])
+            total += len(values)
+            total_errors += self.errors[op]
+            operations[op] = {
+                "requests": len(values),
+                "errors": self.errors[op],
+                "error_rate": round(self.errors[op] / len(values), 4),
+                "rps": round(len(values) / elapsed, 2),
+                "bytes": self.bytes[op],
+                "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2)
+            }
+        all_values = sorted(v for values in self.latencies.values() for v in values)
+        return {
+            "duration_seconds": round(elapsed, 2),
+            "requests": total,
+            "errors": total_errors,
+            "error_rate": round(total_errors / total, 4) if total else 0,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+            "p50_ms": round(percentile(all_values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(all_values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(all_values, 0.99) * 1000, 2),
+            "operations": operations
+        }
+
+
+def prepare_data_dir(data_dir: Path, users: int, password: str) -> list:
+    """Write a users.json with the simulated accounts."""
+    accounts = [{
+        "id": f"loadtest{i}",
+        "username": f"loadtest{i}",
+        "password": password,
+        "name": f"Load Test {i}",
+        "role": "user"
+    } for i in range(users)]
+    with open(data_dir / "users.json", 'w') as f:
+        json.dump({"users": accounts}, f, indent=2)
+    return accounts
+
+
+def start_server(port: int, data_dir: Path, server_args: list, quiet: bool = True) -> subprocess.Popen:
+    """Start server.py in a subprocess and wait until it accepts connections."""
+    env = dict(os.environ, PIPELINE_DATA_DIR=str(data_dir))
+    stdout = subprocess.DEVNULL if quiet else None
+    process = subprocess.Popen(
+        [sys.executable, str(PIPELINE_DIR / "server.py"), str(port)] + list(server_args),
+        cwd=str(PIPELINE_DIR), env=env, stdout=stdout, stderr=stdout
+    )
+    started = time.perf_counter()
+    while time.perf_counter() - started < 60:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            conn.close()
+            print(f"Server ready in {time.perf_counter() - started:.2f}s (pid {process.pid})")
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("Server did not start within 60s")
+
+
+def run_load(args) -> dict:
+    """Run one load test and return its report."""
+    weights = parse_mix(args.mix)
+    ops, op_weights = zip(*weights.items())
+    csv_path = Path(args.csv)
+    context = {"csv_bytes": csv_path.read_bytes(), "filename": csv_path.name}
+
+    data_dir = Path(tempfile.mkdtemp(prefix="pipeline-loadtest-"))
+    process = None
+    try:
+        accounts = prepare_data_dir(data_dir, args.users, args.password)
+        if args.url:
+            host, _, port = args.url.replace('http://', '').rstrip('/').partition(':')
+            port = int(port or 80)
+        else:
+            host, port = '127.0.0.1', args.port or find_free_port()
+            process = start_server(port, data_dir, args.server_arg, quiet=not args.verbose)
+
+        clients = [Client(host, port, a['username'], a['password']) for a in accounts]
+        for client in clients:
+            client.login()
+
+        # Seed every user with one finished run so /result and /output hit real files
+        print(f"Seeding {len(clients)} users with an upload and pipeline run...")
+        for client in clients:
+            client.upload(context['csv_bytes'], context['filename'])
+            client.run_pipeline(context['filename'])
+        for client in clients:
+            client.wait_for_pipeline()
+
+        recorder = Recorder()
+        stop_at = time.perf_counter() + args.duration
+        rng_seed = args.seed
+
+        def worker(index: int, client: Client):
+            rng = random.Random(rng_seed + index)
+            while time.perf_counter() < stop_at:
+                op = rng.choices(ops, weights=op_weights)[0]
+                started = time.perf_counter()
+                try:
+                    status, body = OPERATIONS[op](client, context)
+                    ok = status in ACCEPTED_STATUS.get(op, {200})
+                    size = len(body)
+                except (OSError, http.client.HTTPException):
+                    ok, size = False, 0
+                recorder.add(op, time.perf_counter() - started, ok, size)
+                if args.think_ms:
+                    time.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+
+        print(f"Driving load: {args.users} users for {args.duration}s, mix {args.mix}")
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i, c), daemon=True) for i, c in enumerate(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        report = recorder.report(elapsed)
+        report.update({
+            "label": args.label,
+            "users": args.users,
+            "mix": weights,
+            "server_args": args.server_arg
+        })
+        return report
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        else:
+            print(f"Data directory kept at: {data_dir}")
+
+
+def print_report(report: dict):
+    """Print one report as a table."""
+    print(f"\n{'='*78}")
+    print(f"  {report.get('label') or 'load test'}: {report['users']} users, {report['duration_seconds']}s")
+    print(f"{'='*78}")
+    print(f"  {'operation':<10} {'reqs':>7} {'rps':>8} {'err%':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'maxms':>8}")
+    for op, data in report['operations'].items():
+        print(f"  {op:<10} {data['requests']:>7} {data['rps']:>8} {data['error_rate']*100:>6.2f} "
+              f"{data['p50_ms']:>8} {data['p95_ms']:>8} {data['p99_ms']:>8} {data['max_ms']:>8}")
+    print(f"  {'TOTAL':<10} {report['requests']:>7} {report['throughput_rps']:>8} {report['error_rate']*100:>6.2f} "
+          f"{report['p50_ms']:>8} {report['p95_ms']:>8} {report['p99_ms']:>8}")
+
+
+def print_comparison(reports: list):
+    """Print several saved reports side by side."""
+    labels = [r.get('label') or f"run{i + 1}" for i, r in enumerate(reports)]
+    width = max(12, max(len(label) for label in labels) + 2)
+    print(f"\n  {'metric':<24}" + ''.join(f"{label:>{width}}" for label in labels))
+    rows = [("throughput_rps", None), ("error_rate", None), ("p50_ms", None), ("p95_ms", None), ("p99_ms", None)]
+    ops = sorted({op for r in reports for op in r['operations']})
+    for op in ops:
+        rows += [("rps", op), ("p95_ms", op)]
+    for key, op in rows:
+        name = f"{op}.{key}" if op else key
+        values = []
+        for r in reports:
+            source = r['operations'].get(op, {}) if op else r
+            values.append(source.get(key, '-'))
+        print(f"  {name:<24}" + ''.join(f"{str(v):>{width}}" for v in values))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the pipeline server")
+    parser.add_argument('--users', type=int, default=10, help="Concurrent simulated users")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of load after seeding")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--think-ms', type=float, default=0, help="Mean pause between a user's requests")
+    parser.add_argument('--csv', default=str(DEFAULT_CSV), help="CSV file used for uploads and runs")
+    parser.add_argument('--port', type=int, default=0, help="Port for the spawned server (default: free port)")
+    parser.add_argument('--url', default='', help="Target an already running server (needs loadtest<i> accounts) instead of spawning one")
+    parser.add_argument('--server-arg', action='append', default=[], help="Extra argument passed to server.py")
+    parser.add_argument('--password', default='loadtest123')
+    parser.add_argument('--label', default='', help="Name shown in reports and comparisons")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', default='', help="Write the JSON report to this path")
+    parser.add_argument('--keep-data', action='store_true', help="Keep the temporary data directory")
+    parser.add_argument('--verbose', action='store_true', help="Show server output")
+    parser.add_argument('--compare', nargs='+', metavar='REPORT', help="Compare saved JSON reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path, 'r', encoding='utf-8') as f:
+                reports.append(json.load(f))
+        print_comparison(reports)
+        return
+
+    report = run_load(args)
+    print_report(report)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to: {args.save}")
+
+
+if __name__ == '__main__':
+    main()
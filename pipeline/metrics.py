@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Metrics Module for the Pipeline Server
+Collects per-stage resource usage for pipeline runs and exposes process-wide
+counters, gauges and histograms in the Prometheus text exposition format.
+"""
+
+import os
+import time
+import threading
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+REQUEST_LATENCY_BUCKETS = (0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+# Set PIPELINE_TRACEMALLOC=1 to record Python heap peaks per stage (slows allocation)
+TRACE_MEMORY = os.environ.get('PIPELINE_TRACEMALLOC', '') == '1'
+
+
+def _escape_label_value(value) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    """Render a label set such as {route="/status",method="GET"}."""
+    parts = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_number(value: float) -> str:
+    """Render a sample value, keeping integers free of a trailing .0."""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class holding name, help text and labelled children."""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: List[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: Tuple, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    metric_type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    metric_type = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed upper bounds."""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: List[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def summary(self, quantiles: Tuple[float, ...] = (0.5, 0.95, 0.99)) -> Dict[Tuple, dict]:
+        """
+        Estimate quantiles for every label set.
+
+        Uses linear interpolation inside the bucket holding the target rank,
+        the same estimate Prometheus' histogram_quantile() makes.
+        """
+        with self._lock:
+            items = [(key, list(state['counts']), state['sum'], state['count'])
+                     for key, state in self._values.items()]
+        result = {}
+        for key, counts, total, count in items:
+            estimates = {}
+            for q in quantiles:
+                estimates[q] = self._quantile(q, counts, count)
+            result[key] = {
+                "count": count,
+                "mean": total / count if count else 0.0,
+                "quantiles": estimates
+            }
+        return result
+
+    def _quantile(self, q: float, counts: List[int], count: int) -> float:
+        if count == 0:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = bound
+        # Rank falls in the +Inf bucket; the largest finite bound is the best estimate
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state['counts']))) for key, state in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {state['count']}")
+            plain = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{plain} {_format_number(state['sum'])}")
+            lines.append(f"{self.name}_count{plain} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: List[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: List[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: List[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry and the metrics the server reports
+REGISTRY = MetricsRegistry()
+
+PIPELINE_STAGE_SECONDS = REGISTRY.histogram(
+    'pipeline_stage_duration_seconds', 'Wall time spent in each pipeline stage.',
+    ['stage'], buckets=STAGE_DURATION_BUCKETS)
+PIPELINE_RUNS = REGISTRY.counter(
+    'pipeline_runs_total', 'Pipeline runs by outcome.', ['outcome'])
+PIPELINE_JOBS_RUNNING = REGISTRY.gauge(
+    'pipeline_jobs_running', 'Pipeline jobs currently executing.')
+PIPELINE_QUEUE_DEPTH = REGISTRY.gauge(
+    'pipeline_queue_depth', 'Items waiting in the pipelined-mode stage queues.', ['queue'])
+PIPELINE_QUEUE_WAIT_SECONDS = REGISTRY.counter(
+    'pipeline_queue_wait_seconds_total',
+    'Time stages spent blocked on a stage queue (producer: queue full, consumer: queue empty).',
+    ['queue', 'side'])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Request latency by route.', ['route', 'method'],
+    buckets=REQUEST_LATENCY_BUCKETS)
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'Requests served by route and status.', ['route', 'method', 'status'])
+HTTP_RESPONSE_BYTES = REGISTRY.counter(
+    'http_response_bytes_total', 'Response bytes written by route.', ['route'])
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    'http_requests_in_flight', 'Requests currently being handled.')
+INFERENCE_FEEDBACKS = REGISTRY.counter(
+    'inference_feedbacks_total', 'Feedbacks labelled by the inference stage.', ['model'])
+INFERENCE_THROUGHPUT = REGISTRY.gauge(
+    'inference_feedbacks_per_second', 'Throughput of the most recent inference stage.', ['model'])
+STORAGE_USED_BYTES = REGISTRY.gauge(
+    'storage_used_bytes', 'Bytes held in user upload and output directories at the last sweep.')
+STORAGE_EVICTED_BYTES = REGISTRY.counter(
+    'storage_evicted_bytes_total', 'Bytes evicted to keep users within quota, by tier.', ['tier'])
+
+
+def current_rss_mb() -> Optional[float]:
+    """Current resident set size in MB (Linux only)."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 2)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Process high-water RSS in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in KB on Linux and bytes on macOS
+    divisor = 1024 * 1024 if os.uname().sysname == 'Darwin' else 1024
+    return round(peak / divisor, 2)
+
+
+class StageTimer:
+    """
+    Context manager measuring one pipeline stage.
+
+    Records wall time, CPU time, RSS and (when PIPELINE_TRACEMALLOC=1) the
+    tracemalloc peak, plus the rows the stage consumed and produced.
+
+    Usage:
+        with StageTimer('step1', stages) as timer:
+            stats = convert_csv_to_json(...)
+            timer.rows(stats['total_rows'], stats['converted_records'])
+    """
+
+    def __init__(self, stage: str, sink: Optional[Dict[str, dict]] = None):
+        self.stage = stage
+        self.sink = sink
+        self.metrics = {}
+        self._rows_in = None
+        self._rows_out = None
+
+    def rows(self, rows_in: Optional[int] = None, rows_out: Optional[int] = None):
+        """Record how many rows the stage read and wrote."""
+        self._rows_in = rows_in
+        self._rows_out = rows_out
+
+    def __enter__(self):
+        if TRACE_MEMORY:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+
+        self.metrics = {
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "rss_mb": current_rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+            "tracemalloc_peak_mb": None,
+            "rows_in": self._rows_in,
+            "rows_out": self._rows_out,
+            "ok": exc_type is None
+        }
+        if TRACE_MEMORY and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            self.metrics["tracemalloc_peak_mb"] = round(peak / (1024 * 1024), 2)
+
+        PIPELINE_STAGE_SECONDS.observe(wall, stage=self.stage)
+        if self.sink is not None:
+            self.sink[self.stage] = self.metrics
+        return False
+
+
+def record_inference(model: str, feedbacks: int, seconds: float):
+    """Update inference counters after a labelling stage."""
+    INFERENCE_FEEDBACKS.inc(feedbacks, model=model)
+    if seconds > 0:
+        INFERENCE_THROUGHPUT.set(round(feedbacks / seconds, 2), model=model)
+
+
+# Routes reported individually; anything else is bucketed to keep label cardinality bounded
+_KNOWN_ROUTES = {
+    '/', '/index.html', '/login', '/login.html', '/register', '/register.html',
+    '/graph', '/graph.html', '/correlation', '/score_review_correlation.html',
+    '/status', '/result', '/upload', '/run', '/metrics',
+    '/api/login', '/api/logout', '/api/register', '/api/check-session', '/api/user-info',
+    '/api/translations', '/api/locales', '/api/run-analysis', '/api/correlation-matrix',
+    '/api/reviews/time-range', '/api/reviews/activity', '/api/layout', '/api/graph-clusters',
+    '/api/graph-metrics', '/api/label-cube', '/api/search', '/api/rethreshold', '/api/threshold-sweep',
+    '/api/admin/latency', '/api/admin/startup', '/api/admin/storage', '/api/admin/storage/sweep'
+}
+_PREFIX_ROUTES = ('/static/', '/output/', '/function/')
+
+
+def latency_report() -> Dict[str, dict]:
+    """Per-route request latency percentiles in milliseconds."""
+    report = {}
+    for (route, method), data in sorted(HTTP_REQUEST_SECONDS.summary().items()):
+        quantiles = data["quantiles"]
+        report[f"{method} {route}"] = {
+            "count": data["count"],
+            "mean_ms": round(data["mean"] * 1000, 2),
+            "p50_ms": round(quantiles[0.5] * 1000, 2),
+            "p95_ms": round(quantiles[0.95] * 1000, 2),
+            "p99_ms": round(quantiles[0.99] * 1000, 2)
+        }
+    return report
+
+
+def route_label(path: str) -> str:
+    """
+    Collapse a request path into a bounded route label: paths the server
+    does not route all become "other", whatever status they got.
+    """
+    if path in _KNOWN_ROUTES:
+        return path
+    for prefix in _PREFIX_ROUTES:
+        if path.startswith(prefix):
+            return prefix + '*'
+    return 'other'
@@ -4,72 +4,89 @@ ML Inference Module for Review Data Pipeline
 Adds 3-label predictions (Relevance, Concreteness, Constructive) to review data.
 """
 
-import json
 import sys
 import os
 from pathlib import Path
 
+import json_codec
+
 # Add parent directory to path for model imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
-def run_inference_simple(input_path: str, output_path: str) -> dict:
+def run_inference_simple(input_path: str, output_path: str, languages: list = None) -> dict:
     """
-    Run inference without ML model (placeholder labels).
+    Run inference without ML model (rule-based labels).
     Use this when ML model is not available.
     
+    Rules are read from rules/*.json (see rule_engine.py); pass `languages`
+    to restrict which language rule files are applied.
+    
     Returns:
         dict with inference statistics
     """
-    print(f"Reading input file: {input_path}")
-    with open(input_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    from rule_engine import load_rules
+    from label_probabilities import clear_probabilities
     
-    total_feedbacks = 0
+    print(f"Reading input file: {input_path}")
+    data = json_codec.load(input_path)
     
+    # Gather every round so the rules run once over the whole feedback column
+    round_entries = []
     for hw_key in data:
         assignments = data[hw_key]
         print(f"Processing {hw_key}: {len(assignments)} assignments")
         
         for assignment in assignments:
-            for round_entry in assignment.get('Round', []):
-                feedback = round_entry.get('Feedback', '')
-                
-                # Simple rule-based labeling (placeholder)
-                has_content = len(feedback.strip()) > 5
-                is_specific = len(feedback.strip()) > 20
-                has_suggestion = any(kw in feedback.lower() for kw in ['建議', 'suggestion', '可以', 'should', 'could'])
-                
-                round_entry['Relevance'] = 1 if has_content else 0
-                round_entry['Concreteness'] = 1 if is_specific else 0
-                round_entry['Constructive'] = 1 if has_suggestion else 0
-                
-                total_feedbacks += 1
+            round_entries.extend(assignment.get('Round', []))
+    
+    rule_set = load_rules(languages)
+    print(f"Applying rules from: {', '.join(rule_set.sources)}")
+    labels = rule_set.evaluate([r.get('Feedback', '') or '' for r in round_entries])
+    
+    for label, values in labels.items():
+        for round_entry, value in zip(round_entries, values):
+            round_entry[label] = value
+    
+    total_feedbacks = len(round_entries)
     
     print(f"Writing output file: {output_path}")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    json_codec.dump_result(data, output_path)
+    clear_probabilities(output_path)
     
     stats = {
         "total_feedbacks": total_feedbacks,
         "homework_count": len(data),
-        "model_used": "rule-based"
+        "model_used": "rule-based",
+        "rules": rule_set.sources
     }
     
     print(f"Processed {total_feedbacks} feedbacks")
     return stats
 
 
-def run_inference_with_model(input_path: str, output_path: str, model_path: str) -> dict:
+def run_inference_with_model(input_path: str, output_path: str, model_path: str,
+                             backend: str = "torch", onnx_dir: str = None, threads: int = None) -> dict:
     """
     Run inference with BERT ML model.
     
+    backend is "torch" (PyTorch, default) or "onnx" (int8-quantized ONNX
+    Runtime on CPU, exported from model_path into onnx_dir on first use).
+    
     Returns:
         dict with inference statistics
     """
+    if backend == "onnx":
+        return run_inference_onnx(input_path, output_path, model_path, onnx_dir, threads)
+    
+    from label_probabilities import (
+        predict_proba_torch, apply_thresholds, save_probabilities, clear_probabilities,
+        torch_reference, label_parity, DEFAULT_THRESHOLDS
+    )
+    
     try:
         import torch
-        from function.inference import load_model, batch_predict
+        from function.inference import load_model
     except ImportError as e:
         print(f"Warning: Could not import ML modules: {e}")
         print("Falling back to rule-based inference...")
@@ -87,48 +104,229 @@ def run_inference_with_model(input_path: str, output_path: str, model_path: str)
     print(f"Loading model from: {model_path}")
     model, tokenizer = load_model(model_path, device)
     
-    # Thresholds for label prediction
-    thresholds = [0.5, 0.5, 0.7]  # relevance, concreteness, constructiveness
-    
     print(f"Reading input file: {input_path}")
-    with open(input_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = json_codec.load(input_path)
     
-    total_feedbacks = 0
+    # Whole feedback column at once; probabilities are kept for re-thresholding
+    round_entries = [r for hw_key in data for assignment in data[hw_key] for r in assignment.get('Round', [])]
+    texts = [r.get('Feedback', '') or '' for r in round_entries]
+    probabilities = predict_proba_torch(model, tokenizer, device, texts)
+    predictions = apply_thresholds(probabilities, DEFAULT_THRESHOLDS)
     
-    for hw_key in data:
-        assignments = data[hw_key]
-        print(f"Processing {hw_key}: {len(assignments)} assignments")
-        
-        for assignment in assignments:
-            feedbacks = [r.get('Feedback', '') for r in assignment.get('Round', [])]
-            
-            predictions = batch_predict(
-                model, tokenizer, device, feedbacks,
-                thresholds=thresholds,
-                batch_size=32
-            )
-            
-            for round_entry, pred in zip(assignment.get('Round', []), predictions):
-                round_entry['Relevance'] = int(pred['relevance'])
-                round_entry['Concreteness'] = int(pred['concreteness'])
-                round_entry['Constructive'] = int(pred['constructive'])
-                total_feedbacks += 1
+    # The probabilities must reproduce the production batch_predict() labels
+    reference = torch_reference(model, tokenizer, device, DEFAULT_THRESHOLDS)
+    parity = label_parity(texts, predictions, reference)
+    print(f"Parity with batch_predict: {parity['mismatches']} of {parity['samples']} sampled feedbacks differ")
+    if parity["mismatches"]:
+        print("Warning: using batch_predict labels; probabilities are not stored")
+        predictions = reference(texts)
+        probabilities = None
+    
+    for round_entry, pred in zip(round_entries, predictions):
+        round_entry['Relevance'] = int(pred['relevance'])
+        round_entry['Concreteness'] = int(pred['concreteness'])
+        round_entry['Constructive'] = int(pred['constructive'])
+    total_feedbacks = len(round_entries)
     
     print(f"Writing output file: {output_path}")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    json_codec.dump_result(data, output_path)
+    if probabilities is None:
+        clear_probabilities(output_path)
+    else:
+        save_probabilities(output_path, probabilities, DEFAULT_THRESHOLDS, "bert-3label")
     
     stats = {
         "total_feedbacks": total_feedbacks,
         "homework_count": len(data),
-        "model_used": "bert-3label"
+        "model_used": "bert-3label",
+        "parity": parity
     }
     
     print(f"Processed {total_feedbacks} feedbacks with ML model")
     return stats
 
 
+def run_inference_onnx(input_path: str, output_path: str, model_path: str,
+                       onnx_dir: str = None, threads: int = None) -> dict:
+    """
+    Run inference with the quantized ONNX export of the BERT model.
+    
+    Returns:
+        dict with inference statistics
+    """
+    try:
+        import onnx_inference
+        from label_probabilities import apply_thresholds, save_probabilities, DEFAULT_THRESHOLDS
+    except ImportError as e:
+        print(f"Warning: Could not import ONNX backend: {e}")
+        print("Falling back to PyTorch inference...")
+        return run_inference_with_model(input_path, output_path, model_path)
+    
+    if onnx_dir is None:
+        onnx_dir = os.path.join(os.path.dirname(os.path.abspath(model_path)), "bert_3label_onnx")
+    if threads is None:
+        threads = onnx_inference.DEFAULT_THREADS
+    
+    try:
+        onnx_inference.ensure_export(model_path, onnx_dir)
+        classifier = onnx_inference.get_classifier(onnx_dir, threads)
+    except Exception as e:
+        print(f"Warning: ONNX backend unavailable: {e}")
+        print("Falling back to PyTorch inference...")
+        return run_inference_with_model(input_path, output_path, model_path)
+    print(f"Using ONNX model: {classifier.model_file} (intra-op threads: {threads or 'auto'})")
+    
+    print(f"Reading input file: {input_path}")
+    data = json_codec.load(input_path)
+    
+    # Whole feedback column at once: batches are length-sorted across assignments
+    round_entries = [r for hw_key in data for assignment in data[hw_key] for r in assignment.get('Round', [])]
+    probabilities = classifier.predict_proba([r.get('Feedback', '') or '' for r in round_entries])
+    predictions = apply_thresholds(probabilities)
+    
+    for round_entry, pred in zip(round_entries, predictions):
+        round_entry['Relevance'] = int(pred['relevance'])
+        round_entry['Concreteness'] = int(pred['concreteness'])
+        round_entry['Constructive'] = int(pred['constructive'])
+    
+    print(f"Writing output file: {output_path}")
+    json_codec.dump_result(data, output_path)
+    save_probabilities(output_path, probabilities, DEFAULT_THRESHOLDS, "bert-3label-onnx")
+    
+    stats = {
+        "total_feedbacks": len(round_entries),
+        "homework_count": len(data),
+        "model_used": "bert-3label-onnx"
+    }
+    
+    print(f"Processed {len(round_entries)} feedbacks with ONNX model")
+    return stats
+
+
+class RuleLabeler:
+    """Rule-based labels for batches of feedback (see rule_engine.py)."""
+
+    model_used = "rule-based"
+
+    def __init__(self, languages: list = None):
+        from rule_engine import load_rules
+        self.rule_set = load_rules(languages)
+        print(f"Applying rules from: {', '.join(self.rule_set.sources)}")
+
+    def label(self, texts: list) -> tuple:
+        """(label dict per text, probabilities or None)"""
+        columns = self.rule_set.evaluate(texts)
+        return [dict(zip(columns, values)) for values in zip(*columns.values())], None
+
+    def save(self, output_path: str, probabilities):
+        from label_probabilities import clear_probabilities
+        clear_probabilities(output_path)
+
+    def stats(self) -> dict:
+        return {"model_used": self.model_used, "rules": self.rule_set.sources}
+
+
+class ModelLabeler:
+    """
+    BERT labels for batches of feedback; probabilities are kept for
+    re-thresholding. With a reference labeler (batch_predict) the first
+    batch is checked against it, and on any mismatch the reference labels
+    are used for the whole run and no probabilities are stored.
+    """
+
+    def __init__(self, model_used: str, predict_proba, apply_thresholds, save_probabilities, thresholds: list,
+                 reference=None):
+        self.model_used = model_used
+        self.predict_proba = predict_proba
+        self.apply_thresholds = apply_thresholds
+        self.save_probabilities = save_probabilities
+        self.thresholds = thresholds
+        self.reference = reference
+        self.parity = None
+
+    def label(self, texts: list) -> tuple:
+        if self.parity is not None and self.parity["mismatches"]:
+            return self._fields(self.reference(texts)), None
+        probabilities = self.predict_proba(texts)
+        predictions = self.apply_thresholds(probabilities, self.thresholds)
+        if self.reference is not None and self.parity is None:
+            from label_probabilities import label_parity
+            self.parity = label_parity(texts, predictions, self.reference)
+            print(f"Parity with batch_predict: {self.parity['mismatches']} of "
+                  f"{self.parity['samples']} sampled feedbacks differ")
+            if self.parity["mismatches"]:
+                print("Warning: using batch_predict labels; probabilities are not stored")
+                return self._fields(self.reference(texts)), None
+        return self._fields(predictions), probabilities
+
+    @staticmethod
+    def _fields(predictions: list) -> list:
+        return [{
+            'Relevance': int(pred['relevance']),
+            'Concreteness': int(pred['concreteness']),
+            'Constructive': int(pred['constructive'])
+        } for pred in predictions]
+
+    def save(self, output_path: str, probabilities):
+        if probabilities is None:
+            from label_probabilities import clear_probabilities
+            clear_probabilities(output_path)
+        else:
+            self.save_probabilities(output_path, probabilities, self.thresholds, self.model_used)
+
+    def stats(self) -> dict:
+        stats = {"model_used": self.model_used}
+        if self.parity is not None:
+            stats["parity"] = self.parity
+        return stats
+
+
+def create_labeler(use_ml: bool, model_path: str, backend: str = "torch", onnx_dir: str = None,
+                   languages: list = None, threads: int = None):
+    """
+    Batch labeler for the pipelined steps (stream_pipeline.py), with the
+    same fallbacks as the run_inference_* functions: ONNX -> PyTorch ->
+    rules.
+    """
+    if not use_ml or not os.path.exists(model_path):
+        return RuleLabeler(languages)
+    
+    if backend == "onnx":
+        try:
+            import onnx_inference
+            from label_probabilities import apply_thresholds, save_probabilities, DEFAULT_THRESHOLDS
+            if onnx_dir is None:
+                onnx_dir = os.path.join(os.path.dirname(os.path.abspath(model_path)), "bert_3label_onnx")
+            onnx_inference.ensure_export(model_path, onnx_dir)
+            classifier = onnx_inference.get_classifier(
+                onnx_dir, onnx_inference.DEFAULT_THREADS if threads is None else threads)
+            print(f"Using ONNX model: {classifier.model_file}")
+            return ModelLabeler("bert-3label-onnx", classifier.predict_proba, apply_thresholds,
+                                save_probabilities, DEFAULT_THRESHOLDS)
+        except Exception as e:
+            print(f"Warning: ONNX backend unavailable: {e}")
+            print("Falling back to PyTorch inference...")
+    
+    from label_probabilities import (
+        predict_proba_torch, apply_thresholds, save_probabilities, torch_reference, DEFAULT_THRESHOLDS
+    )
+    try:
+        import torch
+        from function.inference import load_model
+    except ImportError as e:
+        print(f"Warning: Could not import ML modules: {e}")
+        print("Falling back to rule-based inference...")
+        return RuleLabeler(languages)
+    
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
+    print(f"Loading model from: {model_path}")
+    model, tokenizer = load_model(model_path, device)
+    return ModelLabeler("bert-3label", lambda texts: predict_proba_torch(model, tokenizer, device, texts),
+                        apply_thresholds, save_probabilities, DEFAULT_THRESHOLDS,
+                        reference=torch_reference(model, tokenizer, device, DEFAULT_THRESHOLDS))
+
+
 if __name__ == '__main__':
     if len(sys.argv) >= 3:
         model_path = sys.argv[3] if len(sys.argv) > 3 else "../models/bert_3label_finetuned_model"
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Feedback Detection
+Finds copy-pasted and templated feedback ("是，很棒" variations) with MinHash
+signatures and LSH banding, without comparing every pair of feedbacks.
+
+Feedback is case-folded and stripped of whitespace and punctuation, then
+split into character bigrams (shingles). Each feedback gets a 128-value
+MinHash signature. Feedbacks that share all rows of at least one of 32 bands
+are candidates. A candidate joins a cluster only if its signature agrees
+with the bucket's first member on at least SIMILARITY_THRESHOLD of the
+values, which estimates their Jaccard similarity. Clusters are the connected
+components of the accepted pairs. Feedback with fewer than MIN_SHINGLES
+shingles ("是", "Good", "符合標準") is too short to be evidence of copying
+and is not clustered.
+
+Every round in a cluster of two or more gets a "DupCluster" ID in
+final_result.json. duplicate_clusters.json, next to the result file,
+describes each cluster (within one reviewer, across reviewers, across
+rounds) and gives per-reviewer rates. A reviewer's copy_paste_rate counts
+only feedback that the reviewer reused themselves; feedback that matches
+only other reviewers' text is a shared stock phrase (shared_phrase_rate).
+
+Usage:
+    python near_duplicates.py <final_result.json>
+"""
+
+import re
+import sys
+import zlib
+from pathlib import Path
+from typing import List
+
+import json_codec
+
+DUPLICATES_FILE = "duplicate_clusters.json"
+CLUSTER_FIELD = "DupCluster"
+SHINGLE_SIZE = 2
+MIN_SHINGLES = 4               # at least 5 normalized characters
+NUM_PERMUTATIONS = 128
+BANDS = 32                     # 32 bands x 4 rows: candidates from ~0.42 estimated similarity
+SIMILARITY_THRESHOLD = 0.6
+PERMUTATION_CHUNK = 16
+MERSENNE_PRIME = (1 << 61) - 1
+SEED = 1
+SAMPLE_CLUSTERS = 50
+
+NORMALIZE_RE = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    return NORMALIZE_RE.sub('', (text or '').casefold())
+
+
+def shingles(text: str) -> set:
+    """Character shingles of normalized text; short texts are one shingle."""
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signatures(shingle_sets: List[set]):
+    """
+    (n x NUM_PERMUTATIONS) uint64 signatures; every set must be non-empty.
+
+    Permutations are (a * x + b) mod 2^61-1 over 32-bit shingle hashes, with
+    a < 2^31 so the product fits in uint64. They are applied in chunks to all
+    shingles at once and reduced per feedback with minimum.reduceat.
+    """
+    import numpy as np
+
+    lengths = np.fromiter((len(s) for s in shingle_sets), dtype=np.int64, count=len(shingle_sets))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode('utf-8')) for s in shingle_sets for shingle in s),
+        dtype=np.uint64, count=int(lengths.sum())
+    )
+    rng = np.random.default_rng(SEED)
+    a = rng.integers(1, 1 << 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+    signatures = np.empty((len(shingle_sets), NUM_PERMUTATIONS), dtype=np.uint64)
+    for start in range(0, NUM_PERMUTATIONS, PERMUTATION_CHUNK):
+        stop = start + PERMUTATION_CHUNK
+        permuted = (a[start:stop, None] * hashes[None, :] + b[start:stop, None]) % np.uint64(MERSENNE_PRIME)
+        signatures[:, start:stop] = np.minimum.reduceat(permuted, starts, axis=1).T
+    return signatures
+
+
+def lsh_clusters(signatures, threshold: float = SIMILARITY_THRESHOLD):
+    """
+    Component label for each signature row; rows without a verified
+    near-duplicate are components of size one.
+    """
+    import numpy as np
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n = signatures.shape[0]
+    rows = NUM_PERMUTATIONS // BANDS
+    pairs_left, pairs_right = [], []
+    for band in range(BANDS):
+        keys = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * rows))).ravel()
+        _, first, bucket = np.unique(keys, return_index=True, return_inverse=True)
+        leader = first[bucket.ravel()]
+        candidates = np.nonzero(leader != np.arange(n))[0]
+        if not len(candidates):
+            continue
+        agreement = (signatures[candidates] == signatures[leader[candidates]]).mean(axis=1)
+        accepted = candidates[agreement >= threshold]
+        pairs_left.append(accepted)
+        pairs_right.append(leader[accepted])
+
+    if not pairs_left:
+        return np.arange(n)
+    left = np.concatenate(pairs_left)
+    right = np.concatenate(pairs_right)
+    graph = coo_matrix((np.ones(len(left), dtype=np.int8), (left, right)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def find_duplicates(data: dict) -> dict:
+    """
+    Annotate rounds of a review document with CLUSTER_FIELD (in place) and
+    return the cluster and per-reviewer report.
+    """
+    import numpy as np
+
+    entries, sets = [], []
+    reviewers = {}
+    total = 0
+    for hw_key, assignments in data.items():
+        for assignment in assignments:
+            for round_entry in assignment.get('Round', []):
+                round_entry.pop(CLUSTER_FIELD, None)
+                shingle_set = shingles(round_entry.get('Feedback', ''))
+                if not shingle_set:
+                    continue
+                total += 1
+                stats = reviewers.setdefault(assignment.get('Reviewer', ''), {
+                    "feedbacks": 0, "duplicated": 0, "within_reviewer": 0, "cross_reviewer": 0
+                })
+                stats["feedbacks"] += 1
+                if len(shingle_set) >= MIN_SHINGLES:
+                    entries.append((hw_key, assignment, round_entry))
+                    sets.append(shingle_set)
+
+    clusters = []
+    if entries:
+        labels = lsh_clusters(minhash_signatures(sets))
+        counts = np.bincount(labels)
+        members = {}
+        for position, label in enumerate(labels):
+            if counts[label] > 1:
+                members.setdefault(int(label), []).append(position)
+        # Largest clusters first, ties in document order
+        for cluster_number, positions in enumerate(sorted(members.values(), key=lambda p: (-len(p), p[0])), 1):
+            cluster_id = f"D{cluster_number}"
+            for position in positions:
+                entries[position][2][CLUSTER_FIELD] = cluster_id
+            clusters.append((cluster_id, positions))
+
+    cluster_rows = []
+    for cluster_id, positions in clusters:
+        cluster_reviewers = [entries[p][1].get('Reviewer', '') for p in positions]
+        distinct = set(cluster_reviewers)
+        rounds = {(entries[p][0], entries[p][2].get('Round')) for p in positions}
+        for reviewer in cluster_reviewers:
+            stats = reviewers[reviewer]
+            stats["duplicated"] += 1
+            if cluster_reviewers.count(reviewer) > 1:
+                stats["within_reviewer"] += 1
+            if len(distinct) > 1:
+                stats["cross_reviewer"] += 1
+        cluster_rows.append({
+            "id": cluster_id,
+            "size": len(positions),
+            "reviewers": len(distinct),
+            "hw": sorted({entries[p][0] for p in positions}),
+            "within_reviewer": len(distinct) < len(positions),
+            "cross_reviewer": len(distinct) > 1,
+            "cross_round": len(rounds) > 1,
+            "sample": entries[positions[0]][2].get('Feedback', '')
+        })
+
+    for stats in reviewers.values():
+        stats["copy_paste_rate"] = round(stats["within_reviewer"] / stats["feedbacks"] * 100, 2)
+        stats["shared_phrase_rate"] = round(
+            (stats["duplicated"] - stats["within_reviewer"]) / stats["feedbacks"] * 100, 2)
+
+    duplicated = sum(row["size"] for row in cluster_rows)
+    reused = sum(stats["within_reviewer"] for stats in reviewers.values())
+    return {
+        "settings": {
+            "shingle_size": SHINGLE_SIZE,
+            "min_shingles": MIN_SHINGLES,
+            "permutations": NUM_PERMUTATIONS,
+            "bands": BANDS,
+            "similarity_threshold": SIMILARITY_THRESHOLD
+        },
+        "summary": {
+            "feedbacks": total,
+            "clustered_feedbacks": len(entries),
+            "clusters": len(cluster_rows),
+            "duplicated_feedbacks": duplicated,
+            "duplicate_rate": round(duplicated / total * 100, 2) if total else 0,
+            "reused_feedbacks": reused,
+            "reuse_rate": round(reused / total * 100, 2) if total else 0,
+            "within_reviewer_clusters": sum(row["within_reviewer"] for row in cluster_rows),
+            "cross_reviewer_clusters": sum(row["cross_reviewer"] for row in cluster_rows),
+            "cross_round_clusters": sum(row["cross_round"] for row in cluster_rows)
+        },
+        "clusters": cluster_rows,
+        "reviewers": reviewers
+    }
+
+
+def annotate_duplicates(result_path) -> dict:
+    """
+    Run duplicate detection on a result file, rewrite it with DupCluster
+    annotations and store the report as DUPLICATES_FILE next to it.
+    """
+    result_path = Path(result_path)
+    data = json_codec.load(result_path)
+    report = find_duplicates(data)
+    json_codec.dump_result(data, result_path)
+    json_codec.dump(report, result_path.parent / DUPLICATES_FILE)
+    summary = report["summary"]
+    print(f"Near duplicates: {summary['duplicated_feedbacks']} of {summary['feedbacks']} feedbacks "
+          f"in {summary['clusters']} clusters")
+    return report
+
+
+def load_duplicate_summary(result_path) -> dict:
+    """Summary and largest clusters for the analysis report, or None."""
+    path = Path(result_path).parent / DUPLICATES_FILE
+    if not path.exists():
+        return None
+    report = json_codec.load(path)
+    return {
+        "settings": report["settings"],
+        "summary": report["summary"],
+        "largest_clusters": report["clusters"][:SAMPLE_CLUSTERS]
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        report = annotate_duplicates(sys.argv[1])
+        print(json_codec.dumps({"summary": report["summary"], "largest_clusters": report["clusters"][:10]},
+                               pretty=True).decode('utf-8'))
+    else:
+        print("Usage: python near_duplicates.py <final_result.json>")
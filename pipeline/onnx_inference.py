@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime Backend for the 3-Label BERT Classifier
+Exports bert_3label_finetuned_model to ONNX, applies dynamic int8
+quantization and runs it with ONNX Runtime on CPU. Includes a parity check
+against the PyTorch model on a held-out set.
+
+The pipeline exports on first use (ensure_export): under a lock shared by
+threads and worker processes, into a temporary directory that is renamed
+into place once the int8 model is written, so a concurrent run never loads
+a partial export and an interrupted one leaves nothing behind.
+
+Usage:
+    python onnx_inference.py export <model_path> <onnx_dir>
+    python onnx_inference.py parity <model_path> <onnx_dir> <heldout.json|csv> [limit]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are excluded
+    fcntl = None
+
+# Add parent directory to path for model imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec
+from label_probabilities import (
+    LABEL_KEYS, DEFAULT_THRESHOLDS, MAX_LENGTH, predict_proba_torch, apply_thresholds
+)
+
+FP32_FILE = "model_fp32.onnx"
+INT8_FILE = "model_int8.onnx"
+
+# Intra-op threads for ONNX Runtime; 0 lets the runtime choose
+DEFAULT_THREADS = int(os.environ.get('PIPELINE_ONNX_THREADS', '0'))
+
+
+def _logits(outputs):
+    """Accept either a HF ModelOutput or a raw logits tensor."""
+    return outputs.logits if hasattr(outputs, 'logits') else outputs
+
+
+def _forward_kwargs(model, encoded: dict) -> dict:
+    """Keep only the tokenizer outputs the model's forward() accepts."""
+    accepted = inspect.signature(model.forward).parameters
+    return {k: v for k, v in encoded.items() if k in accepted}
+
+
+def export_onnx(model_path: str, onnx_dir: str, quantize: bool = True, opset: int = 14) -> dict:
+    """
+    Export the fine-tuned model to ONNX (sigmoid probabilities as output),
+    then write a dynamically int8-quantized copy next to it.
+
+    Returns:
+        dict with the written file paths and sizes
+    """
+    import torch
+    from function.inference import load_model
+
+    onnx_dir = Path(onnx_dir)
+    onnx_dir.mkdir(parents=True, exist_ok=True)
+    device = torch.device("cpu")
+
+    print(f"Loading model from: {model_path}")
+    model, tokenizer = load_model(model_path, device)
+    model.eval()
+
+    sample = tokenizer(["export sample"], padding=True, truncation=True,
+                       max_length=MAX_LENGTH, return_tensors="pt")
+    inputs = _forward_kwargs(model, dict(sample))
+    input_names = list(inputs)
+
+    class ProbabilityWrapper(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *args):
+            return torch.sigmoid(_logits(self.inner(**dict(zip(input_names, args)))))
+
+    fp32_path = onnx_dir / FP32_FILE
+    print(f"Exporting ONNX graph: {fp32_path}")
+    torch.onnx.export(
+        ProbabilityWrapper(model),
+        tuple(inputs[name] for name in input_names),
+        str(fp32_path),
+        input_names=input_names,
+        output_names=["probabilities"],
+        dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names},
+                      "probabilities": {0: "batch"}},
+        opset_version=opset
+    )
+    tokenizer.save_pretrained(str(onnx_dir))
+
+    result = {"fp32": str(fp32_path), "fp32_mb": round(fp32_path.stat().st_size / 1e6, 1)}
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = onnx_dir / INT8_FILE
+        print(f"Quantizing to int8: {int8_path}")
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+        result.update({"int8": str(int8_path), "int8_mb": round(int8_path.stat().st_size / 1e6, 1)})
+
+    print(f"Export complete: {result}")
+    return result
+
+
+_export_lock = threading.Lock()
+
+
+@contextmanager
+def _export_guard(onnx_dir: Path):
+    """Exclusive lock for exporting into onnx_dir, across threads and worker processes."""
+    with _export_lock:
+        if fcntl is None:
+            yield
+            return
+        onnx_dir.parent.mkdir(parents=True, exist_ok=True)
+        with open(onnx_dir.parent / f".{onnx_dir.name}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def ensure_export(model_path: str, onnx_dir: str) -> bool:
+    """
+    Export and quantize the model into onnx_dir unless its int8 model
+    exists. Returns True if this call exported.
+    """
+    onnx_dir = Path(onnx_dir)
+    if (onnx_dir / INT8_FILE).exists():
+        return False
+    with _export_guard(onnx_dir):
+        if (onnx_dir / INT8_FILE).exists():
+            return False
+        print(f"No ONNX export found, exporting to: {onnx_dir}")
+        tmp_dir = onnx_dir.parent / f".{onnx_dir.name}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        try:
+            export_onnx(model_path, str(tmp_dir))
+            if onnx_dir.exists():
+                # Left by an export that stopped before quantization
+                shutil.rmtree(onnx_dir)
+            tmp_dir.rename(onnx_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return True
+
+
+class OnnxLabelClassifier:
+    """Tokenizer plus ONNX Runtime session producing per-label probabilities."""
+
+    def __init__(self, onnx_dir: str, intra_op_threads: int = DEFAULT_THREADS, quantized: bool = True):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        onnx_dir = Path(onnx_dir)
+        model_file = onnx_dir / (INT8_FILE if quantized and (onnx_dir / INT8_FILE).exists() else FP32_FILE)
+        if quantized and model_file.name != INT8_FILE:
+            print(f"Warning: no int8 model in {onnx_dir}, running the fp32 model")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+
+        self.model_file = model_file
+        self.session = ort.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(onnx_dir))
+
+    def predict_proba(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
+        """
+        Return [relevance, concreteness, constructive] probabilities per text.
+
+        Texts are batched in length order so each batch pads to a similar length.
+        """
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        probabilities = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start:start + batch_size]
+            encoded = self.tokenizer([texts[i] or "" for i in batch_idx], padding=True, truncation=True,
+                                     max_length=MAX_LENGTH, return_tensors="np")
+            feed = {name: encoded[name].astype("int64") for name in self.input_names}
+            output = self.session.run(["probabilities"], feed)[0]
+            for i, row in zip(batch_idx, output.tolist()):
+                probabilities[i] = row
+        return probabilities
+
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def get_classifier(onnx_dir: str, intra_op_threads: int = DEFAULT_THREADS) -> OnnxLabelClassifier:
+    """Return a cached classifier so the session is built once per process."""
+    key = (str(onnx_dir), intra_op_threads)
+    with _classifiers_lock:
+        if key not in _classifiers:
+            _classifiers[key] = OnnxLabelClassifier(onnx_dir, intra_op_threads)
+        return _classifiers[key]
+
+
+def _load_heldout_texts(path: str) -> List[str]:
+    """Read feedback strings from a pipeline JSON file or a CSV with a Feedback column."""
+    if path.endswith('.csv'):
+        import csv
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            column = next((c for c in reader.fieldnames if c and c.strip().lower() == 'feedback'), None)
+            return [row.get(column, '') or '' for row in reader] if column else []
+    data = json_codec.load(path)
+    if isinstance(data, list):
+        return [r.get('Feedback', '') for r in data]
+    return [r.get('Feedback', '') for assignments in data.values()
+            for a in assignments for r in a.get('Round', [])]
+
+
+def parity_check(model_path: str, onnx_dir: str, texts: List[str],
+                 thresholds: List[float] = DEFAULT_THRESHOLDS, threads: int = DEFAULT_THREADS) -> dict:
+    """
+    Compare ONNX predictions with PyTorch on the same texts.
+
+    Reports the max/mean absolute probability difference, per-label agreement
+    with the production batch_predict() labels, and the speedup.
+    """
+    import torch
+    from function.inference import load_model, batch_predict
+
+    texts = [t for t in texts if t and t.strip()]
+    device = torch.device("cpu")
+    model, tokenizer = load_model(model_path, device)
+
+    started = time.perf_counter()
+    reference = batch_predict(model, tokenizer, device, texts, thresholds=thresholds, batch_size=32)
+    torch_seconds = time.perf_counter() - started
+    torch_probs = predict_proba_torch(model, tokenizer, device, texts)
+
+    classifier = OnnxLabelClassifier(onnx_dir, threads)
+    started = time.perf_counter()
+    onnx_probs = classifier.predict_proba(texts)
+    onnx_seconds = time.perf_counter() - started
+    onnx_labels = apply_thresholds(onnx_probs, thresholds)
+
+    diffs = [abs(a - b) for t, o in zip(torch_probs, onnx_probs) for a, b in zip(t, o)]
+    agreement = {
+        key: round(sum(bool(r[key]) == o[key] for r, o in zip(reference, onnx_labels)) / len(texts), 4)
+        for key in LABEL_KEYS
+    } if texts else {}
+
+    report = {
+        "samples": len(texts),
+        "onnx_model": str(classifier.model_file),
+        "max_abs_prob_diff": round(max(diffs), 4) if diffs else 0,
+        "mean_abs_prob_diff": round(sum(diffs) / len(diffs), 5) if diffs else 0,
+        "label_agreement": agreement,
+        "torch_seconds": round(torch_seconds, 2),
+        "onnx_seconds": round(onnx_seconds, 2),
+        "speedup": round(torch_seconds / onnx_seconds, 2) if onnx_seconds else None
+    }
+    return report
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 4 and sys.argv[1] == 'export':
+        export_onnx(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) >= 5 and sys.argv[1] == 'parity':
+        heldout = _load_heldout_texts(sys.argv[4])
+        if len(sys.argv) > 5:
+            heldout = heldout[:int(sys.argv[5])]
+        print(json.dumps(parity_check(sys.argv[2], sys.argv[3], heldout), indent=2))
+    else:
+        print("Usage: python onnx_inference.py export <model_path> <onnx_dir>")
+        print("       python onnx_inference.py parity <model_path> <onnx_dir> <heldout.json|csv> [limit]")
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Rule Engine for Rule-Based Feedback Labeling
+Loads per-language rule files from rules/ and compiles them into one regex
+per label, then labels a whole feedback column in a single pass per label.
+
+Rule file format (rules/<name>.json):
+{
+  "labels": {
+    "Constructive": {
+      "keywords": ["should", "could"],   # any keyword, case-insensitive
+      "patterns": ["\\bwhy not\\b"],      # any regex, case-insensitive
+      "min_length": 6,                   # stripped length >= n
+      "max_length": 500,                 # stripped length <= n
+      "min_punctuation": 1               # punctuation marks >= n
+    }
+  }
+}
+
+Every feature present on a label must hold (keywords and patterns count as
+one feature: any of them matching). Files are merged in order: default.json
+first, then the language files; keyword and pattern lists are unioned and
+numeric features of later files override earlier ones.
+"""
+
+import os
+import re
+import threading
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import json_codec
+
+RULES_DIR = Path(os.environ.get('PIPELINE_RULES_DIR') or Path(__file__).parent / "rules")
+BASE_RULES = "default"
+LABELS = ["Relevance", "Concreteness", "Constructive"]
+
+NUMERIC_FEATURES = ("min_length", "max_length", "min_punctuation")
+PUNCTUATION_RE = re.compile(r"[!-/:-@\[-`{-~　-〿！-／：-＠‘-‟…]")
+
+# Joins the column into one string for keyword scans; cannot occur in a keyword
+_SEPARATOR = "\x00"
+
+
+class CompiledLabelRule:
+    """One label's features compiled for batch evaluation."""
+
+    def __init__(self, name: str, spec: dict):
+        self.name = name
+        self.min_length = spec.get("min_length")
+        self.max_length = spec.get("max_length")
+        self.min_punctuation = spec.get("min_punctuation")
+
+        keywords = [k for k in spec.get("keywords", []) if k]
+        self.keyword_re = None
+        if keywords:
+            # Longest first so the alternation never stops at a shorter prefix
+            alternation = "|".join(re.escape(k) for k in sorted(set(keywords), key=len, reverse=True))
+            self.keyword_re = re.compile(alternation, re.IGNORECASE)
+
+        patterns = [p for p in spec.get("patterns", []) if p]
+        self.pattern_re = re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE) if patterns else None
+
+        self.has_features = any(v is not None for v in (
+            self.min_length, self.max_length, self.min_punctuation, self.keyword_re, self.pattern_re))
+
+
+class RuleSet:
+    """Compiled rules for all labels."""
+
+    def __init__(self, spec: dict, sources: List[str]):
+        self.spec = spec
+        self.sources = sources
+        self.rules = [CompiledLabelRule(label, spec.get(label, {})) for label in LABELS]
+
+    def evaluate(self, texts: List[str]) -> Dict[str, bytearray]:
+        """
+        Label a whole column of feedback strings.
+
+        Returns:
+            dict mapping label name to a bytearray of 0/1 values per text
+        """
+        n = len(texts)
+        lengths = None
+        punctuation = None
+        joined = None
+        starts = None
+
+        results = {}
+        for rule in self.rules:
+            if not rule.has_features:
+                results[rule.name] = bytearray(n)
+                continue
+
+            mask = None
+
+            if rule.min_length is not None or rule.max_length is not None:
+                if lengths is None:
+                    lengths = [len(t.strip()) for t in texts]
+                lo = rule.min_length if rule.min_length is not None else 0
+                hi = rule.max_length if rule.max_length is not None else float("inf")
+                mask = _and(mask, bytearray(lo <= l <= hi for l in lengths))
+
+            if rule.min_punctuation is not None:
+                if punctuation is None:
+                    punctuation = [len(PUNCTUATION_RE.findall(t)) for t in texts]
+                mask = _and(mask, bytearray(p >= rule.min_punctuation for p in punctuation))
+
+            if rule.keyword_re is not None or rule.pattern_re is not None:
+                hits = bytearray(n)
+                if rule.keyword_re is not None:
+                    if joined is None:
+                        joined, starts = _join_column(texts)
+                    _scan_joined(rule.keyword_re, joined, starts, hits)
+                if rule.pattern_re is not None:
+                    search = rule.pattern_re.search
+                    for i, text in enumerate(texts):
+                        if not hits[i] and search(text):
+                            hits[i] = 1
+                mask = _and(mask, hits)
+
+            results[rule.name] = mask
+        return results
+
+    def describe(self) -> dict:
+        return {"sources": self.sources, "labels": self.spec}
+
+
+def _and(mask: Optional[bytearray], other: bytearray) -> bytearray:
+    """Element-wise AND of two 0/1 bytearrays (None means all ones)."""
+    if mask is None:
+        return other
+    n = len(mask)
+    combined = int.from_bytes(mask, 'little') & int.from_bytes(other, 'little')
+    return bytearray(combined.to_bytes(n, 'little'))
+
+
+def _join_column(texts: List[str]):
+    """Concatenate texts with a separator and record where each one starts."""
+    starts = []
+    position = 0
+    for text in texts:
+        starts.append(position)
+        position += len(text) + 1
+    return _SEPARATOR.join(texts), starts
+
+
+def _scan_joined(pattern, joined: str, starts: List[int], hits: bytearray):
+    """Mark every row containing a match, jumping to the next row after each hit."""
+    search = pattern.search
+    position = 0
+    n = len(starts)
+    while True:
+        match = search(joined, position)
+        if match is None:
+            return
+        row = bisect_right(starts, match.start()) - 1
+        hits[row] = 1
+        if row + 1 >= n:
+            return
+        position = starts[row + 1]
+
+
+def merge_rule_specs(specs: List[dict]) -> dict:
+    """Merge rule file contents in order."""
+    merged = {}
+    for spec in specs:
+        for label, features in spec.get("labels", {}).items():
+            target = merged.setdefault(label, {})
+            for key in ("keywords", "patterns"):
+                if key in features:
+                    existing = target.setdefault(key, [])
+                    existing.extend(k for k in features[key] if k not in existing)
+            for key in NUMERIC_FEATURES:
+                if key in features:
+                    target[key] = features[key]
+    return merged
+
+
+def available_rule_languages(rules_dir: Path = RULES_DIR) -> List[str]:
+    """Language rule files present in the rules directory."""
+    return sorted(p.stem for p in Path(rules_dir).glob("*.json") if p.stem != BASE_RULES)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_rules(languages: Optional[List[str]] = None, rules_dir: Path = RULES_DIR) -> RuleSet:
+    """
+    Load and compile rules for the given languages (all languages if None).
+
+    Compiled rule sets are cached and rebuilt when any rule file changes.
+    """
+    rules_dir = Path(rules_dir)
+    available = available_rule_languages(rules_dir)
+    if languages is None:
+        languages = available
+    names = [BASE_RULES] + [lang for lang in languages if lang in available]
+    paths = [rules_dir / f"{name}.json" for name in names]
+    paths = [p for p in paths if p.exists()]
+
+    key = tuple((str(p), p.stat().st_mtime_ns) for p in paths)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    specs = []
+    for path in paths:
+        specs.append(json_codec.load(path))
+    rule_set = RuleSet(merge_rule_specs(specs), [p.stem for p in paths])
+    with _cache_lock:
+        _cache[key] = rule_set
+    return rule_set
@@ -4,18 +4,22 @@ Score-Review Correlation Analysis
 Analyzes the relationship between student homework scores and their peer review activity.
 """
 
-import json
 import csv
 import os
 from pathlib import Path
 from collections import defaultdict
 import statistics
 
+import json_codec
+from near_duplicates import load_duplicate_summary
+
 # Paths
 PIPELINE_DIR = Path(__file__).parent.absolute()
 SCORE_FILE = PIPELINE_DIR / "score" / "Score-By-HW.csv"
-OUTPUT_DIR = PIPELINE_DIR / "output"
+OUTPUT_DIR = Path(os.environ.get('PIPELINE_DATA_DIR') or PIPELINE_DIR) / "output"
 RESULT_FILE = OUTPUT_DIR / "final_result.json"
+# Bootstrap CIs and permutation p-values (correlation_stats.py) for pipeline runs
+CORRELATION_UNCERTAINTY = os.environ.get('PIPELINE_CORRELATION_UNCERTAINTY', '') == '1'
 
 
 def load_score_data(score_file=SCORE_FILE):
@@ -26,7 +30,7 @@ def load_score_data(score_file=SCORE_FILE):
         print(f"Score file not found: {score_file}")
         return scores
     
-    with open(score_file, 'r', encoding='utf-8') as f:
+    with open(score_file, 'r', encoding='utf-8-sig', newline='') as f:
         reader = csv.DictReader(f)
         for row in reader:
             student_id = row.get('ID', '').strip()
@@ -72,8 +76,7 @@ def load_review_data(result_file=None):
         print(f"Review data not found: {result_file}")
         return {}
     
-    with open(result_file, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return json_codec.load(result_file)
 
 
 def analyze_review_activity(review_data):
@@ -86,9 +89,11 @@ def analyze_review_activity(review_data):
         'reviews_received': defaultdict(list),
         'total_given': 0,
         'total_received': 0,
+        'duplicates_given': 0,
         'quality_given': {'relevance': 0, 'concreteness': 0, 'constructive': 0},
         'quality_received': {'relevance': 0, 'concreteness': 0, 'constructive': 0}
     })
+    cluster_counts = defaultdict(lambda: defaultdict(int))  # reviewer -> DupCluster -> feedbacks
     
     for hw_name, assignments in review_data.items():
         if not isinstance(assignments, list):
@@ -120,6 +125,8 @@ def analyze_review_activity(review_data):
                     'constructive': constructive
                 })
                 students[reviewer]['total_given'] += 1
+                if round_data.get('DupCluster'):
+                    cluster_counts[reviewer][round_data['DupCluster']] += 1
                 if relevance == 1:
                     students[reviewer]['quality_given']['relevance'] += 1
                 if concreteness == 1:
@@ -144,6 +151,10 @@ def analyze_review_activity(review_data):
                     if constructive == 1:
                         students[author]['quality_received']['constructive'] += 1
     
+    # Copy-paste means reusing one's own text; a cluster shared only with others is a stock phrase
+    for reviewer, counts in cluster_counts.items():
+        students[reviewer]['duplicates_given'] = sum(n for n in counts.values() if n > 1)
+    
     return dict(students)
 
 
@@ -260,12 +271,14 @@ def calculate_pearson(x, y):
     return round(numerator / denominator, 4)
 
 
-def generate_analysis_report(result_file_path=None):
+def generate_analysis_report(result_file_path=None, uncertainty=None):
     """Generate complete analysis report.
     
     Args:
         result_file_path: Optional path to the final_result.json file.
                          If None, uses default RESULT_FILE path.
+        uncertainty: Add bootstrap CIs and permutation p-values to each HW's
+                     correlations. If None, uses CORRELATION_UNCERTAINTY.
     """
     print("Loading score data...")
     scores = load_score_data()
@@ -288,12 +301,21 @@ def generate_analysis_report(result_file_path=None):
     print("Calculating correlations...")
     correlations = calculate_correlations(scores, review_activity)
     
+    uncertainty_info = None
+    if uncertainty if uncertainty is not None else CORRELATION_UNCERTAINTY:
+        from correlation_stats import correlation_uncertainty, uncertainty_settings
+        print("Computing bootstrap confidence intervals and permutation p-values...")
+        for hw, hw_uncertainty in correlation_uncertainty(correlations).items():
+            correlations[hw]['uncertainty'] = hw_uncertainty
+        uncertainty_info = uncertainty_settings()
+    
     # Prepare summary
     summary = {
         'total_students': len(scores),
         'students_with_reviews': len([s for s in review_activity.values() if s['total_given'] > 0]),
         'total_reviews_given': sum(s['total_given'] for s in review_activity.values()),
         'total_reviews_received': sum(s['total_received'] for s in review_activity.values()),
+        'duplicate_reviews_given': sum(s['duplicates_given'] for s in review_activity.values()),
     }
     
     # Prepare student details
@@ -302,6 +324,7 @@ def generate_analysis_report(result_file_path=None):
         activity = review_activity.get(student_id, {
             'total_given': 0,
             'total_received': 0,
+            'duplicates_given': 0,
             'quality_given': {'relevance': 0, 'concreteness': 0, 'constructive': 0},
             'reviews_given': {},
             'reviews_received': {}
@@ -310,6 +333,7 @@ def generate_analysis_report(result_file_path=None):
         # Calculate overall quality score
         total_given = activity['total_given']
         quality_pct = 0
+        copy_paste_pct = 0
         relevance_pct = 0
         concreteness_pct = 0
         constructive_pct = 0
@@ -319,6 +343,7 @@ def generate_analysis_report(result_file_path=None):
             concreteness_pct = round(activity['quality_given']['concreteness'] / total_given * 100, 2)
             constructive_pct = round(activity['quality_given']['constructive'] / total_given * 100, 2)
             quality_pct = round((relevance_pct + concreteness_pct + constructive_pct) / 3, 2)
+            copy_paste_pct = round(activity['duplicates_given'] / total_given * 100, 2)
         
         # Calculate average HW score
         hw_scores = list(score_data['hw_scores'].values())
@@ -360,6 +385,7 @@ def generate_analysis_report(result_file_path=None):
             'relevance_score': relevance_pct,
             'concreteness_score': concreteness_pct,
             'constructive_score': constructive_pct,
+            'copy_paste_rate': copy_paste_pct,
             'quality_breakdown': activity['quality_given'],
             'hw_activity': hw_quality
         })
@@ -371,15 +397,25 @@ def generate_analysis_report(result_file_path=None):
         'summary': summary,
         'correlations': correlations,
         'students': student_details,
+        'uncertainty': uncertainty_info,
+        'duplicates': load_duplicate_summary(Path(result_file_path or RESULT_FILE)),
         'generated_at': str(Path(__file__).stat().st_mtime)
     }
     
-    # Save report
-    output_file = OUTPUT_DIR / "score_review_analysis.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(report, f, ensure_ascii=False, indent=2)
+    # Save report next to the user's result (served as /output/score_review_analysis.json)
+    output_file = Path(result_file_path or RESULT_FILE).parent / "score_review_analysis.json"
+    json_codec.dump(report, output_file)
     
     print(f"Analysis report saved to: {output_file}")
+    
+    # Student x feature correlation matrix, cached next to the user's result
+    try:
+        from correlation_matrix import generate_correlation_matrix, CORRELATION_MATRIX_FILE
+        result_file = Path(result_file_path or RESULT_FILE)
+        generate_correlation_matrix(scores, review_activity, result_file,
+                                    result_file.parent / CORRELATION_MATRIX_FILE)
+    except Exception as e:
+        print(f"Correlation matrix skipped: {e}")
     return report
 
 
@@ -394,5 +430,8 @@ if __name__ == "__main__":
         print(f"\n=== Correlation by HW ===")
         for hw, data in report['correlations'].items():
             print(f"{hw}: Score-Given r={data['correlation_given']:.3f}, Score-Quality r={data['correlation_quality']:.3f}")
+            if 'uncertainty' in data:
+                quality = data['uncertainty']['quality']
+                print(f"     Score-Quality 95% CI [{quality['ci_low']:.3f}, {quality['ci_high']:.3f}], p={quality['p_value']:.4f}")
     else:
         print(f"Error: {report['error']}")
@@ -3,12 +3,15 @@
 Pipeline Server for Review Graph Visualization
 Provides HTTP API for uploading CSV files, running the pipeline, and serving visualization.
 Multi-user support with login authentication and separate directories per user.
+
+With --workers N the server forks N worker processes that accept on the same
+port (SO_REUSEPORT, or one inherited socket where that is unavailable) and
+keep sessions and pipeline status in a shared SQLite store (shared_state.py).
 """
 
 import os
 import sys
-import json
-import cgi
+import io
 import time
 import shutil
 import traceback
@@ -16,52 +19,68 @@ import socket
 import socketserver
 import uuid
 import hashlib
+import signal
 from pathlib import Path
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 from http.cookies import SimpleCookie
 import threading
+import argparse
+
+# Import timing starts before anything project-specific is loaded
+from startup import IMPORT_TIMER, STARTUP, STARTUP_MODES, preload_modules, start_background_preload
+IMPORT_TIMER.install()
 
-# Pipeline modules
-from csv_converter import convert_csv_to_json
-from data_organizer import organize_json_file
-from ml_inference import run_inference_simple, run_inference_with_model
-from i18n_helper import get_all_translations, get_available_locales
+# Pipeline modules (csv_converter, data_organizer, ml_inference) are imported
+# where they are used so the socket can start listening before they load
+from i18n_helper import get_all_translations, get_available_locales, TRANSLATIONS_DIR
+import metrics
+from metrics import StageTimer
+from access_log import AccessLogWriter
+from asset_cache import ASSET_CACHE
+import json_codec
+from table_reader import input_extension
+from storage_manager import MB, StorageManager, default_quota_bytes
+from shared_state import MemoryState, SQLiteState
 
 # Paths
 PIPELINE_DIR = Path(__file__).parent.absolute()
 PROJECT_ROOT = PIPELINE_DIR.parent
-BASE_UPLOAD_DIR = PIPELINE_DIR / "uploads"
-BASE_OUTPUT_DIR = PIPELINE_DIR / "output"
+# Uploads, outputs and users live in PIPELINE_DATA_DIR when set (e.g. load tests)
+DATA_DIR = Path(os.environ.get('PIPELINE_DATA_DIR') or PIPELINE_DIR).absolute()
+BASE_UPLOAD_DIR = DATA_DIR / "uploads"
+BASE_OUTPUT_DIR = DATA_DIR / "output"
+LAYOUT_CACHE_DIR = BASE_OUTPUT_DIR / "_layouts"  # shared by all users, keyed by topology
 STATIC_DIR = PIPELINE_DIR / "static"
 MODEL_PATH = PROJECT_ROOT / "models" / "bert_3label_finetuned_model"
-USERS_FILE = PIPELINE_DIR / "users.json"
+ONNX_MODEL_DIR = PROJECT_ROOT / "models" / "bert_3label_onnx"
+USERS_FILE = DATA_DIR / "users.json"
+PIPELINED_DEFAULT = os.environ.get('PIPELINE_STREAMING', '') == '1'  # /run default for "pipelined"
+NDJSON_CHUNK_SIZE = 32 * 1024  # bytes per flushed write when streaming /result?format=ndjson
 
-# Ensure directories exist
-BASE_UPLOAD_DIR.mkdir(exist_ok=True)
-BASE_OUTPUT_DIR.mkdir(exist_ok=True)
+STATE_DB = os.environ.get('PIPELINE_STATE_DB') or None  # shared session/status store; default with --workers
+WORKERS = int(os.environ.get('PIPELINE_WORKERS', '1'))
 
-# Session management
-sessions = {}  # token -> user_info
+# Sessions (token -> user) and per-user pipeline status; start_server()
+# switches to a SQLiteState when several processes must share them
+state = MemoryState()
 SESSION_TIMEOUT = 86400  # 24 hours
+SESSION_USER_FIELDS = ('id', 'username', 'name', 'role')  # never the password: sessions may be on disk
 
-# Per-user pipeline status
-user_pipeline_status = {}  # user_id -> status
+# Structured access log (JSON lines); stdout unless PIPELINE_ACCESS_LOG names a file
+access_log = AccessLogWriter(os.environ.get('PIPELINE_ACCESS_LOG') or None)
 
 
 def load_users():
     """Load users from JSON file."""
     if USERS_FILE.exists():
-        with open(USERS_FILE, 'r') as f:
-            data = json.load(f)
-            return data.get('users', [])
+        return json_codec.load(USERS_FILE).get('users', [])
     return []
 
 
 def save_users(users):
     """Save users to JSON file."""
-    with open(USERS_FILE, 'w') as f:
-        json.dump({"users": users}, f, indent=2)
+    json_codec.dump({"users": users}, USERS_FILE, pretty=True)
 
 
 def authenticate_user(username: str, password: str):
@@ -112,44 +131,73 @@ def register_user(name: str, username: str, password: str, email: str = "") -> d
 def create_session(user: dict) -> str:
     """Create a new session for user and return token."""
     token = str(uuid.uuid4())
-    sessions[token] = {
-        "user": user,
-        "created_at": time.time()
-    }
+    session_user = {field: user[field] for field in SESSION_USER_FIELDS if field in user}
+    state.create_session(token, session_user, time.time())
     return token
 
 
 def get_session(token: str):
     """Get session by token, return None if invalid or expired."""
-    if token in sessions:
-        session = sessions[token]
+    session = state.get_session(token)
+    if session:
         if time.time() - session['created_at'] < SESSION_TIMEOUT:
             return session
         else:
-            del sessions[token]
+            state.delete_session(token)
     return None
 
 
+def user_quota_bytes(user_id: str):
+    """Storage quota of a user: quota_mb in users.json (null = unlimited), else PIPELINE_USER_QUOTA_MB."""
+    for user in load_users():
+        if user.get('id') == user_id and 'quota_mb' in user:
+            quota_mb = user['quota_mb']
+            return int(quota_mb * MB) if quota_mb and quota_mb > 0 else None
+    return default_quota_bytes()
+
+
+# Per-user quotas; a background sweeper evicts stale artifacts (see storage_manager.py)
+storage = StorageManager(
+    BASE_UPLOAD_DIR, BASE_OUTPUT_DIR,
+    quota_for=user_quota_bytes,
+    is_busy=lambda user_id: state.is_running(user_id)
+)
+
+
+def ensure_data_dirs():
+    """Create the base upload and output directories."""
+    BASE_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    BASE_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+
 def get_user_dirs(user_id: str):
     """Get or create user-specific directories."""
     upload_dir = BASE_UPLOAD_DIR / user_id
     output_dir = BASE_OUTPUT_DIR / user_id
-    upload_dir.mkdir(exist_ok=True)
-    output_dir.mkdir(exist_ok=True)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
     return upload_dir, output_dir
 
 
 def get_pipeline_status(user_id: str):
-    """Get pipeline status for specific user."""
-    if user_id not in user_pipeline_status:
-        user_pipeline_status[user_id] = {
-            "running": False,
-            "step": 0,
-            "message": "Ready",
-            "error": None,
-            "result": None
-        }
-    return user_pipeline_status[user_id]
+    """Get pipeline status for specific user (updates are saved to the shared store)."""
+    return state.status(user_id)
+
+
+class CountingWriter:
+    """File-like wrapper around the socket writer that counts bytes sent."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_written = 0
+
+    def write(self, data):
+        written = self.raw.write(data)
+        self.bytes_written += len(data)
+        return written
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
 
 
 class PipelineHandler(SimpleHTTPRequestHandler):
@@ -157,6 +205,55 @@ class PipelineHandler(SimpleHTTPRequestHandler):
     
     timeout = 30
     
+    def setup(self):
+        """Wrap the output stream so response bytes can be counted."""
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+    
+    def handle_one_request(self):
+        """Handle a single request and record its latency, status and size."""
+        self._response_status = None
+        self._request_user = None  # filled in by get_current_user() during routing
+        self._user_resolved = False
+        self.wfile.bytes_written = 0
+        started = time.perf_counter()
+        metrics.HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            super().handle_one_request()
+        finally:
+            metrics.HTTP_REQUESTS_IN_FLIGHT.dec()
+            if self._response_status is not None:
+                STARTUP.mark_first_response()
+                self.record_request_metrics(time.perf_counter() - started)
+    
+    def send_response(self, code, message=None):
+        """Remember the status code for request metrics."""
+        self._response_status = code
+        super().send_response(code, message)
+    
+    def record_request_metrics(self, elapsed: float):
+        """Update per-route counters and queue the access log record."""
+        path = urlparse(getattr(self, 'path', '')).path
+        # Unrouted paths all share one label so scanners cannot inflate cardinality
+        route = metrics.route_label(path)
+        method = self.command or '-'
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, route=route, method=method)
+        metrics.HTTP_REQUESTS.inc(route=route, method=method, status=self._response_status)
+        metrics.HTTP_RESPONSE_BYTES.inc(self.wfile.bytes_written, route=route)
+        
+        user = self._request_user
+        access_log.log({
+            "ts": round(time.time(), 3),
+            "client": self.client_address[0] if self.client_address else None,
+            "user": user['username'] if user else None,
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": self._response_status,
+            "bytes": self.wfile.bytes_written,
+            "latency_ms": round(elapsed * 1000, 3)
+        })
+    
     def handle(self):
         """Handle with timeout protection."""
         try:
@@ -178,13 +275,29 @@ class PipelineHandler(SimpleHTTPRequestHandler):
         return None
     
     def get_current_user(self):
-        """Get current logged-in user from session."""
+        """Get current logged-in user from session (resolved once per request)."""
+        if getattr(self, '_user_resolved', False):
+            return self._request_user
+        user = None
         token = self.get_session_token()
         if token:
             session = get_session(token)
             if session:
-                return session['user']
-        return None
+                user = session['user']
+        self._request_user = user
+        self._user_resolved = True
+        return user
+    
+    def require_admin(self):
+        """Return the current user if they are an admin, otherwise send an error."""
+        user = self.get_current_user()
+        if not user:
+            self.send_json_response({"error": "Not authenticated"}, 401)
+            return None
+        if user.get('role') != 'admin':
+            self.send_json_response({"error": "Admin access required"}, 403)
+            return None
+        return user
     
     def require_auth(self):
         """Check if user is authenticated, redirect to login if not."""
@@ -202,7 +315,7 @@ class PipelineHandler(SimpleHTTPRequestHandler):
         self.send_header('Content-type', 'application/json; charset=utf-8')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.wfile.write(json_codec.dumps(data))
     
     def do_GET(self):
         """Handle GET requests."""
@@ -236,6 +349,11 @@ class PipelineHandler(SimpleHTTPRequestHandler):
             self.send_json_response({"locales": get_available_locales()})
             return
         
+        # Prometheus scrape endpoint (no auth required)
+        if path == '/metrics':
+            self.serve_metrics()
+            return
+        
         # Static files - serve without auth (needed for login/register pages)
         if path.startswith('/static/'):
             self.serve_static_file(path[8:])
@@ -262,13 +380,39 @@ class PipelineHandler(SimpleHTTPRequestHandler):
         elif path == '/correlation' or path == '/score_review_correlation.html':
             self.serve_correlation()
         elif path == '/api/run-analysis':
-            self.run_score_analysis(user)
+            self.run_score_analysis(user, parse_qs(parsed_path.query))
+        elif path == '/api/correlation-matrix':
+            self.serve_correlation_matrix(user, parse_qs(parsed_path.query))
+        elif path == '/api/reviews/time-range':
+            self.serve_time_range(user, parse_qs(parsed_path.query))
+        elif path == '/api/reviews/activity':
+            self.serve_activity(user, parse_qs(parsed_path.query))
+        elif path == '/api/layout':
+            self.serve_layout(user, parse_qs(parsed_path.query))
+        elif path == '/api/graph-clusters':
+            self.serve_graph_clusters(user, parse_qs(parsed_path.query))
+        elif path == '/api/label-cube':
+            self.serve_label_cube(user, parse_qs(parsed_path.query))
+        elif path == '/api/search':
+            self.serve_search(user, parse_qs(parsed_path.query))
+        elif path == '/api/graph-metrics':
+            self.serve_graph_metrics(user, parse_qs(parsed_path.query))
+        elif path == '/api/threshold-sweep':
+            self.serve_threshold_sweep(user, parse_qs(parsed_path.query))
         elif path == '/api/user-info':
             self.send_json_response({"user": user})
+        elif path == '/api/admin/latency':
+            self.serve_latency_report()
+        elif path == '/api/admin/startup':
+            if self.require_admin():
+                self.send_json_response(STARTUP.to_dict())
+        elif path == '/api/admin/storage':
+            if self.require_admin():
+                self.send_json_response(storage.report())
         elif path == '/status':
             self.serve_status(user)
         elif path == '/result':
-            self.serve_result(user)
+            self.serve_result(user, parse_qs(parsed_path.query))
         elif path.startswith('../static/'):
             self.serve_static_file(path[10:])
         elif path.startswith('/function/'):
@@ -303,39 +447,64 @@ class PipelineHandler(SimpleHTTPRequestHandler):
             self.handle_upload(user)
         elif path == '/run':
             self.handle_run_pipeline(user)
+        elif path == '/api/rethreshold':
+            self.handle_rethreshold(user)
+        elif path == '/api/admin/storage/sweep':
+            if self.require_admin():
+                self.send_json_response(storage.sweep())
         else:
             self.send_error(404, "Not Found")
     
+    def send_cached_asset(self, asset, extra_headers: dict = None):
+        """Send a cached asset, honouring If-None-Match and gzip negotiation."""
+        use_gzip = asset.gzip_body is not None and 'gzip' in self.headers.get('Accept-Encoding', '')
+        body, etag = (asset.gzip_body, asset.gzip_etag) if use_gzip else (asset.body, asset.etag)
+        
+        if asset.matches(self.headers.get('If-None-Match')):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            if asset.gzip_body is not None:
+                self.send_header('Vary', 'Accept-Encoding')
+            for name, value in (extra_headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-type', asset.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        if asset.gzip_body is not None:
+            self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def serve_page(self, filename: str):
+        """Serve an HTML page shell from the asset cache."""
+        asset = ASSET_CACHE.get_file(PIPELINE_DIR / filename, 'text/html; charset=utf-8')
+        if asset is None:
+            self.send_error(404, f"{filename} not found")
+            return
+        self.send_cached_asset(asset)
+    
     def serve_login(self):
         """Serve the login page."""
-        html_path = PIPELINE_DIR / "login.html"
-        if html_path.exists():
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            with open(html_path, 'rb') as f:
-                self.wfile.write(f.read())
-        else:
-            self.send_error(404, "login.html not found")
+        self.serve_page("login.html")
     
     def serve_register(self):
         """Serve the registration page."""
-        html_path = PIPELINE_DIR / "register.html"
-        if html_path.exists():
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            with open(html_path, 'rb') as f:
-                self.wfile.write(f.read())
-        else:
-            self.send_error(404, "register.html not found")
+        self.serve_page("register.html")
     
     def handle_login(self):
         """Handle login POST request."""
         try:
             content_length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(content_length).decode('utf-8')
-            data = json.loads(body) if body else {}
+            data = json_codec.loads(body) if body else {}
             
             username = data.get('username', '')
             password = data.get('password', '')
@@ -343,6 +512,7 @@ class PipelineHandler(SimpleHTTPRequestHandler):
             user = authenticate_user(username, password)
             if user:
                 token = create_session(user)
+                self._request_user = user
                 
                 # Create user directories
                 get_user_dirs(user['id'])
@@ -361,7 +531,7 @@ class PipelineHandler(SimpleHTTPRequestHandler):
                         "role": user.get('role', 'user')
                     }
                 }
-                self.wfile.write(json.dumps(response).encode('utf-8'))
+                self.wfile.write(json_codec.dumps(response))
             else:
                 self.send_json_response({
                     "success": False,
@@ -376,7 +546,7 @@ class PipelineHandler(SimpleHTTPRequestHandler):
         try:
             content_length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(content_length).decode('utf-8')
-            data = json.loads(body) if body else {}
+            data = json_codec.loads(body) if body else {}
             
             name = data.get('name', '').strip()
             username = data.get('username', '').strip()
@@ -427,14 +597,14 @@ class PipelineHandler(SimpleHTTPRequestHandler):
     def handle_logout(self):
         """Handle logout request."""
         token = self.get_session_token()
-        if token and token in sessions:
-            del sessions[token]
+        if token:
+            state.delete_session(token)
         
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
         self.send_header('Set-Cookie', 'session=; Path=/; Max-Age=0')
         self.end_headers()
-        self.wfile.write(json.dumps({"success": True}).encode('utf-8'))
+        self.wfile.write(json_codec.dumps({"success": True}))
     
     def handle_check_session(self):
         """Check if session is valid."""
@@ -458,69 +628,390 @@ class PipelineHandler(SimpleHTTPRequestHandler):
         query_params = parse_qs(parsed_path.query)
         locale = query_params.get('locale', ['en'])[0]
         
-        translations = get_all_translations(locale)
-        self.send_json_response(translations)
+        asset = ASSET_CACHE.get_generated(
+            ('translations', locale),
+            TRANSLATIONS_DIR / f"{locale}.json",
+            lambda: json_codec.dumps(get_all_translations(locale)),
+            'application/json; charset=utf-8'
+        )
+        if asset is None:
+            self.send_json_response({})
+            return
+        self.send_cached_asset(asset)
+    
+    def serve_metrics(self):
+        """Serve process metrics in Prometheus text format."""
+        body = metrics.REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def serve_latency_report(self):
+        """Serve per-route latency percentiles (admin only)."""
+        if not self.require_admin():
+            return
+        self.send_json_response({
+            "routes": metrics.latency_report(),
+            "access_log_dropped": access_log.dropped,
+            "asset_cache": ASSET_CACHE.stats(),
+            "worker_pid": os.getpid(),
+            "state": state.stats()
+        })
     
     def serve_index(self):
         """Serve the main HTML page."""
-        html_path = PIPELINE_DIR / "index.html"
-        if html_path.exists():
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            with open(html_path, 'rb') as f:
-                self.wfile.write(f.read())
-        else:
-            self.send_error(404, "index.html not found")
+        self.serve_page("index.html")
     
     def serve_graph(self):
         """Serve the graph visualization page."""
-        html_path = PIPELINE_DIR / "graph.html"
-        if html_path.exists():
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            with open(html_path, 'rb') as f:
-                self.wfile.write(f.read())
-        else:
-            self.send_error(404, "graph.html not found")
+        self.serve_page("graph.html")
     
     def serve_correlation(self):
         """Serve the score-review correlation analysis page."""
-        html_path = PIPELINE_DIR / "score_review_correlation.html"
-        if html_path.exists():
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            with open(html_path, 'rb') as f:
-                self.wfile.write(f.read())
-        else:
-            self.send_error(404, "score_review_correlation.html not found")
+        self.serve_page("score_review_correlation.html")
     
-    def run_score_analysis(self, user: dict):
-        """Run score-review correlation analysis and return results."""
+    def run_score_analysis(self, user: dict, query: dict):
+        """
+        Run score-review correlation analysis and return results.
+        
+        ?uncertainty=1 adds bootstrap CIs and permutation p-values.
+        """
         try:
             from score_review_analysis import generate_analysis_report
             
             # Get user output directory
             _, output_dir = get_user_dirs(user['id'])
-            report = generate_analysis_report(str(output_dir / "final_result.json"))
+            uncertainty = query['uncertainty'][0] == '1' if 'uncertainty' in query else None
+            report = generate_analysis_report(str(output_dir / "final_result.json"), uncertainty)
             
             self.send_json_response(report)
         except Exception as e:
             self.send_json_response({"error": str(e)}, 500)
     
+    def serve_correlation_matrix(self, user: dict, query: dict):
+        """
+        Student x feature correlation matrices cached next to the user's result.
+        
+        ?format=csv&method=pearson|spearman|partial_pre downloads one matrix
+        for spreadsheets; the report is regenerated first if the matrix is
+        missing or older than final_result.json.
+        """
+        try:
+            from score_review_analysis import generate_analysis_report
+            from correlation_matrix import CORRELATION_MATRIX_FILE, write_csv
+            _, output_dir = get_user_dirs(user['id'])
+            result_path = output_dir / "final_result.json"
+            matrix_path = output_dir / CORRELATION_MATRIX_FILE
+            if not result_path.exists():
+                self.send_json_response({"error": "Result not found. Please run pipeline first."}, 404)
+                return
+            if not matrix_path.exists() or matrix_path.stat().st_mtime_ns < result_path.stat().st_mtime_ns:
+                report = generate_analysis_report(str(result_path))
+                if 'error' in report:
+                    self.send_json_response(report, 404)
+                    return
+                # The cache stats files at most once a second: drop the old matrix now
+                ASSET_CACHE.discard(str(matrix_path))
+            
+            if query.get('format', ['json'])[0] == 'csv':
+                method = query.get('method', ['pearson'])[0]
+                table = json_codec.load(matrix_path)
+                out = io.StringIO()
+                write_csv(table, method, out)
+                body = out.getvalue().encode('utf-8-sig')
+                self.send_response(200)
+                self.send_header('Content-type', 'text/csv; charset=utf-8')
+                self.send_header('Content-Disposition', f'attachment; filename="correlation_{method}.csv"')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            
+            asset = ASSET_CACHE.get_file(matrix_path, 'application/json; charset=utf-8')
+            self.send_cached_asset(asset, {'Cache-Control': 'private, max-age=0, must-revalidate'})
+        except ValueError as e:
+            self.send_json_response({"error": str(e)}, 400)
+        except Exception as e:
+            self.send_json_response({"error": str(e)}, 500)
+    
+    def serve_time_range(self, user: dict, query: dict):
+        """
+        Reviews submitted in a time window, found by binary search.
+        
+        Either start/end (epoch seconds or a timestamp string) or hours
+        before a deadline (defaulting to the HW's last review) with hw set.
+        """
+        try:
+            from time_index import get_time_index, parse_time_param, format_epoch
+            _, output_dir = get_user_dirs(user['id'])
+            result_path = output_dir / "final_result.json"
+            if not result_path.exists():
+                self.send_json_response({"error": "Result not found. Please run pipeline first."}, 404)
+                return
+            index = get_time_index(result_path)
+            
+            hw = query.get('hw', [None])[0]
+            limit = int(query.get('limit', ['200'])[0])
+            if 'hours' in query:
+                if not hw:
+                    raise ValueError("hw is required with hours")
+                deadline = parse_time_param(query['deadline'][0]) if 'deadline' in query else None
+                start, end = index.before_deadline(hw, float(query['hours'][0]), deadline)
+            else:
+                span = index.span(hw) or (0, 0)
+                start = parse_time_param(query['start'][0]) if 'start' in query else span[0]
+                end = parse_time_param(query['end'][0]) if 'end' in query else span[1]
+            
+            self.send_json_response({
+                "hw": hw,
+                "start": format_epoch(start),
+                "end": format_epoch(end),
+                "count": index.count(start, end, hw),
+                "reviews": index.query(start, end, hw, limit)
+            })
+        except KeyError as e:
+            self.send_json_response({"error": str(e.args[0])}, 404)
+        except ValueError as e:
+            self.send_json_response({"error": str(e)}, 400)
+        except Exception as e:
+            self.send_json_response({"error": str(e)}, 500)
+    
+    def serve_activity(self, user: dict, query: dict):
+        """Reviews per day or hour for each HW."""
+        try:
+            from time_index import get_time_index
+            _, output_dir = get_user_dirs(user['id'])
+            result_path = output_dir / "final_result.json"
+            if not result_path.exists():
+                self.send_json_response({"error": "Result not found. Please run pipeline first."}, 404)
+                return
+            index = get_time_index(result_path)
+            bucket = query.get('bucket', ['day'])[0]
+            self.send_json_response({
+                "bucket": bucket,
+                "missing_timestamps": index.missing,
+                "series": index.activity(bucket, query.get('hw', [None])[0])
+            })
+        except KeyError as e:
+            self.send_json_response({"error": str(e.args[0])}, 404)
+        except ValueError as e:
+            self.send_json_response({"error": str(e)}, 400)
+        except Exception as e:
+            self.send_json_response({"error": str(e)}, 500)
+    
+    def serve_layout(self, user: dict, query: dict):
+        """Precomputed node positions for a HW selection (?hw=HW1,HW2)."""
+        _, output_dir = get_user_dirs(user['id'])
+        result_path = output_dir / "final_result.json"
+        if not result_path.exists():
+            self.send_json_response({"error": "Result not found. Please run pipeline first."}, 404)
+            return
+        
+        hw_keys = [hw for hw in query.get('hw', [''])[0].split(',') if hw]
+        try:
+            from graph_layout import layout_for_result
+            layout_path = layout_for_result(result_path, hw_keys, LAYOUT_CACHE_DIR)
+        except Exception as e:
+            self.send_json_response({"error": f"Layout unavailable: {e}"}, 503)
+            return
+        
+        asset = ASSET_CACHE.get_file(layout_path, 'application/json; charset=utf-8')
+        if asset is None:
+            self.send_json_response({"error": "Layout not found"}, 404)
+            return
+        self.send_cached_asset(asset, {'Cache-Control': 'private, max-age=0, must-revalidate'})
+    
+    def serve_graph_clusters(self, user: dict, query: dict):
+        """
+        Level-of-detail view of the review graph with a bounded node count.
+        
+        ?hw=HW1,HW2&level=0&expand=c.3,c.3.1&max_nodes=200&group=community|prefix
+        Clusters in `expand` are opened in order; a student is shown in
+        place of a cluster once its cluster is small enough.
+        """
+        try:
+            from graph_clusters import get_hierarchy, DEFAULT_MAX_NODES, DEFAULT_PREFIX_LENGTH
+            _, output_dir = get_user_dirs(user['id'])
+            result_path = output_dir / "final_result.json"
+            if not result_path.exists():
+                self.send_json_response({"error": "Result not found. Please run pipeline first."}, 404)
+                return
+            
+            hw_keys = [hw for hw in query.get('hw', [''])[0].split(',') if hw]
+            expand = [c for c in query.get('expand', [''])[0].split(',') if c]
+            hierarchy = get_hierarchy(
+                result_path, hw_keys,
+                group=query.get('group', ['community'])[0],
+                prefix_length=int(query.get('prefix', [str(DEFAULT_PREFIX_LENGTH)])[0])
+            )
+            self.send_json_response(hierarchy.view(
+                expand,
+                level=int(query.get('level', ['0'])[0]),
+                max_nodes=int(query.get('max_nodes', [str(DEFAULT_MAX_NODES)])[0])
+            ))
+        except KeyError as e:
+            self.send_json_response({"error": str(e.args[0])}, 404)
+        except ValueError as e:
+            self.send_json_response({"error": str(e)}, 400)
+        except Exception as e:
+            self.send_json_response({"error": str(e)}, 500)
+    
+    def serve_label_cube(self, user: dict, query: dict):
+        """
+        Label statistics of a slice of the label-combination cube.
+        
+        ?hw=HW1,HW2&reviewer=&round=1,2&by=hw|reviewer|round
+        ?format=cube returns the sparse cube itself for client-side slicing.
+        """
+        try:
+            from label_cube import get_cube
+            _, output_dir = get_user_dirs(user['id'])
+            result_path = output_dir / "final_result.json"
+            if not result_path.exists():
+                self.send_json_response({"error": "Result not found. Please run pipeline first."}, 404)
+                return
+            
+            cube = get_cube(result_path)
+            if query.get('format', [''])[0] == 'cube':
+                self.send_json_response(cube.to_dict())
+                return
+            
+            hw_keys = [hw for hw in query.get('hw', [''])[0].split(',') if hw]
+            reviewers = [r for r in query.get('reviewer', [''])[0].split(',') if r]
+            rounds = [r for r in query.get('round', [''])[0].split(',') if r]
+            self.send_json_response(cube.query(hw_keys, reviewers, rounds, by=query.get('by', [None])[0]))
+        except KeyError as e:
+            self.send_json_response({"error": str(e.args[0])}, 404)
+        except ValueError as e:
+            self.send_json_response({"error": str(e)}, 400)
+        except Exception as e:
+            self.send_json_response({"error": str(e)}, 500)
+    
+    def serve_search(self, user: dict, query: dict):
+        """
+        BM25-ranked feedback matching a full-text query.
+        
+        ?q=縮排 tab&hw=HW1,HW2&limit=20
+        """
+        try:
+            from feedback_index import get_index, DEFAULT_LIMIT
+            _, output_dir = get_user_dirs(user['id'])
+            result_path = output_dir / "final_result.json"
+            if not result_path.exists():
+                self.send_json_response({"error": "Result not found. Please run pipeline first."}, 404)
+                return
+            
+            text = query.get('q', [''])[0].strip()
+            if not text:
+                self.send_json_response({"error": "q is required"}, 400)
+                return
+            hw_keys = [hw for hw in query.get('hw', [''])[0].split(',') if hw]
+            limit = int(query.get('limit', [str(DEFAULT_LIMIT)])[0])
+            self.send_json_response(get_index(result_path).search(text, hw_keys, limit))
+        except ValueError as e:
+            self.send_json_response({"error": str(e)}, 400)
+        except Exception as e:
+            self.send_json_response({"error": str(e)}, 500)
+    
+    def serve_graph_metrics(self, user: dict, query: dict):
+        """
+        Per-student review-network metrics.
+        
+        Without `scope` the whole column table is returned; with
+        scope=ALL|HW<n> one row per student active in that scope.
+        """
+        _, output_dir = get_user_dirs(user['id'])
+        metrics_path = output_dir / "graph_metrics.json"
+        if not metrics_path.exists():
+            self.send_json_response({"error": "Graph metrics not found. Please run pipeline first."}, 404)
+            return
+        
+        scope = query.get('scope', [None])[0]
+        if scope is None:
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json; charset=utf-8')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            with open(metrics_path, 'rb') as f:
+                shutil.copyfileobj(f, self.wfile)
+            return
+        
+        try:
+            from graph_analytics import student_rows
+            table = json_codec.load(metrics_path)
+            self.send_json_response({
+                "scope": scope,
+                "summary": table["scopes"][scope]["summary"] if scope in table["scopes"] else None,
+                "students": student_rows(table, scope)
+            })
+        except KeyError as e:
+            self.send_json_response({"error": str(e.args[0])}, 404)
+    
+    def handle_rethreshold(self, user: dict):
+        """
+        Re-apply label thresholds to the stored probabilities. It rewrites
+        the same files as a run, so it claims the user's run slot like /run:
+        no run, second rethreshold or storage eviction can overlap it.
+        """
+        user_id = user['id']
+        previous = dict(get_pipeline_status(user_id))
+        with storage.user_lock(user_id):
+            claimed = state.claim_run(user_id)
+        if not claimed:
+            self.send_json_response({"error": "Pipeline is already running for this user"}, 409)
+            return
+        status = get_pipeline_status(user_id)
+        status["message"] = "Re-thresholding labels..."
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(content_length).decode('utf-8')
+            params = json_codec.loads(body) if body else {}
+            
+            from label_probabilities import rethreshold, DEFAULT_THRESHOLDS
+            _, output_dir = get_user_dirs(user_id)
+            stats = rethreshold(output_dir, params.get('thresholds', DEFAULT_THRESHOLDS))
+            self.send_json_response({"success": True, "stats": stats})
+        except FileNotFoundError as e:
+            self.send_json_response({"error": str(e)}, 404)
+        except ValueError as e:
+            self.send_json_response({"error": str(e)}, 400)
+        except Exception as e:
+            self.send_json_response({"error": str(e)}, 500)
+        finally:
+            # Back to the last run's status
+            status.update(previous, running=False)
+    
+    def serve_threshold_sweep(self, user: dict, query: dict):
+        """Label rates and score correlations over a threshold grid."""
+        try:
+            from label_probabilities import threshold_sweep
+            grid = None
+            if query.get('grid'):
+                grid = [float(g) for g in query['grid'][0].split(',') if g.strip()]
+            _, output_dir = get_user_dirs(user['id'])
+            self.send_json_response(threshold_sweep(output_dir, grid))
+        except FileNotFoundError as e:
+            self.send_json_response({"error": str(e)}, 404)
+        except ValueError as e:
+            self.send_json_response({"error": str(e)}, 400)
+        except Exception as e:
+            self.send_json_response({"error": str(e)}, 500)
+    
     def serve_status(self, user: dict):
         """Serve pipeline status as JSON for specific user."""
         status = get_pipeline_status(user['id'])
-        self.send_json_response(status)
+        self.send_json_response(dict(status))
     
-    def serve_result(self, user: dict):
-        """Serve the final result JSON for specific user."""
+    def serve_result(self, user: dict, query: dict):
+        """Serve the final result JSON for specific user (?format=ndjson streams it)."""
         _, output_dir = get_user_dirs(user['id'])
         result_path = output_dir / "final_result.json"
         
-        if result_path.exists():
+        if result_path.exists() and query.get('format', ['json'])[0] == 'ndjson':
+            self.stream_result_ndjson(result_path)
+        elif result_path.exists():
             self.send_response(200)
             self.send_header('Content-type', 'application/json; charset=utf-8')
             self.send_header('Access-Control-Allow-Origin', '*')
@@ -530,32 +1021,55 @@ class PipelineHandler(SimpleHTTPRequestHandler):
         else:
             self.send_error(404, "Result not found. Please run pipeline first.")
     
+    def stream_result_ndjson(self, result_path: Path):
+        """
+        Stream final_result.ndjson in fixed-size chunks, flushing each one so
+        the browser can render the first assignments while the rest arrive.
+        The server speaks HTTP/1.0, so the body ends when the connection closes.
+        """
+        ndjson_file = json_codec.ensure_ndjson(result_path)
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            with open(ndjson_file, 'rb') as f:
+                while True:
+                    chunk = f.read(NDJSON_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+    
     def serve_static_file(self, filename):
         """Serve files from static directory."""
-        file_path = STATIC_DIR / filename
-        if file_path.exists() and file_path.is_file():
-            self.send_response(200)
-            
-            if filename.endswith('.html'):
-                content_type = 'text/html; charset=utf-8'
-            elif filename.endswith('.js'):
-                content_type = 'application/javascript; charset=utf-8'
-            elif filename.endswith('.css'):
-                content_type = 'text/css; charset=utf-8'
-            elif filename.endswith('.json'):
-                content_type = 'application/json; charset=utf-8'
-            else:
-                content_type = 'application/octet-stream'
-            
-            self.send_header('Content-type', content_type)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Cache-Control', 'public, max-age=3600')
-            self.end_headers()
-            
-            with open(file_path, 'rb') as f:
-                self.wfile.write(f.read())
+        file_path = (STATIC_DIR / filename).resolve()
+        
+        if filename.endswith('.html'):
+            content_type = 'text/html; charset=utf-8'
+        elif filename.endswith('.js'):
+            content_type = 'application/javascript; charset=utf-8'
+        elif filename.endswith('.css'):
+            content_type = 'text/css; charset=utf-8'
+        elif filename.endswith('.json'):
+            content_type = 'application/json; charset=utf-8'
         else:
+            content_type = 'application/octet-stream'
+        
+        asset = None
+        if STATIC_DIR in file_path.parents:
+            asset = ASSET_CACHE.get_file(file_path, content_type)
+        if asset is None:
             self.send_error(404, f"File not found: {filename}")
+            return
+        self.send_cached_asset(asset, {
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'public, max-age=3600'
+        })
     
     def serve_function_file(self, filename):
         """Serve files from function directory."""
@@ -594,6 +1108,7 @@ class PipelineHandler(SimpleHTTPRequestHandler):
             content_type = self.headers.get('Content-Type', '')
             
             if 'multipart/form-data' in content_type:
+                import cgi
                 form = cgi.FieldStorage(
                     fp=self.rfile,
                     headers=self.headers,
@@ -609,14 +1124,25 @@ class PipelineHandler(SimpleHTTPRequestHandler):
                         # Get user upload directory
                         upload_dir, _ = get_user_dirs(user['id'])
                         
-                        # Save uploaded file
+                        # Save uploaded file as-is (.csv, .csv.gz, .zip or .xlsx);
+                        # compressed uploads are streamed by the converter
                         filename = os.path.basename(file_item.filename)
-                        if not filename.endswith('.csv'):
+                        if input_extension(filename) is None:
                             filename += '.csv'
                         
                         upload_path = upload_dir / filename
                         with open(upload_path, 'wb') as f:
-                            f.write(file_item.file.read())
+                            shutil.copyfileobj(file_item.file, f)
+                        
+                        # Older artifacts make room first; the upload is refused if it still does not fit
+                        usage = storage.admit(user['id'], upload_path)
+                        if not usage["admitted"]:
+                            self.send_json_response({
+                                "success": False,
+                                "error": "Storage quota exceeded",
+                                "storage": usage
+                            }, 413)
+                            return
                         
                         self.send_response(200)
                         self.send_header('Content-type', 'application/json')
@@ -627,7 +1153,7 @@ class PipelineHandler(SimpleHTTPRequestHandler):
                             "path": str(upload_path),
                             "user_id": user['id']
                         }
-                        self.wfile.write(json.dumps(response).encode('utf-8'))
+                        self.wfile.write(json_codec.dumps(response))
                         return
             
             self.send_error(400, "Invalid file upload")
@@ -644,33 +1170,51 @@ class PipelineHandler(SimpleHTTPRequestHandler):
             self.send_json_response({
                 "success": False,
                 "error": "Pipeline is already running for this user"
-            }, 400)
+            }, 409)
             return
         
         try:
             content_length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(content_length).decode('utf-8')
-            params = json.loads(body) if body else {}
+            params = json_codec.loads(body) if body else {}
             
             filename = params.get('filename', '')
             use_ml = params.get('use_ml', False)
             hw_start = params.get('hw_start', 1)
             hw_end = params.get('hw_end', 7)
+            rule_languages = params.get('rule_languages')  # None = all rule files
+            backend = params.get('backend', 'torch')  # 'torch' or 'onnx'
+            rounds = params.get('rounds')  # None = all rounds
+            reviewers = params.get('reviewers')  # None = all reviewers
+            pipelined = params.get('pipelined', PIPELINED_DEFAULT)  # overlap steps 1-3
             
             upload_dir, _ = get_user_dirs(user_id)
             
             if not filename:
-                uploads = list(upload_dir.glob('*.csv'))
+                uploads = sorted((p for p in upload_dir.iterdir() if p.is_file() and input_extension(p.name)),
+                                 key=lambda p: p.stat().st_mtime)
                 if uploads:
                     filename = uploads[-1].name
                 else:
                     self.send_error(400, "No CSV file uploaded")
                     return
             
+            # Claimed atomically so a second /run (to any worker) cannot start it twice,
+            # and under the storage lock so no eviction is removing the user's files
+            with storage.user_lock(user_id):
+                claimed = state.claim_run(user_id)
+            if not claimed:
+                self.send_json_response({
+                    "success": False,
+                    "error": "Pipeline is already running for this user"
+                }, 409)
+                return
+            
             # Start pipeline in background thread
             thread = threading.Thread(
                 target=run_pipeline_async,
-                args=(user_id, filename, use_ml, hw_start, hw_end)
+                args=(user_id, filename, use_ml, hw_start, hw_end, rule_languages, backend, rounds, reviewers,
+                      bool(pipelined))
             )
             thread.start()
             
@@ -683,15 +1227,29 @@ class PipelineHandler(SimpleHTTPRequestHandler):
         except Exception as e:
             self.send_error(500, f"Error starting pipeline: {str(e)}")
     
+    def log_request(self, code='-', size='-'):
+        """Requests are logged once, with timing, by record_request_metrics()."""
+        pass
+    
     def log_message(self, format, *args):
-        """Override to customize logging."""
-        user = self.get_current_user()
-        user_info = f"[{user['username']}]" if user else "[anonymous]"
-        print(f"[{self.log_date_time_string()}] {user_info} {format % args}")
+        """Route remaining server messages (errors) to the access log."""
+        user = getattr(self, '_request_user', None)
+        access_log.log({
+            "ts": round(time.time(), 3),
+            "client": self.client_address[0] if self.client_address else None,
+            "user": user['username'] if user else None,
+            "message": format % args
+        })
 
 
-def run_pipeline_async(user_id: str, filename: str, use_ml: bool, hw_start: int, hw_end: int):
-    """Run the pipeline asynchronously for specific user."""
+def run_pipeline_async(user_id: str, filename: str, use_ml: bool, hw_start: int, hw_end: int,
+                       rule_languages: list = None, backend: str = "torch",
+                       rounds: list = None, reviewers: list = None, pipelined: bool = False):
+    """
+    Run the pipeline asynchronously for specific user.
+    
+    With pipelined=True steps 1-3 run concurrently (see stream_pipeline.py).
+    """
     status = get_pipeline_status(user_id)
     
     status.update({
@@ -703,54 +1261,118 @@ def run_pipeline_async(user_id: str, filename: str, use_ml: bool, hw_start: int,
     })
     
     upload_dir, output_dir = get_user_dirs(user_id)
+    stages = {}  # stage name -> timing/memory/row metrics
+    metrics.PIPELINE_JOBS_RUNNING.inc()
     
     try:
+        from csv_converter import convert_csv_to_json
+        from data_organizer import organize_json_file
+        from ml_inference import run_inference_simple, run_inference_with_model
+        
         csv_path = upload_dir / filename
         json_converted_path = output_dir / "step1_converted.json"
         json_organized_path = output_dir / "step2_organized.json"
         json_final_path = output_dir / "final_result.json"
         
-        # Step 1: CSV to JSON
-        status["step"] = 1
-        status["message"] = "Step 1: Converting CSV to JSON..."
-        print(f"\n[{user_id}] {'='*50}")
-        print(f"[{user_id}] Step 1: CSV to JSON Conversion")
-        print(f"[{user_id}] {'='*50}")
-        
-        step1_stats = convert_csv_to_json(str(csv_path), str(json_converted_path))
-        
-        # Step 2: Organize Data
-        status["step"] = 2
-        status["message"] = "Step 2: Organizing data..."
-        print(f"\n[{user_id}] {'='*50}")
-        print(f"[{user_id}] Step 2: Data Organization")
-        print(f"[{user_id}] {'='*50}")
-        
-        step2_stats = organize_json_file(
-            str(json_converted_path), 
-            str(json_organized_path),
-            hw_start, 
-            hw_end
+        if pipelined:
+            # Steps 1-3 run concurrently, connected by bounded queues (stream_pipeline.py)
+            status["step"] = 1
+            status["message"] = "Steps 1-3: Converting, organizing and labelling concurrently..."
+            print(f"\n[{user_id}] {'='*50}")
+            print(f"[{user_id}] Steps 1-3: Pipelined Conversion, Organization and Inference")
+            print(f"[{user_id}] {'='*50}")
+            
+            from ml_inference import create_labeler
+            from stream_pipeline import run_streaming_pipeline
+            with StageTimer("steps1_3_pipelined", stages) as timer:
+                labeler = create_labeler(use_ml, str(MODEL_PATH), backend, str(ONNX_MODEL_DIR), rule_languages)
+                streamed = run_streaming_pipeline(
+                    str(csv_path),
+                    str(output_dir),
+                    labeler,
+                    hw_start,
+                    hw_end,
+                    rounds=rounds,
+                    reviewers=reviewers,
+                    stages=stages
+                )
+                step1_stats, step2_stats, step3_stats = streamed["step1"], streamed["step2"], streamed["step3"]
+                timer.rows(step1_stats["total_rows"], step3_stats["total_feedbacks"])
+            step3_stats["queues"] = streamed["queues"]
+            inference_seconds = stages["step3_inference"]["wall_seconds"]
+        else:
+            # Step 1: CSV to JSON
+            status["step"] = 1
+            status["message"] = "Step 1: Converting CSV to JSON..."
+            print(f"\n[{user_id}] {'='*50}")
+            print(f"[{user_id}] Step 1: CSV to JSON Conversion")
+            print(f"[{user_id}] {'='*50}")
+            
+            with StageTimer("step1_convert", stages) as timer:
+                step1_stats = convert_csv_to_json(
+                    str(csv_path),
+                    str(json_converted_path),
+                    hw_start,
+                    hw_end,
+                    rounds=rounds,
+                    reviewers=reviewers
+                )
+                timer.rows(step1_stats["total_rows"], step1_stats["converted_records"])
+            
+            # Step 2: Organize Data
+            status["step"] = 2
+            status["message"] = "Step 2: Organizing data..."
+            print(f"\n[{user_id}] {'='*50}")
+            print(f"[{user_id}] Step 2: Data Organization")
+            print(f"[{user_id}] {'='*50}")
+            
+            with StageTimer("step2_organize", stages) as timer:
+                step2_stats = organize_json_file(
+                    str(json_converted_path), 
+                    str(json_organized_path),
+                    hw_start, 
+                    hw_end
+                )
+                timer.rows(step2_stats["input_records"], step2_stats["total_assignments"])
+            
+            # Step 3: ML Inference
+            status["step"] = 3
+            status["message"] = "Step 3: Running ML inference..."
+            print(f"\n[{user_id}] {'='*50}")
+            print(f"[{user_id}] Step 3: ML Inference")
+            print(f"[{user_id}] {'='*50}")
+            
+            with StageTimer("step3_inference", stages) as timer:
+                if use_ml and MODEL_PATH.exists():
+                    step3_stats = run_inference_with_model(
+                        str(json_organized_path),
+                        str(json_final_path),
+                        str(MODEL_PATH),
+                        backend=backend,
+                        onnx_dir=str(ONNX_MODEL_DIR)
+                    )
+                else:
+                    step3_stats = run_inference_simple(
+                        str(json_organized_path),
+                        str(json_final_path),
+                        rule_languages
+                    )
+                timer.rows(step2_stats["total_assignments"], step3_stats["total_feedbacks"])
+            inference_seconds = timer.metrics["wall_seconds"]
+        metrics.record_inference(
+            step3_stats["model_used"],
+            step3_stats["total_feedbacks"],
+            inference_seconds
         )
         
-        # Step 3: ML Inference
-        status["step"] = 3
-        status["message"] = "Step 3: Running ML inference..."
-        print(f"\n[{user_id}] {'='*50}")
-        print(f"[{user_id}] Step 3: ML Inference")
-        print(f"[{user_id}] {'='*50}")
-        
-        if use_ml and MODEL_PATH.exists():
-            step3_stats = run_inference_with_model(
-                str(json_organized_path),
-                str(json_final_path),
-                str(MODEL_PATH)
-            )
-        else:
-            step3_stats = run_inference_simple(
-                str(json_organized_path),
-                str(json_final_path)
-            )
+        duplicate_stats = None
+        with StageTimer("step3_duplicates", stages) as timer:
+            try:
+                from near_duplicates import annotate_duplicates
+                duplicate_stats = annotate_duplicates(str(json_final_path))["summary"]
+                timer.rows(duplicate_stats["feedbacks"], duplicate_stats["duplicated_feedbacks"])
+            except Exception as e:
+                print(f"[{user_id}] Near-duplicate detection skipped: {e}")
         
         # Step 4: Score-Review Correlation Analysis
         status["step"] = 4
@@ -760,19 +1382,54 @@ def run_pipeline_async(user_id: str, filename: str, use_ml: bool, hw_start: int,
         print(f"[{user_id}] {'='*50}")
         
         step4_stats = None
-        try:
-            from score_review_analysis import generate_analysis_report
-            analysis_report = generate_analysis_report(str(json_final_path))
-            if analysis_report and 'error' not in analysis_report:
-                step4_stats = {
-                    "total_students": analysis_report.get('summary', {}).get('total_students', 0),
-                    "total_reviews": analysis_report.get('summary', {}).get('total_reviews_given', 0)
-                }
-                print(f"[{user_id}] Analysis completed: {step4_stats['total_students']} students, {step4_stats['total_reviews']} reviews")
-            else:
-                print(f"[{user_id}] Score analysis skipped (no score data or error)")
-        except Exception as e:
-            print(f"[{user_id}] Score-review analysis skipped: {e}")
+        with StageTimer("step4_analysis", stages) as timer:
+            try:
+                from score_review_analysis import generate_analysis_report
+                analysis_report = generate_analysis_report(str(json_final_path))
+                if analysis_report and 'error' not in analysis_report:
+                    step4_stats = {
+                        "total_students": analysis_report.get('summary', {}).get('total_students', 0),
+                        "total_reviews": analysis_report.get('summary', {}).get('total_reviews_given', 0)
+                    }
+                    timer.rows(step3_stats["total_feedbacks"], step4_stats["total_reviews"])
+                    print(f"[{user_id}] Analysis completed: {step4_stats['total_students']} students, {step4_stats['total_reviews']} reviews")
+                else:
+                    print(f"[{user_id}] Score analysis skipped (no score data or error)")
+            except Exception as e:
+                print(f"[{user_id}] Score-review analysis skipped: {e}")
+        
+        graph_stats = None
+        with StageTimer("step4_graph", stages) as timer:
+            try:
+                from graph_analytics import generate_graph_metrics
+                graph_stats = generate_graph_metrics(str(json_final_path))
+                timer.rows(step3_stats["total_feedbacks"], graph_stats["students"])
+            except Exception as e:
+                print(f"[{user_id}] Graph analytics skipped: {e}")
+        
+        with StageTimer("step4_layout", stages) as timer:
+            try:
+                from graph_layout import precompute_layouts
+                layout_stats = precompute_layouts(str(json_final_path), LAYOUT_CACHE_DIR)
+                timer.rows(step3_stats["total_feedbacks"], layout_stats["layouts"])
+            except Exception as e:
+                print(f"[{user_id}] Graph layout precomputation skipped: {e}")
+        
+        with StageTimer("step4_label_cube", stages) as timer:
+            try:
+                from label_cube import write_label_cube
+                cube = write_label_cube(str(json_final_path))
+                timer.rows(step3_stats["total_feedbacks"], int((cube.counts > 0).sum()))
+            except Exception as e:
+                print(f"[{user_id}] Label cube skipped: {e}")
+        
+        with StageTimer("step4_search", stages) as timer:
+            try:
+                from feedback_index import update_index
+                index_stats = update_index(str(json_final_path))
+                timer.rows(step3_stats["total_feedbacks"], index_stats["documents"])
+            except Exception as e:
+                print(f"[{user_id}] Feedback index update skipped: {e}")
        
         # Complete
         status["step"] = 5
@@ -783,20 +1440,36 @@ def run_pipeline_async(user_id: str, filename: str, use_ml: bool, hw_start: int,
             "step2": step2_stats,
             "step3": step3_stats,
             "step4": step4_stats,
+            "duplicates": duplicate_stats,
+            "graph": graph_stats,
+            "stages": stages,
             "output_file": str(json_final_path)
         }
+        metrics.PIPELINE_RUNS.inc(outcome="success")
+        
+        try:
+            storage.enforce(user_id)
+        except Exception as e:
+            print(f"[{user_id}] Storage quota check skipped: {e}")
         
         print(f"\n[{user_id}] {'='*50}")
         print(f"[{user_id}] Pipeline Complete!")
         print(f"[{user_id}] {'='*50}")
         print(f"[{user_id}] Output: {json_final_path}")
+        for stage, stage_metrics in stages.items():
+            print(f"[{user_id}]   {stage}: {stage_metrics['wall_seconds']}s wall, "
+                  f"{stage_metrics['cpu_seconds']}s cpu, rows {stage_metrics['rows_in']} -> {stage_metrics['rows_out']}")
         
     except Exception as e:
         status["running"] = False
         status["error"] = str(e)
         status["message"] = f"Error: {str(e)}"
+        status["result"] = {"stages": stages}
+        metrics.PIPELINE_RUNS.inc(outcome="error")
         print(f"\n[{user_id}] Pipeline Error: {e}")
         traceback.print_exc()
+    finally:
+        metrics.PIPELINE_JOBS_RUNNING.dec()
 
 
 # Multi-threaded HTTP Server
@@ -804,18 +1477,61 @@ class ThreadedHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
     """Handle requests in separate threads."""
     daemon_threads = True
     allow_reuse_address = True
+    reuse_port = False  # set by worker processes so they can bind the same port
     
     def server_bind(self):
         """Set socket options for better reliability."""
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         super().server_bind()
 
 
-def start_server(port: int = 8002):
-    """Start the pipeline server."""
-    server_address = ('', port)
-    httpd = ThreadedHTTPServer(server_address, PipelineHandler)
-    httpd.socket.settimeout(1)
+class ReusePortHTTPServer(ThreadedHTTPServer):
+    """One worker's listener; the kernel spreads connections across workers."""
+    reuse_port = True
+
+
+def use_shared_state(path):
+    """Keep sessions and pipeline status in a SQLite file instead of process memory."""
+    global state
+    state = SQLiteState(path)
+    expired = state.expire_sessions(SESSION_TIMEOUT)
+    # No worker is running yet, so no pipeline can still be in progress
+    interrupted = state.reset_running("Server restarted during the run")
+    print(f"Shared state: {path} ({expired} expired sessions removed, {interrupted} interrupted runs)")
+
+
+def start_server(port: int = 8002, startup_mode: str = "background", workers: int = 1):
+    """Start the pipeline server.
+    
+    startup_mode controls when the pipeline modules and i18n are loaded:
+    "eager" imports them before binding, "background" binds first and preloads
+    them on a thread, "lazy" loads them on first use only.
+    
+    workers > 1 forks that many worker processes (see serve_workers) that
+    share sessions and pipeline status through STATE_DB.
+    """
+    STARTUP.mode = startup_mode
+    if workers > 1 or STATE_DB:
+        use_shared_state(STATE_DB or DATA_DIR / "state.db")
+    if startup_mode == "eager":
+        preload_modules()
+    
+    ensure_data_dirs()
+    httpd = None
+    if workers <= 1 or not hasattr(socket, 'SO_REUSEPORT'):
+        server_address = ('', port)
+        httpd = ThreadedHTTPServer(server_address, PipelineHandler)
+        httpd.socket.settimeout(1)
+        STARTUP.mark_listening()
+    
+    if workers <= 1:
+        storage.start()
+        if startup_mode == "background":
+            start_background_preload()
+        elif startup_mode == "lazy":
+            IMPORT_TIMER.uninstall()
     
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -837,17 +1553,130 @@ def start_server(port: int = 8002):
     print(f"    - Graph View:  http://{local_ip}:{port}/graph")
     print(f"    - Correlation: http://{local_ip}:{port}/correlation")
     print(f"\n  Users file: {USERS_FILE}")
+    if workers > 1:
+        print(f"  Workers: {workers} processes ({'shared socket' if httpd else 'SO_REUSEPORT'}), "
+              f"state in {state.path}")
+    else:
+        print(f"  Startup mode: {startup_mode} (listening after {STARTUP.to_dict()['listening_ms']} ms)")
+    quota = default_quota_bytes()
+    print(f"  Storage quota: {f'{quota / MB:g} MB per user' if quota else 'unlimited'}, "
+          f"sweep every {storage.interval:g}s")
     print(f"\n  Press Ctrl+C to stop the server")
     print(f"{'='*60}\n")
     
+    if workers > 1:
+        serve_workers(port, startup_mode, workers, httpd)
+        return
+    
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         print("\nShutting down server...")
         httpd.shutdown()
+        storage.stop()
+        access_log.close()
         print("Server stopped.")
 
 
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def serve_workers(port: int, startup_mode: str, workers: int, httpd: ThreadedHTTPServer = None):
+    """
+    Fork the worker processes and restart any that die. Each worker binds
+    its own SO_REUSEPORT listener, or serves the inherited httpd when the
+    platform has no SO_REUSEPORT. SIGTERM or Ctrl+C stops them all.
+    """
+    state.close()  # each process opens its own connections
+    children = {}  # pid -> (worker index, start time)
+    
+    def spawn(index: int):
+        sys.stdout.flush()  # or the child would print the parent's buffered output again
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                run_worker(index, port, startup_mode, httpd)
+                code = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        children[pid] = (index, time.time())
+    
+    signal.signal(signal.SIGTERM, _interrupt)
+    for index in range(workers):
+        spawn(index)
+    
+    try:
+        while children:
+            pid, status = os.wait()
+            code = os.waitstatus_to_exitcode(status)  # -N: killed by signal N
+            index, started = children.pop(pid)
+            if time.time() - started < 2:
+                print(f"Worker {index} (pid {pid}) exited during startup (exit code {code}), stopping")
+                break
+            print(f"Worker {index} (pid {pid}) exited (exit code {code}), restarting")
+            spawn(index)
+    except KeyboardInterrupt:
+        print("\nShutting down workers...")
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in list(children):
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    print("Server stopped.")
+
+
+def run_worker(index: int, port: int, startup_mode: str, httpd: ThreadedHTTPServer = None):
+    """Serve requests in a forked worker until SIGTERM or the supervisor exits."""
+    parent = os.getppid()
+    if httpd is None:
+        httpd = ReusePortHTTPServer(('', port), PipelineHandler)
+        httpd.socket.settimeout(1)
+    else:
+        # Every worker waits on the inherited socket; the losers of an accept must not block
+        httpd.socket.setblocking(False)
+    STARTUP.mark_listening()
+    
+    # One sweeper is enough for all workers
+    if index == 0:
+        storage.start()
+    if startup_mode == "background":
+        start_background_preload()
+    elif startup_mode == "lazy":
+        IMPORT_TIMER.uninstall()
+    
+    def watch_parent():
+        while os.getppid() == parent:
+            time.sleep(1)
+        httpd.shutdown()
+    
+    threading.Thread(target=watch_parent, name="parent-watch", daemon=True).start()
+    signal.signal(signal.SIGTERM, _interrupt)
+    print(f"Worker {index} (pid {os.getpid()}) listening on port {port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    httpd.server_close()
+    storage.stop()
+    access_log.close()
+
+
 if __name__ == '__main__':
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8002
-    start_server(port)
+    parser = argparse.ArgumentParser(description="Review Graph Visualization pipeline server")
+    parser.add_argument('port', nargs='?', type=int, default=8002)
+    parser.add_argument('--startup', choices=STARTUP_MODES, default="background",
+                        help="When to load pipeline modules: background (default), eager or lazy")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="Worker processes sharing the port and a SQLite session/status store (default: 1)")
+    args = parser.parse_args()
+    start_server(args.port, args.startup, args.workers)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Session and Pipeline Status Store for the Pipeline Server
+Holds login sessions (token -> user) and each user's pipeline status either
+in process memory (MemoryState, the single-process default) or in a SQLite
+database in WAL mode (SQLiteState) that every worker process of a
+multi-process server opens. With the shared store any worker can serve any
+request, and sessions survive a restart.
+
+Pipeline status stays a dict that run_pipeline_async updates key by key;
+SQLiteState hands out SharedStatus dicts whose assignments are written
+through, and every read loads the latest row. A run is claimed with one
+IMMEDIATE transaction, so two workers cannot start the same user's pipeline,
+and a status left running by a process that has exited reads as failed.
+
+Usage:
+    python shared_state.py <state.db>     # list sessions and pipeline statuses
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import json_codec
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    user BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pipeline_status (
+    user_id TEXT PRIMARY KEY,
+    running INTEGER NOT NULL,
+    pid INTEGER,
+    status BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def idle_status() -> dict:
+    return {
+        "running": False,
+        "step": 0,
+        "message": "Ready",
+        "error": None,
+        "result": None
+    }
+
+
+def starting_status() -> dict:
+    return dict(idle_status(), running=True, message="Starting pipeline...")
+
+
+def pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MemoryState:
+    """Sessions and statuses in this process only; a restart clears them."""
+
+    shared = False
+
+    def __init__(self):
+        self.sessions = {}  # token -> {"user", "created_at"}
+        self.statuses = {}  # user_id -> status
+        self._lock = threading.Lock()
+
+    def create_session(self, token: str, user: dict, created_at: float):
+        self.sessions[token] = {"user": user, "created_at": created_at}
+
+    def get_session(self, token: str) -> Optional[dict]:
+        return self.sessions.get(token)
+
+    def delete_session(self, token: str):
+        self.sessions.pop(token, None)
+
+    def status(self, user_id: str) -> dict:
+        with self._lock:
+            if user_id not in self.statuses:
+                self.statuses[user_id] = idle_status()
+            return self.statuses[user_id]
+
+    def claim_run(self, user_id: str) -> bool:
+        """Mark the user's pipeline as starting unless it is already running."""
+        status = self.status(user_id)
+        with self._lock:
+            if status["running"]:
+                return False
+            status.update(starting_status())
+            return True
+
+    def is_running(self, user_id: str) -> bool:
+        return self.statuses.get(user_id, {}).get("running", False)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self.sessions),
+            "running": sum(1 for s in self.statuses.values() if s["running"])
+        }
+
+    def close(self):
+        pass
+
+
+class SharedStatus(dict):
+    """A user's pipeline status; item assignments and update() are saved to the store."""
+
+    def __init__(self, store: "SQLiteState", user_id: str, data: dict):
+        super().__init__(data)
+        self._store = store
+        self._user_id = user_id
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._store.save_status(self._user_id, self)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._store.save_status(self._user_id, self)
+
+
+class SQLiteState:
+    """
+    Sessions and statuses in a SQLite file shared by every worker process.
+    Connections are pooled per process (request threads are short-lived)
+    and reopened after a fork.
+    """
+
+    shared = True
+
+    def __init__(self, path, timeout: float = 10.0):
+        self.path = str(path)
+        self.timeout = timeout
+        self._pool = []
+        self._pool_pid = os.getpid()
+        self._pool_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL: durable at checkpoints, never corrupt
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        with self._pool_lock:
+            if self._pool_pid != os.getpid():
+                # Inherited through fork: never touch the parent's handles
+                self._pool, self._pool_pid = [], os.getpid()
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            with self._pool_lock:
+                if self._pool_pid == os.getpid():
+                    self._pool.append(conn)
+
+    def create_session(self, token: str, user: dict, created_at: float):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                         (token, json_codec.dumps(user), created_at))
+
+    def get_session(self, token: str) -> Optional[dict]:
+        with self._connection() as conn:
+            row = conn.execute("SELECT user, created_at FROM sessions WHERE token = ?", (token,)).fetchone()
+        if row is None:
+            return None
+        return {"user": json_codec.loads(row[0]), "created_at": row[1]}
+
+    def delete_session(self, token: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    def expire_sessions(self, max_age: float) -> int:
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM sessions WHERE created_at < ?", (time.time() - max_age,)).rowcount
+
+    def _load(self, conn, user_id: str) -> dict:
+        row = conn.execute("SELECT running, pid, status FROM pipeline_status WHERE user_id = ?",
+                           (user_id,)).fetchone()
+        if row is None:
+            return idle_status()
+        status = json_codec.loads(row[2])
+        if row[0] and not pid_alive(row[1]):
+            status.update(running=False, error="Worker process exited during the run",
+                          message="Error: Worker process exited during the run")
+        return status
+
+    def save_status(self, user_id: str, status: dict):
+        running = bool(status.get("running"))
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO pipeline_status VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+                "running = excluded.running, pid = excluded.pid, status = excluded.status, "
+                "updated_at = excluded.updated_at",
+                (user_id, int(running), os.getpid() if running else None, json_codec.dumps(dict(status)), time.time())
+            )
+
+    def status(self, user_id: str) -> SharedStatus:
+        with self._connection() as conn:
+            return SharedStatus(self, user_id, self._load(conn, user_id))
+
+    def claim_run(self, user_id: str) -> bool:
+        """Mark the user's pipeline as starting unless a live process is running it."""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._load(conn, user_id)["running"]:
+                    return False
+                conn.execute(
+                    "INSERT OR REPLACE INTO pipeline_status VALUES (?, 1, ?, ?, ?)",
+                    (user_id, os.getpid(), json_codec.dumps(starting_status()), time.time())
+                )
+                return True
+            finally:
+                conn.execute("COMMIT")
+
+    def is_running(self, user_id: str) -> bool:
+        with self._connection() as conn:
+            return self._load(conn, user_id)["running"]
+
+    def reset_running(self, message: str) -> int:
+        """Fail every status still marked running (on startup, when no worker can own one)."""
+        with self._connection() as conn:
+            rows = conn.execute("SELECT user_id, status FROM pipeline_status WHERE running = 1").fetchall()
+        for user_id, data in rows:
+            status = json_codec.loads(data)
+            status.update(running=False, error=message, message=f"Error: {message}")
+            self.save_status(user_id, status)
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._connection() as conn:
+            sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            running = conn.execute("SELECT COUNT(*) FROM pipeline_status WHERE running = 1").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "sessions": sessions, "running": running}
+
+    def close(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, []
+        if self._pool_pid == os.getpid():
+            for conn in pool:
+                conn.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        store = SQLiteState(sys.argv[1])
+        print(store.stats())
+        with store._connection() as conn:
+            sessions = conn.execute("SELECT token, user, created_at FROM sessions ORDER BY created_at").fetchall()
+            statuses = conn.execute("SELECT user_id FROM pipeline_status ORDER BY user_id").fetchall()
+        for token, user, created_at in sessions:
+            print(f"session {token[:8]}  {json_codec.loads(user).get('username', '?'):<16}"
+                  f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created_at))}")
+        for (user_id,) in statuses:
+            status = store.status(user_id)
+            print(f"status  {user_id:<16}{'running' if status['running'] else 'idle':<9}{status['message']}")
+    else:
+        print("Usage: python shared_state.py <state.db>")
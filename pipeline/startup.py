@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Startup Helpers for the Pipeline Server
+Times module imports (a per-module breakdown similar to `python -X importtime`)
+and preloads the heavy pipeline modules in the background once the server
+socket is already accepting connections.
+"""
+
+import sys
+import time
+import threading
+import importlib
+import importlib.abc
+from typing import List
+
+# Modules the pipeline needs, in the order they are preloaded
+PRELOAD_MODULES = [
+    "csv_converter",
+    "data_organizer",
+    "ml_inference",
+    "score_review_analysis",
+]
+
+STARTUP_MODES = ("background", "eager", "lazy")
+
+PROCESS_START = time.perf_counter()
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Wraps a module loader and records how long exec_module takes."""
+
+    def __init__(self, loader, name: str, timer: "ImportTimer"):
+        self._loader = loader
+        self._name = name
+        self._timer = timer
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._timer._enter()
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timer._exit(self._name, time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder recording cumulative and self time of every module
+    imported while installed.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._installed = False
+
+    def install(self):
+        if not self._installed:
+            sys.meta_path.insert(0, self)
+            self._installed = True
+
+    def uninstall(self):
+        if self._installed:
+            try:
+                sys.meta_path.remove(self)
+            except ValueError:
+                pass
+            self._installed = False
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, 'finding', False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                        spec.loader = _TimedLoader(spec.loader, fullname, self)
+                    return spec
+            return None
+        finally:
+            self._local.finding = False
+
+    def _enter(self):
+        stack = getattr(self._local, 'child_time', None)
+        if stack is None:
+            stack = self._local.child_time = []
+        stack.append(0.0)
+
+    def _exit(self, name: str, cumulative: float):
+        stack = self._local.child_time
+        children = stack.pop()
+        if stack:
+            stack[-1] += cumulative
+        with self._lock:
+            self.records.append({
+                "module": name,
+                "self_ms": round((cumulative - children) * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3),
+                "depth": len(stack)
+            })
+
+    def report(self, limit: int = 50) -> List[dict]:
+        """Imports sorted by cumulative time, slowest first."""
+        with self._lock:
+            records = list(self.records)
+        return sorted(records, key=lambda r: r["cumulative_ms"], reverse=True)[:limit]
+
+
+IMPORT_TIMER = ImportTimer()
+
+
+class StartupState:
+    """Milestones of the current process start."""
+
+    def __init__(self):
+        self.mode = "background"
+        self.listening_at = None
+        self.first_response_at = None
+        self.preload_started_at = None
+        self.preload_finished_at = None
+        self.preload_errors = {}
+
+    def mark_listening(self):
+        self.listening_at = time.perf_counter()
+
+    def mark_first_response(self):
+        if self.first_response_at is None:
+            self.first_response_at = time.perf_counter()
+
+    def to_dict(self) -> dict:
+        def since_start(t):
+            return round((t - PROCESS_START) * 1000, 2) if t is not None else None
+
+        return {
+            "mode": self.mode,
+            "listening_ms": since_start(self.listening_at),
+            "first_response_ms": since_start(self.first_response_at),
+            "preload_started_ms": since_start(self.preload_started_at),
+            "preload_finished_ms": since_start(self.preload_finished_at),
+            "preload_errors": self.preload_errors,
+            "preloaded": [m for m in PRELOAD_MODULES if m in sys.modules],
+            "imports": IMPORT_TIMER.report()
+        }
+
+
+STARTUP = StartupState()
+
+
+def preload_modules(modules: List[str] = None):
+    """Import the pipeline modules (and i18n) so the first run does not pay for them."""
+    STARTUP.preload_started_at = time.perf_counter()
+    for name in modules or PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            STARTUP.preload_errors[name] = str(e)
+    try:
+        from i18n_helper import setup_i18n
+        setup_i18n()
+    except Exception as e:
+        STARTUP.preload_errors["i18n"] = str(e)
+    STARTUP.preload_finished_at = time.perf_counter()
+    IMPORT_TIMER.uninstall()
+
+
+def start_background_preload() -> threading.Thread:
+    """Preload pipeline modules on a daemon thread."""
+    thread = threading.Thread(target=preload_modules, name="preload", daemon=True)
+    thread.start()
+    return thread
@@ -1,6 +1,42 @@
 import { processReviewerData } from './graph_func.js';
 
+// Server-side precomputed layouts (/api/layout), keyed by HW selection
+const layoutCache = new Map();
+let renderToken = 0;
+
+export function nextRenderToken() {
+    return ++renderToken;
+}
+
+export function isCurrentRender(token) {
+    return token === renderToken;
+}
+
+export function fetchLayout(hwNames) {
+    const key = [].concat(hwNames).sort().join(',');
+    if (!layoutCache.has(key)) {
+        layoutCache.set(key, fetch(`/api/layout?hw=${encodeURIComponent(key)}`)
+            .then(response => response.ok ? response.json() : null)
+            .then(layout => layout?.positions || null)
+            .catch(() => null));
+    }
+    return layoutCache.get(key);
+}
+
+// Place nodes at precomputed positions and turn physics off.
+// Falls back to browser physics if any node is missing from the layout.
+export function applyLayout(visNodes, options, positions) {
+    if (!positions || !visNodes.every(n => positions[n.id])) return false;
+    visNodes.forEach(n => {
+        [n.x, n.y] = positions[n.id];
+        n.physics = false;
+    });
+    options.physics = { ...options.physics, enabled: false };
+    return true;
+}
+
 export function updateNetworkInstance(container, data, options, rawData) {
+    const physicsEnabled = options.physics?.enabled !== false;
     if (window.networkInstance) {
         // Stop physics engine to avoid residual animations
         window.networkInstance.setOptions({ physics: { enabled: false } });
@@ -8,12 +44,16 @@ export function updateNetworkInstance(container, data, options, rawData) {
         window.networkInstance.setData({ nodes: [], edges: [] });
         // Set new data and options
         window.networkInstance.setData(data);
-        window.networkInstance.setOptions({ ...options, physics: { enabled: true } });
+        window.networkInstance.setOptions({ ...options, physics: { ...options.physics, enabled: physicsEnabled } });
         // Force redraw
         window.networkInstance.redraw();
     } else {
         window.networkInstance = new vis.Network(container, data, options);
     }
+    if (!physicsEnabled) {
+        // No stabilization pass to fit the view, so fit explicitly
+        window.networkInstance.fit();
+    }
     
     // Always set up click handler (for both new and existing instances)
     window.networkInstance.off('click'); // Remove old handler
@@ -225,9 +265,10 @@ function showStudentDetailsModal(stats) {
     document.addEventListener('keydown', handleEscape);
 }
 
-export function generateGraph(rawData, mode, hwNames) {
+export async function generateGraph(rawData, mode, hwNames) {
     const container = document.getElementById('review-graph');
     if (!container) return;
+    const token = nextRenderToken();
 
     // Data processing
     const { nodes, links } = processReviewerData(rawData, mode, hwNames);
@@ -331,8 +372,7 @@ export function generateGraph(rawData, mode, hwNames) {
         width: 1.5
     }));
 
-    // Create DataSet and options
-    const data = { nodes: new vis.DataSet(visNodes), edges: new vis.DataSet(visEdges) };
+    // Create options
     const options = {
         nodes: {
             scaling: {
@@ -366,6 +406,14 @@ export function generateGraph(rawData, mode, hwNames) {
         }
     };
 
+    // Use server-side positions when available so the browser skips physics
+    const positions = await fetchLayout(hwNames);
+    if (!isCurrentRender(token)) return; // A newer mode/selection was requested meanwhile
+    applyLayout(visNodes, options, positions);
+
+    // Create DataSet
+    const data = { nodes: new vis.DataSet(visNodes), edges: new vis.DataSet(visEdges) };
+
     // Update instance
     updateNetworkInstance(container, data, options, rawData);
 }
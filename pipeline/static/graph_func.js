@@ -1,4 +1,4 @@
-import { updateNetworkInstance } from './graph_3labelFunc.js';
+import { updateNetworkInstance, fetchLayout, applyLayout, nextRenderToken, isCurrentRender } from './graph_3labelFunc.js';
 
 export function drawReviewerChart(reviewerData) {
     const ctx = document.getElementById("reviewerChart").getContext("2d");
@@ -165,12 +165,13 @@ export function processReviewerData(rawData, mode = "all", hwNames = ['HW4']) {
     return { nodes, links };
 }
 
-export function generateAllLabelsGraph(rawData, hwName = ['HW1']) {
+export async function generateAllLabelsGraph(rawData, hwName = ['HW1']) {
     const container = document.getElementById('review-graph');
     if (!container) {
         console.error("找不到 #review-graph 元素");
         return;
     }
+    const token = nextRenderToken();
     // 1. 預處理資料
     const { nodes, links } = processReviewerData(rawData, 'all', hwName);
 
@@ -279,13 +280,6 @@ export function generateAllLabelsGraph(rawData, hwName = ['HW1']) {
 
 
     // 5. 建立 vis.js 網路圖
-    const nodesDataSet = new vis.DataSet(visNodes);
-    const edgesDataSet = new vis.DataSet(visEdges);
-    const data = {
-        nodes: nodesDataSet,
-        edges: edgesDataSet
-    };
-
     const options = {
         nodes: {
             scaling: {
@@ -327,6 +321,19 @@ export function generateAllLabelsGraph(rawData, hwName = ['HW1']) {
             }
         }
     };
+
+    // 伺服器預先計算的座標：取得後覆蓋上面的初始位置並關閉物理引擎
+    const positions = await fetchLayout(hwName);
+    if (!isCurrentRender(token)) return; // 已有更新的選擇，放棄這次繪製
+    applyLayout(visNodes, options, positions);
+
+    const nodesDataSet = new vis.DataSet(visNodes);
+    const edgesDataSet = new vis.DataSet(visEdges);
+    const data = {
+        nodes: nodesDataSet,
+        edges: edgesDataSet
+    };
+
     //let network;
     if (window.networkInstance) {
         window.networkInstance.setData(data);
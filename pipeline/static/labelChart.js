@@ -2,6 +2,73 @@ let cooccurrenceChart = null;
 let probabilityChart = null;
 let combinedProbabilityChart = null;
 
+// Label-combination cube: each round's labels as a 3-bit mask
+// (bit 0 relevance, bit 1 concreteness, bit 2 constructive)
+export const CUBE_LABELS = ['relevance', 'concreteness', 'constructive'];
+const LABEL_CUBE_URL = '/api/label-cube';
+
+// Sparse cube ({hw, reviewers, rounds, cells: [[hw, reviewer, round, mask, count]]})
+export async function fetchLabelCube() {
+    const response = await fetch(`${LABEL_CUBE_URL}?format=cube`);
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+}
+
+// Sum the cube cells of a selection into eight mask counts, O(cells)
+export function sliceLabelCube(cube, { hw = [], reviewer = [], round = [] } = {}) {
+    const pick = (keys, selected) => {
+        if (!selected.length) return null;
+        const wanted = new Set(selected.map(String));
+        return new Set(keys.flatMap((key, i) => wanted.has(String(key)) ? [i] : []));
+    };
+    const hwSet = pick(cube.hw, hw);
+    const reviewerSet = pick(cube.reviewers, reviewer);
+    const roundSet = pick(cube.rounds, round);
+    
+    const masks = Array(8).fill(0);
+    cube.cells.forEach(([h, r, k, mask, count]) => {
+        if ((!hwSet || hwSet.has(h)) && (!reviewerSet || reviewerSet.has(r)) && (!roundSet || roundSet.has(k))) {
+            masks[mask] += count;
+        }
+    });
+    return masks;
+}
+
+// Eight mask counts from entries with a labels array, in one pass
+export function maskHistogram(data) {
+    const masks = Array(8).fill(0);
+    data.forEach(entry => {
+        const labels = entry.labels || [];
+        let mask = 0;
+        CUBE_LABELS.forEach((label, bit) => {
+            if (labels.includes(label)) mask |= 1 << bit;
+        });
+        masks[mask]++;
+    });
+    return masks;
+}
+
+// Mask counts (eight numbers or {masks}) from the cube, or raw entries
+function toMasks(source) {
+    if (source && Array.isArray(source.masks)) return source.masks;
+    if (Array.isArray(source) && source.length === 8 && source.every(v => typeof v === 'number')) return source;
+    return maskHistogram(source);
+}
+
+function isMaskSource(source) {
+    return Array.isArray(source) || (source && Array.isArray(source.masks));
+}
+
+// Number of rounds carrying every listed label
+function countWith(masks, labels) {
+    const bits = labels.map(label => CUBE_LABELS.indexOf(label));
+    if (bits.some(bit => bit < 0)) return 0;
+    const required = bits.reduce((acc, bit) => acc | (1 << bit), 0);
+    return masks.reduce((sum, count, mask) => (mask & required) === required ? sum + count : sum, 0);
+}
+
 export function runAnalysis() {
     // Parse input data
     const inputData = JSON.parse(document.getElementById('inputData').value);
@@ -27,6 +94,17 @@ export function calculateCooccurrenceMatrix(data, labels) {
     const matrix = Array(labels.length).fill()
         .map(() => Array(labels.length).fill(0));
     
+    // The three review labels come straight from mask counts
+    if (labels.every(label => CUBE_LABELS.includes(label))) {
+        const masks = toMasks(data);
+        labels.forEach((label1, x) => {
+            labels.forEach((label2, y) => {
+                if (x !== y) matrix[x][y] = countWith(masks, [label1, label2]);
+            });
+        });
+        return matrix;
+    }
+    
     // Fill co-occurrence counts
     data.forEach(entry => {
         entry.labels.forEach((label1, i) => {
@@ -188,7 +266,7 @@ export function renderCombinedProbChart(selectedData, labels) {
             combinedProbabilityChart = null;
         }
     
-    if (!selectedData || !Array.isArray(selectedData)) {  // Ensure data exists
+    if (!isMaskSource(selectedData)) {  // Ensure data exists
         console.error('selectedData invalid:', selectedData);
         return;
     }
@@ -278,43 +356,26 @@ export function calculateTripleCooccurrence(data, labels) {
         double: {},
         triple: {}
     };
+    const masks = toMasks(data);
     
-    // Initialize statistics object
+    // Single label statistics
     labels.forEach(label => {
-        stats.single[label] = 0;
+        stats.single[label] = countWith(masks, [label]);
     });
     
-    // Calculate various combinations
-    data.forEach(entry => {
-        const entryLabels = entry.labels || [];
-        
-        // Single label statistics
-        entryLabels.forEach(label => {
-            if (stats.single[label] !== undefined) {
-                stats.single[label]++;
-            }
-        });
-        
-        // Double label co-occurrence statistics
-        for (let i = 0; i < entryLabels.length; i++) {
-            for (let j = i + 1; j < entryLabels.length; j++) {
-                const pair = [entryLabels[i], entryLabels[j]].sort().join('→');
-                stats.double[pair] = (stats.double[pair] || 0) + 1;
-            }
-        }
-        
-        // Triple label co-occurrence statistics - fixed version
-        if (entryLabels.length === 3) {
-            const hasAll = labels.every(label => entryLabels.includes(label));
-            if (hasAll) {
-                // Fix: Use copy to avoid modifying original array
-                const tripleKey = [...labels].sort().join('→');
-                stats.triple[tripleKey] = (stats.triple[tripleKey] || 0) + 1;
-            }
+    // Double label co-occurrence statistics
+    for (let i = 0; i < labels.length; i++) {
+        for (let j = i + 1; j < labels.length; j++) {
+            const pair = [labels[i], labels[j]].sort().join('→');
+            stats.double[pair] = countWith(masks, [labels[i], labels[j]]);
         }
-    });
+    }
+    
+    // Triple label co-occurrence statistics
+    if (labels.length === 3) {
+        stats.triple[[...labels].sort().join('→')] = countWith(masks, labels);
+    }
     
-    console.log('Debug - Statistics result:', stats); // Important debug info
     return stats;
 }
 
@@ -379,8 +440,9 @@ export function calculateDetailedConditionalAnalysis(selectedData, labels) {
     };
     
     // Calculate statistics under various conditions
+    const masks = toMasks(selectedData);
     const stats = {
-        total: selectedData.length,
+        total: masks.reduce((a, b) => a + b, 0),
         single: {},
         pairs: {},
         triples: {}
@@ -388,30 +450,19 @@ export function calculateDetailedConditionalAnalysis(selectedData, labels) {
     
     // Count single label occurrences
     labels.forEach(label => {
-        stats.single[label] = selectedData.filter(d => 
-            d.labels.includes(label)
-        ).length;
+        stats.single[label] = countWith(masks, [label]);
     });
     
     // Count label pair co-occurrences
     for (let i = 0; i < labels.length; i++) {
         for (let j = i + 1; j < labels.length; j++) {
-            const labelA = labels[i];
-            const labelB = labels[j];
-            const pairKey = `${labelA}+${labelB}`;
-            
-            stats.pairs[pairKey] = selectedData.filter(d => 
-                d.labels.includes(labelA) && d.labels.includes(labelB)
-            ).length;
+            stats.pairs[`${labels[i]}+${labels[j]}`] = countWith(masks, [labels[i], labels[j]]);
         }
     }
     
     // Count triple label co-occurrences
     if (labels.length === 3) {
-        const tripleKey = labels.join('+');
-        stats.triples[tripleKey] = selectedData.filter(d => 
-            labels.every(label => d.labels.includes(label))
-        ).length;
+        stats.triples[labels.join('+')] = countWith(masks, labels);
     }
     
     // Calculate conditional probability
@@ -539,7 +590,7 @@ export function correlationMatrix(selectedData, labels = ['relevance', 'concrete
         window.correlationChart = null;
     }
 
-    if (!selectedData || !Array.isArray(selectedData)) {
+    if (!isMaskSource(selectedData)) {
         console.error('selectedData 無效:', selectedData);
         return;
     }
@@ -694,14 +745,11 @@ function drawColorScale(ctx, x, y, width, height, devicePixelRatio = 1) {
     }
 }
 
-// 計算皮爾森相關係數矩陣
+// 計算皮爾森相關係數矩陣（由標籤組合計數求得）
 function calculateCorrelationMatrix(data, labels) {
     const matrix = Array(labels.length).fill().map(() => Array(labels.length).fill(0));
-    
-    // 為每個標籤創建二進制向量 (1表示存在，0表示不存在)
-    const vectors = labels.map(label => 
-        data.map(entry => entry.labels.includes(label) ? 1 : 0)
-    );
+    const masks = toMasks(data);
+    const n = masks.reduce((a, b) => a + b, 0);
     
     // 計算每對標籤之間的皮爾森相關係數
     for (let i = 0; i < labels.length; i++) {
@@ -709,7 +757,12 @@ function calculateCorrelationMatrix(data, labels) {
             if (i === j) {
                 matrix[i][j] = 1; // 自相關為1
             } else {
-                matrix[i][j] = calculatePearsonCorrelation(vectors[i], vectors[j]);
+                matrix[i][j] = calculateBinaryCorrelation(
+                    n,
+                    countWith(masks, [labels[i]]),
+                    countWith(masks, [labels[j]]),
+                    countWith(masks, [labels[i], labels[j]])
+                );
             }
         }
     }
@@ -717,17 +770,12 @@ function calculateCorrelationMatrix(data, labels) {
     return matrix;
 }
 
-// 計算皮爾森相關係數
-function calculatePearsonCorrelation(x, y) {
-    const n = x.length;
+// 二元變數的皮爾森相關係數（x² = x，故平方和等於計數）
+function calculateBinaryCorrelation(n, sumX, sumY, sumXY) {
     if (n === 0) return 0;
     
-    const sumX = x.reduce((a, b) => a + b, 0);
-    const sumY = y.reduce((a, b) => a + b, 0);
-    const sumXY = x.reduce((sum, xi, i) => sum + xi * y[i], 0);
-    const sumX2 = x.reduce((sum, xi) => sum + xi * xi, 0);
-    const sumY2 = y.reduce((sum, yi) => sum + yi * yi, 0);
-    
+    const sumX2 = sumX;
+    const sumY2 = sumY;
     const numerator = n * sumXY - sumX * sumY;
     const denominator = Math.sqrt((n * sumX2 - sumX * sumX) * (n * sumY2 - sumY * sumY));
     
@@ -756,15 +804,15 @@ export async function generateHwLabelChart() {
     try {
         console.log('開始載入3標籤資料...');
         
-        // 載入3標籤資料
-        const response = await fetch('../output/final_result.json');
+        // 載入各作業的標籤組合計數
+        const response = await fetch(`${LABEL_CUBE_URL}?by=hw`);
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
-        const data = await response.json();
+        const cube = await response.json();
         
         console.log('計算標籤頻率統計（包含所有評論）...');
-        const stats = calculateHwLabelFrequency(data);
+        const stats = calculateHwCubeFrequency(cube.groups, false);
         console.log('標籤頻率統計結果:', stats);
         
         // 創建圖表
@@ -785,16 +833,16 @@ export async function generateHwEnableLabelChart() {
     try {
         console.log('開始載入3標籤資料...');
         
-        // 載入3標籤資料
-        const response = await fetch('../output/final_result.json');
+        // 載入各作業的標籤組合計數
+        const response = await fetch(`${LABEL_CUBE_URL}?by=hw`);
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
-        const data = await response.json();
-        console.log('資料載入成功，共有作業:', Object.keys(data));
+        const cube = await response.json();
+        console.log('資料載入成功，共有作業:', Object.keys(cube.groups));
         
         console.log('計算標籤頻率統計（僅統計有標籤評論）...');
-        const stats = calculateHwEnableLabelFrequency(data);
+        const stats = calculateHwCubeFrequency(cube.groups, true);
         console.log('標籤頻率統計結果（僅有標籤）:', stats);
         
         // 檢查統計結果是否為空
@@ -835,6 +883,21 @@ export async function generateHwEnableLabelChart() {
     }
 }
 
+// 由各作業的標籤組合計數計算3標籤出現頻率；labeledOnly 時不計無標籤評論（遮罩 0）
+export function calculateHwCubeFrequency(groups, labeledOnly = false) {
+    const percentageStats = {};
+    Object.entries(groups).forEach(([hwName, group]) => {
+        const total = labeledOnly ? group.total - group.masks[0] : group.total;
+        percentageStats[hwName] = {
+            relevance: total > 0 ? (group.single.relevance / total) * 100 : 0,
+            concreteness: total > 0 ? (group.single.concreteness / total) * 100 : 0,
+            constructive: total > 0 ? (group.single.constructive / total) * 100 : 0,
+            total: total
+        };
+    });
+    return percentageStats;
+}
+
 // 計算每個作業的3標籤出現頻率（包含所有評論）
 export function calculateHwLabelFrequency(data) {
     const hwStats = {};
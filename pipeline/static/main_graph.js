@@ -15,6 +15,9 @@ let rawData = null;
 let currentHW = []; // Will be dynamically loaded from JSON file
 let bubbleChartManager = null; // Bubble Chart manager
 
+const RESULT_STREAM_URL = "/result?format=ndjson";
+const PARTIAL_RENDER_INTERVAL_MS = 1000; // Re-render at most this often while streaming
+
 
 
 export function updateGraphMode(mode, hwNames = [...currentHW]) {
@@ -81,8 +84,15 @@ document.addEventListener("DOMContentLoaded", function () {
         bubbleChartManager = new window.BubbleChartManager();
     }
     
-    // Try to load data from pipeline output first, then fallback to static data
+    // Stream the NDJSON result first so a partial graph shows while the
+    // rest arrives; fall back to the full JSON document
     async function loadData() {
+        try {
+            return await loadStreamingData();
+        } catch (e) {
+            console.log(`⚠️ NDJSON stream unavailable (${e.message}), loading full JSON`);
+        }
+        
         const dataSources = [
             "../output/final_result.json"       // Pipeline full data
         ];
@@ -93,7 +103,7 @@ document.addEventListener("DOMContentLoaded", function () {
                 if (response.ok) {
                     const data = await response.json();
                     console.log(`✅ Loaded data from: ${source}`);
-                    return { data, source, isSummary: false };
+                    return { data, source, isSummary: false, streamed: false };
                 }
             } catch (e) {
                 console.log(`❌ Failed to load from: ${source}`);
@@ -102,6 +112,39 @@ document.addEventListener("DOMContentLoaded", function () {
         throw new Error("No data source available");
     }
     
+    async function loadStreamingData() {
+        const source = RESULT_STREAM_URL;
+        const data = {};
+        const started = performance.now();
+        let lastRender = 0;
+        
+        await streamNdjson(source, {
+            onHeader: (header) => {
+                Object.keys(header.hw).forEach(hwKey => { data[hwKey] = []; });
+                initAssignmentOptions(Object.keys(header.hw).sort());
+                rawData = data;
+            },
+            onRecords: (records) => {
+                records.forEach(record => {
+                    const hwKey = record.HW;
+                    delete record.HW;
+                    (data[hwKey] ||= []).push(record);
+                });
+                // First partial graph as soon as records arrive, then throttled refreshes
+                const now = performance.now();
+                if (!lastRender || now - lastRender >= PARTIAL_RENDER_INTERVAL_MS) {
+                    if (!lastRender) {
+                        console.log(`⏱️ First partial graph after ${Math.round(now - started)} ms`);
+                    }
+                    lastRender = now;
+                    updateGraphMode(currentMode, currentHW);
+                }
+            }
+        });
+        console.log(`✅ Streamed data from: ${source} in ${Math.round(performance.now() - started)} ms`);
+        return { data, source, isSummary: false, streamed: true };
+    }
+    
     // Convert summary format to display format
     function convertSummaryToDisplayFormat(summary) {
         const result = {};
@@ -201,37 +244,18 @@ document.addEventListener("DOMContentLoaded", function () {
     }
     
     loadData()
-        .then(({ data, source, isSummary }) => {
+        .then(({ data, source, isSummary, streamed }) => {
             rawData = data;
             
-            // Dynamically generate assignment options
-            const hwKeys = Object.keys(data).sort(); // Get and sort assignment list
-            console.log("📋 Assignments found in JSON file:", hwKeys);
-            
-            // Update global variable
-            currentHW = [...hwKeys];
-            
-            // Dynamically generate select options
-            const hwSelect = document.getElementById('hw-select');
-            if (hwSelect) {
-                // Clear existing options
-                hwSelect.innerHTML = '';
-                
-                // Add new options
-                hwKeys.forEach(hwKey => {
-                    const option = document.createElement('option');
-                    option.value = hwKey;
-                    option.textContent = hwKey;
-                    option.selected = true; // Select all by default
-                    hwSelect.appendChild(option);
-                });
-                
-                console.log(`✅ Dynamically generated ${hwKeys.length} assignment options`);
+            // Streaming already built the assignment options from its header
+            if (!streamed) {
+                initAssignmentOptions(Object.keys(data).sort());
             }
             
             console.log("Sample data:", data.HW4?.[15]);
             console.log(`📦 Data source: ${source}${isSummary ? ' (summary mode - fast)' : ''}`);
-            updateGraphMode('all', currentHW); // Pass currentHW during initialization
+            // Keep a mode or HW selection the user changed while data was streaming
+            updateGraphMode(streamed ? currentMode : 'all', currentHW);
         })
         .catch(error => {
             console.error("Failed to load JSON:", error);
@@ -239,6 +263,87 @@ document.addEventListener("DOMContentLoaded", function () {
 });
 
 
+// Dynamically generate assignment options
+function initAssignmentOptions(hwKeys) {
+    console.log("📋 Assignments found in JSON file:", hwKeys);
+    
+    // Update global variable
+    currentHW = [...hwKeys];
+    
+    // Dynamically generate select options
+    const hwSelect = document.getElementById('hw-select');
+    if (hwSelect) {
+        // Clear existing options
+        hwSelect.innerHTML = '';
+        
+        // Add new options
+        hwKeys.forEach(hwKey => {
+            const option = document.createElement('option');
+            option.value = hwKey;
+            option.textContent = hwKey;
+            option.selected = true; // Select all by default
+            hwSelect.appendChild(option);
+        });
+        
+        console.log(`✅ Dynamically generated ${hwKeys.length} assignment options`);
+    }
+}
+
+// Read an NDJSON response line by line as chunks arrive; the first line is
+// the header ({format, version, hw: {HW: count}}), the rest are records.
+// The response has no length, so a stream cut at a line boundary is only
+// detected by checking the record count per HW against the header
+async function streamNdjson(url, { onHeader, onRecords }) {
+    const response = await fetch(url);
+    if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let header = null;
+    const received = {};
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffer.split('\n');
+        buffer = done ? '' : lines.pop();
+        
+        const records = [];
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            const record = JSON.parse(line);
+            if (!header) {
+                if (record.format !== 'review-ndjson') {
+                    throw new Error('Unexpected NDJSON header');
+                }
+                header = record;
+                onHeader(header);
+            } else {
+                received[record.HW] = (received[record.HW] || 0) + 1;
+                records.push(record);
+            }
+        }
+        if (records.length > 0) {
+            onRecords(records);
+        }
+        if (done) break;
+    }
+    if (!header) {
+        throw new Error('Empty NDJSON stream');
+    }
+    const hwKeys = new Set([...Object.keys(header.hw), ...Object.keys(received)]);
+    for (const hwKey of hwKeys) {
+        if ((received[hwKey] || 0) !== (header.hw[hwKey] || 0)) {
+            throw new Error(`Incomplete NDJSON stream: ${hwKey} has ${received[hwKey] || 0} of ${header.hw[hwKey] || 0} records`);
+        }
+    }
+    return header;
+}
+
+
 // GO button
 document.getElementById('hw-apply-btn').addEventListener('click', () => {
     const select = document.getElementById('hw-select');
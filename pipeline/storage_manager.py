@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Per-User Storage Quotas for the Pipeline Server
+Tracks the bytes each user holds in uploads/<user>/ and output/<user>/ and
+evicts stale artifacts when a user is over quota:
+
+1. intermediates and rebuildable caches (step1_converted.json,
+   step2_organized.json, final_result.ndjson, label_cube.json,
+   correlation_matrix.json, score_review_analysis.json, feedback_index/),
+   least recently used first
+2. uploads other than the most recent one, least recently used first
+
+The final result and the reports written next to it (graph metrics,
+duplicate clusters) are never evicted, and neither is anything of a user
+whose pipeline is running: a run is claimed while holding the user's lock
+(user_lock, an flock shared by all worker processes), and eviction checks
+the user is idle under the same lock. "Recently used" is the later of a
+file's access and modification time. A daemon thread sweeps all users
+periodically.
+
+Usage:
+    python storage_manager.py <data_dir> [quota_mb]     # report, no eviction
+"""
+
+import os
+import sys
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are excluded
+    fcntl = None
+
+DEFAULT_QUOTA_MB = float(os.environ.get('PIPELINE_USER_QUOTA_MB', '512'))
+SWEEP_INTERVAL = float(os.environ.get('PIPELINE_STORAGE_SWEEP_SECONDS', '300'))
+
+# Eviction tiers, cheapest to lose first
+TIER_INTERMEDIATE = "intermediate"
+TIER_UPLOAD = "upload"
+TIER_LATEST_UPLOAD = "latest_upload"
+TIER_RESULT = "result"
+TIERS = (TIER_INTERMEDIATE, TIER_UPLOAD, TIER_LATEST_UPLOAD, TIER_RESULT)
+EVICTION_ORDER = (TIER_INTERMEDIATE, TIER_UPLOAD)
+
+# Output entries the pipeline can do without: stage inputs and caches that
+# are rebuilt on demand (json_codec.ensure_ndjson, label_cube.get_cube,
+# feedback_index.get_index, /api/correlation-matrix, /api/run-analysis)
+INTERMEDIATE_OUTPUTS = {
+    "step1_converted.json",
+    "step2_organized.json",
+    "final_result.ndjson",
+    "label_cube.json",
+    "correlation_matrix.json",
+    "score_review_analysis.json",
+    "feedback_index",
+}
+
+MB = 1024 * 1024
+LOCK_DIR_NAME = "_locks"  # under the output root; skipped like other shared dirs
+
+
+class Artifact:
+    """One file or directory counted against a user's quota."""
+
+    __slots__ = ("path", "tier", "bytes", "last_used")
+
+    def __init__(self, path: Path, tier: str, size: int, last_used: float):
+        self.path = path
+        self.tier = tier
+        self.bytes = size
+        self.last_used = last_used
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.path.name,
+            "tier": self.tier,
+            "bytes": self.bytes,
+            "last_used": round(self.last_used, 3)
+        }
+
+
+def _measure(path: Path) -> tuple:
+    """(bytes, last used) of a file, or of everything under a directory."""
+    if not path.is_dir():
+        st = path.stat()
+        return st.st_size, max(st.st_atime, st.st_mtime)
+    size, last_used = 0, path.stat().st_mtime
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            size += st.st_size
+            last_used = max(last_used, st.st_atime, st.st_mtime)
+    return size, last_used
+
+
+class StorageManager:
+    """
+    Per-user usage accounting and LRU eviction against a byte quota.
+
+    quota_for(user_id) returns the user's quota in bytes (None for no
+    limit); is_busy(user_id) is true while the user's files are in use.
+    """
+
+    def __init__(self, upload_root: Path, output_root: Path,
+                 quota_for: Callable[[str], Optional[int]] = None,
+                 is_busy: Callable[[str], bool] = None,
+                 interval: float = SWEEP_INTERVAL):
+        self.upload_root = Path(upload_root)
+        self.output_root = Path(output_root)
+        self.quota_for = quota_for or (lambda user_id: default_quota_bytes())
+        self.is_busy = is_busy or (lambda user_id: False)
+        self.interval = interval
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.sweeps = 0
+        self.last_sweep = None
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.recent_evictions = []  # latest evictions, newest last
+
+    @contextmanager
+    def user_lock(self, user_id: str):
+        """
+        Exclusive per-user lock across threads and worker processes. Hold it
+        while claiming a run so eviction never overlaps the claim.
+        """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            lock_dir = self.output_root / LOCK_DIR_NAME
+            lock_dir.mkdir(parents=True, exist_ok=True)
+            with open(lock_dir / f"{user_id}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def user_ids(self) -> List[str]:
+        """Users with an upload or output directory (shared dirs such as _layouts excluded)."""
+        names = set()
+        for root in (self.upload_root, self.output_root):
+            if root.is_dir():
+                names.update(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith('_'))
+        return sorted(names)
+
+    def artifacts(self, user_id: str) -> List[Artifact]:
+        found = []
+        uploads = self.upload_root / user_id
+        if uploads.is_dir():
+            files = []
+            for path in uploads.iterdir():
+                try:
+                    files.append((path, path.stat().st_mtime, *_measure(path)))
+                except OSError:
+                    continue
+            # The most recent upload is what /run uses by default, so it is kept
+            latest = max(files, key=lambda f: f[1])[0] if files else None
+            for path, _, size, last_used in files:
+                found.append(Artifact(path, TIER_LATEST_UPLOAD if path == latest else TIER_UPLOAD, size, last_used))
+        outputs = self.output_root / user_id
+        if outputs.is_dir():
+            for path in outputs.iterdir():
+                try:
+                    size, last_used = _measure(path)
+                except OSError:
+                    continue
+                tier = TIER_INTERMEDIATE if path.name in INTERMEDIATE_OUTPUTS else TIER_RESULT
+                found.append(Artifact(path, tier, size, last_used))
+        return found
+
+    def usage(self, user_id: str, artifacts: List[Artifact] = None) -> dict:
+        """Bytes per tier and in total against the user's quota."""
+        if artifacts is None:
+            artifacts = self.artifacts(user_id)
+        tiers = {tier: 0 for tier in TIERS}
+        for artifact in artifacts:
+            tiers[artifact.tier] += artifact.bytes
+        total = sum(tiers.values())
+        quota = self.quota_for(user_id)
+        return {
+            "user": user_id,
+            "bytes": total,
+            "quota_bytes": quota,
+            "used_percent": round(total * 100 / quota, 1) if quota else None,
+            "over_quota": quota is not None and total > quota,
+            "tiers": tiers,
+            "files": len(artifacts)
+        }
+
+    def enforce(self, user_id: str, protect: List[Path] = ()) -> dict:
+        """
+        Evict LRU artifacts, intermediates before uploads, until the user
+        is within quota. Returns the remaining usage and what was evicted.
+        """
+        with self.user_lock(user_id):
+            artifacts = self.artifacts(user_id)
+            usage = self.usage(user_id, artifacts)
+            evicted = []
+            quota = usage["quota_bytes"]
+            if usage["over_quota"] and not self.is_busy(user_id):
+                protected = {Path(p) for p in protect}
+                candidates = sorted(
+                    (a for a in artifacts if a.tier in EVICTION_ORDER and a.path not in protected),
+                    key=lambda a: (EVICTION_ORDER.index(a.tier), a.last_used)
+                )
+                total = usage["bytes"]
+                for artifact in candidates:
+                    if total <= quota:
+                        break
+                    try:
+                        if artifact.path.is_dir():
+                            shutil.rmtree(artifact.path)
+                        else:
+                            artifact.path.unlink()
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        print(f"[storage] Could not evict {artifact.path}: {e}")
+                        continue
+                    total -= artifact.bytes
+                    evicted.append(artifact)
+                if evicted:
+                    self._record(user_id, evicted)
+                    usage = self.usage(user_id)
+        usage["evicted"] = [a.to_dict() for a in evicted]
+        usage["freed_bytes"] = sum(a.bytes for a in evicted)
+        return usage
+
+    def admit(self, user_id: str, path: Path) -> dict:
+        """
+        Make room for a just-written upload. If it cannot fit even with
+        every evictable artifact gone, it is deleted and nothing is evicted
+        (usage["admitted"] is False).
+        """
+        path = Path(path)
+        with self._lock:
+            usage = self.usage(user_id)
+            kept = usage["tiers"][TIER_LATEST_UPLOAD] + usage["tiers"][TIER_RESULT]
+            if usage["quota_bytes"] is not None and kept > usage["quota_bytes"]:
+                path.unlink(missing_ok=True)
+                return dict(self.usage(user_id), admitted=False, evicted=[], freed_bytes=0)
+            return dict(self.enforce(user_id, protect=[path]), admitted=True)
+
+    def _record(self, user_id: str, evicted: List[Artifact]):
+        now = time.time()
+        for artifact in evicted:
+            self.evicted_files += 1
+            self.evicted_bytes += artifact.bytes
+            metrics.STORAGE_EVICTED_BYTES.inc(artifact.bytes, tier=artifact.tier)
+            self.recent_evictions.append(dict(artifact.to_dict(), user=user_id, evicted_at=round(now, 3)))
+            print(f"[storage] Evicted {user_id}/{artifact.path.name} ({artifact.tier}, {artifact.bytes / MB:.1f} MB)")
+        del self.recent_evictions[:-50]
+
+    def sweep(self) -> dict:
+        """Enforce every user's quota once."""
+        started = time.perf_counter()
+        users = [self.enforce(user_id) for user_id in self.user_ids()]
+        self.sweeps += 1
+        self.last_sweep = {
+            "at": round(time.time(), 3),
+            "seconds": round(time.perf_counter() - started, 3),
+            "users": len(users),
+            "freed_bytes": sum(u["freed_bytes"] for u in users),
+            "over_quota": [u["user"] for u in users if u["over_quota"]]
+        }
+        metrics.STORAGE_USED_BYTES.set(sum(u["bytes"] for u in users))
+        return {"users": users, "sweep": self.last_sweep}
+
+    def report(self) -> dict:
+        """Usage of every user (largest first) and sweeper state, without evicting."""
+        users = sorted((self.usage(user_id) for user_id in self.user_ids()), key=lambda u: -u["bytes"])
+        return {
+            "total_bytes": sum(u["bytes"] for u in users),
+            "default_quota_bytes": default_quota_bytes(),
+            "users": users,
+            "sweeper": {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "interval_seconds": self.interval,
+                "sweeps": self.sweeps,
+                "last_sweep": self.last_sweep,
+                "evicted_files": self.evicted_files,
+                "evicted_bytes": self.evicted_bytes,
+                "recent_evictions": list(self.recent_evictions)
+            }
+        }
+
+    def start(self):
+        """Start the background sweeper (no-op when the interval is 0)."""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="storage-sweeper", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[storage] Sweep failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+
+def default_quota_bytes() -> Optional[int]:
+    """PIPELINE_USER_QUOTA_MB in bytes; 0 or less disables quotas."""
+    return int(DEFAULT_QUOTA_MB * MB) if DEFAULT_QUOTA_MB > 0 else None
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        data_dir = Path(sys.argv[1])
+        quota = int(float(sys.argv[2]) * MB) if len(sys.argv) > 2 else default_quota_bytes()
+        manager = StorageManager(data_dir / "uploads", data_dir / "output", quota_for=lambda user_id: quota)
+        for user in manager.report()["users"]:
+            quota_text = f"{user['quota_bytes'] / MB:.0f} MB" if user['quota_bytes'] else "unlimited"
+            print(f"{user['user']:<16}{user['bytes'] / MB:>10.1f} MB of {quota_text:<12}"
+                  f"intermediate {user['tiers'][TIER_INTERMEDIATE] / MB:.1f} MB, "
+                  f"old uploads {user['tiers'][TIER_UPLOAD] / MB:.1f} MB"
+                  f"{'  OVER QUOTA' if user['over_quota'] else ''}")
+    else:
+        print("Usage: python storage_manager.py <data_dir> [quota_mb]")
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Pipelined Steps 1-3 for Review Data Pipeline
+Runs conversion, organization and labelling concurrently instead of one
+after another:
+
+    reader thread     input rows -> records (also written to step1_converted.json)
+        | bounded queue of record chunks
+    organizer thread  records -> OrganizedReviews groups per (HW, author, reviewer)
+        | bounded queue of feedback batches
+    labeller          batches -> labels (and probabilities) per round
+
+A round's labels depend only on its feedback text, so each round is sent to
+the labeller as soon as the organizer has placed it in its group, without
+waiting for the group or the input to be complete. A full queue blocks the
+stage feeding it, so a slow labeller holds back reading instead of letting
+records pile up. End-to-end time approaches that of the slowest stage.
+
+The files written are the same as the sequential stages write:
+step1_converted.json, step2_organized.json, final_result.json (+ .ndjson)
+and the label probabilities. Only the batches given to the model differ:
+they are length-sorted within each batch rather than over the whole column.
+
+Usage:
+    python stream_pipeline.py <input.csv> <output_dir> [hw_start] [hw_end]
+"""
+
+import os
+import sys
+import time
+import queue
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import json_codec
+import metrics
+from assignment_map import load_assignment_map
+from csv_converter import iter_csv_records
+from data_organizer import OrganizedReviews
+from metrics import StageTimer
+
+RECORD_CHUNK = 256  # records per queue item between reader and organizer
+QUEUE_CHUNKS = int(os.environ.get('PIPELINE_STREAM_QUEUE', '64'))  # items each queue holds
+LABEL_BATCH = int(os.environ.get('PIPELINE_STREAM_BATCH', '256'))  # feedbacks per labelling batch
+
+_DONE = object()
+
+
+class _Aborted(Exception):
+    """Another stage failed; this one stops at its next queue operation."""
+
+
+class StageQueue:
+    """
+    Bounded hand-off between two stages that records who waited on whom.
+    Depth and wait times are also exported as /metrics series.
+    """
+
+    def __init__(self, name: str, maxsize: int, abort: threading.Event):
+        self.name = name
+        self.maxsize = maxsize
+        self.abort = abort
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.items = 0
+        self.max_depth = 0
+        self.producer_wait = 0.0  # queue full: the consumer is the bottleneck
+        self.consumer_wait = 0.0  # queue empty: the producer is the bottleneck
+
+    def put(self, item):
+        started = time.perf_counter()
+        while True:
+            if self.abort.is_set():
+                raise _Aborted()
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        waited = time.perf_counter() - started
+        self.producer_wait += waited
+        self.items += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        metrics.PIPELINE_QUEUE_DEPTH.inc(queue=self.name)
+        metrics.PIPELINE_QUEUE_WAIT_SECONDS.inc(waited, queue=self.name, side="producer")
+
+    def get(self):
+        started = time.perf_counter()
+        while True:
+            if self.abort.is_set():
+                raise _Aborted()
+            try:
+                item = self._queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        waited = time.perf_counter() - started
+        self.consumer_wait += waited
+        metrics.PIPELINE_QUEUE_DEPTH.dec(queue=self.name)
+        metrics.PIPELINE_QUEUE_WAIT_SECONDS.inc(waited, queue=self.name, side="consumer")
+        return item
+
+    def close(self):
+        """Take items left behind by an aborted run off the depth gauge."""
+        metrics.PIPELINE_QUEUE_DEPTH.dec(self._queue.qsize(), queue=self.name)
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.maxsize,
+            "items": self.items,
+            "max_depth": self.max_depth,
+            "producer_wait_seconds": round(self.producer_wait, 4),
+            "consumer_wait_seconds": round(self.consumer_wait, 4)
+        }
+
+
+class _LabelColumns:
+    """Labels and probabilities per organizer row, filled in as batches finish."""
+
+    def __init__(self):
+        self.fields = []
+        self.columns = {}
+        self.probabilities = array('d')
+        self.width = 0
+
+    def store(self, rows: List[int], labels: List[dict], probabilities: Optional[list]):
+        if not rows:
+            return
+        if not self.fields:
+            self.fields = list(labels[0])
+            self.columns = {field: array('b') for field in self.fields}
+        needed = max(rows) + 1
+        for column in self.columns.values():
+            if len(column) < needed:
+                column.frombytes(bytes(needed - len(column)))
+        for row, values in zip(rows, labels):
+            for field in self.fields:
+                self.columns[field][row] = values[field]
+        if probabilities is not None:
+            self.width = len(probabilities[0])
+            missing = needed * self.width - len(self.probabilities)
+            if missing > 0:
+                self.probabilities.frombytes(bytes(8 * missing))
+            for row, values in zip(rows, probabilities):
+                self.probabilities[row * self.width:(row + 1) * self.width] = array('d', values)
+
+    def round_fields(self, row: int) -> Dict[str, int]:
+        return {field: self.columns[field][row] for field in self.fields}
+
+    def probability_rows(self, rows) -> Optional[list]:
+        if not self.width:
+            return None
+        return [self.probabilities[row * self.width:(row + 1) * self.width].tolist() for row in rows]
+
+
+def run_streaming_pipeline(csv_path: str, output_dir: str, labeler, hw_start: int = 1, hw_end: int = 7,
+                           rounds: list = None, reviewers: list = None, stages: Dict[str, dict] = None,
+                           queue_chunks: int = QUEUE_CHUNKS, batch_size: int = LABEL_BATCH) -> dict:
+    """
+    Convert, organize and label an input file with the three stages running
+    concurrently. labeler comes from ml_inference.create_labeler().
+
+    Returns:
+        dict with "step1", "step2" and "step3" statistics (as the sequential
+        stages return them) and "queues" with per-queue wait times
+    """
+    output_dir = Path(output_dir)
+    converted_path = output_dir / "step1_converted.json"
+    organized_path = output_dir / "step2_organized.json"
+    final_path = output_dir / "final_result.json"
+    if stages is None:
+        stages = {}
+
+    assignment_map = load_assignment_map()
+    abort = threading.Event()
+    errors = []
+    records = StageQueue("records", queue_chunks, abort)
+    batches = StageQueue("feedback_batches", queue_chunks, abort)
+    organized = OrganizedReviews()
+    step1_stats, step2_stats, selection = {}, {}, {}
+
+    def read():
+        with StageTimer("step1_convert", stages) as timer:
+            chunk = []
+            separator = b""
+            with open(converted_path, 'wb') as f:
+                f.write(b"[")
+                for record in iter_csv_records(csv_path, hw_start, hw_end, rounds, reviewers,
+                                               assignment_map, step1_stats):
+                    f.write(separator + json_codec.dumps(record))
+                    separator = b","
+                    chunk.append(record)
+                    if len(chunk) == RECORD_CHUNK:
+                        records.put(chunk)
+                        chunk = []
+                f.write(b"]")
+            if chunk:
+                records.put(chunk)
+            records.put(_DONE)
+            timer.rows(step1_stats["total_rows"], step1_stats["converted_records"])
+
+    def organize():
+        with StageTimer("step2_organize", stages) as timer:
+            in_range = {}  # assignment name -> within hw_start..hw_end
+            rows, texts = [], []
+            while True:
+                chunk = records.get()
+                if chunk is _DONE:
+                    break
+                for record in chunk:
+                    row = organized.add(record)
+                    if row is None:
+                        continue
+                    name = record.get("Assignment", "Unknown")
+                    selected = in_range.get(name)
+                    if selected is None:
+                        selected = in_range[name] = assignment_map.in_range(name, hw_start, hw_end)
+                    if selected:
+                        rows.append(row)
+                        texts.append(record.get("Feedback", "") or "")
+                        if len(rows) == batch_size:
+                            batches.put((rows, texts))
+                            rows, texts = [], []
+            if rows:
+                batches.put((rows, texts))
+            batches.put(_DONE)
+
+            selection.update(organized.select(hw_start, hw_end, assignment_map))
+            print(f"Writing output file: {organized_path}")
+            organized.write_json(organized_path, selection)
+            step2_stats.update(organized.summary(selection))
+            timer.rows(step2_stats["input_records"], step2_stats["total_assignments"])
+
+    def run(stage):
+        try:
+            stage()
+        except _Aborted:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            abort.set()
+
+    threads = [threading.Thread(target=run, args=(stage,), name=f"stream-{stage.__name__}", daemon=True)
+               for stage in (read, organize)]
+    for thread in threads:
+        thread.start()
+
+    labels = _LabelColumns()
+    labelled = 0
+    try:
+        with StageTimer("step3_inference", stages) as timer:
+            while True:
+                batch = batches.get()
+                if batch is _DONE:
+                    break
+                rows, texts = batch
+                batch_labels, probabilities = labeler.label(texts)
+                labels.store(rows, batch_labels, probabilities)
+                labelled += len(rows)
+
+            # The organizer finishes step2_organized.json while the last batches are labelled
+            for thread in threads:
+                thread.join()
+            if errors:
+                raise errors[0]
+
+            data = organized.document(selection, labels.round_fields)
+            print(f"Writing output file: {final_path}")
+            json_codec.dump_result(data, final_path)
+            labeler.save(str(final_path), labels.probability_rows(organized.rows(selection)))
+            step3_stats = dict({"total_feedbacks": labelled, "homework_count": len(data)}, **labeler.stats())
+            timer.rows(step2_stats["total_assignments"], labelled)
+    except _Aborted:
+        for thread in threads:
+            thread.join()
+        raise errors[0]
+    except BaseException:
+        abort.set()
+        for thread in threads:
+            thread.join()
+        raise
+    finally:
+        for stage_queue in (records, batches):
+            stage_queue.close()
+
+    print(f"Processed {labelled} feedbacks ({step3_stats['model_used']}) while reading and organizing")
+    return {
+        "step1": step1_stats,
+        "step2": step2_stats,
+        "step3": step3_stats,
+        "queues": {q.name: q.stats() for q in (records, batches)}
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3:
+        from ml_inference import RuleLabeler
+        hw_start = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+        hw_end = int(sys.argv[4]) if len(sys.argv) > 4 else 7
+        stages = {}
+        result = run_streaming_pipeline(sys.argv[1], sys.argv[2], RuleLabeler(), hw_start, hw_end, stages=stages)
+        for stage, stage_metrics in stages.items():
+            print(f"  {stage}: {stage_metrics['wall_seconds']}s wall, rows "
+                  f"{stage_metrics['rows_in']} -> {stage_metrics['rows_out']}")
+        for name, queue_stats in result["queues"].items():
+            print(f"  queue {name}: {queue_stats}")
+    else:
+        print("Usage: python stream_pipeline.py <input.csv> <output_dir> [hw_start] [hw_end]")
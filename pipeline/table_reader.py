@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Streaming Table Readers for Uploaded Review Exports
+Yields header-keyed rows from plain CSV, gzip-compressed CSV (.csv.gz), ZIP
+archives with one or more CSVs, and Excel workbooks (.xlsx, first
+worksheet), decompressing on the fly instead of unpacking to disk.
+
+CSV text is decoded as UTF-8 with or without a byte-order mark. Worksheets
+are parsed with iterparse one row at a time using only the standard library.
+Numeric cells with a date format become "%Y-%m-%d %H:%M:%S" strings, and
+whole numbers lose their ".0", so cells read the same as they would in a
+CSV export.
+
+Usage:
+    python table_reader.py <file> [rows]
+"""
+
+import io
+import re
+import csv
+import sys
+import gzip
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List, Optional
+from xml.etree import ElementTree
+
+SUPPORTED_EXTENSIONS = ('.csv.gz', '.csv', '.zip', '.xlsx')
+TEXT_ENCODING = 'utf-8-sig'
+
+XLSX_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+XLSX_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+XLSX_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# Built-in number formats that display dates or times
+XLSX_DATE_FORMAT_IDS = set(range(14, 23)) | {45, 46, 47}
+XLSX_DATE_CODE_RE = re.compile(r"[ymdhs]")
+XLSX_FORMAT_LITERAL_RE = re.compile(r'"[^"]*"|\[[^\]]*\]|\\.')
+CELL_REF_RE = re.compile(r"[A-Z]+")
+
+
+class Table:
+    """One sheet or CSV file: its header and an iterator of row dicts."""
+
+    def __init__(self, name: str, fieldnames: List[str], rows: Iterator[dict]):
+        self.name = name
+        self.fieldnames = fieldnames
+        self.rows = rows
+
+
+def input_extension(filename) -> Optional[str]:
+    """The supported extension a file name ends with (case-insensitive), or None."""
+    lowered = str(filename).lower()
+    for extension in SUPPORTED_EXTENSIONS:
+        if lowered.endswith(extension):
+            return extension
+    return None
+
+
+def iter_tables(path) -> Iterator[Table]:
+    """
+    Tables of an uploaded file, in order. Each table's rows stream from the
+    open file, so read them before advancing to the next table.
+    """
+    path = Path(path)
+    extension = input_extension(path.name) or '.csv'
+    if extension == '.zip':
+        with zipfile.ZipFile(path) as archive:
+            members = sorted(
+                info.filename for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith('.csv')
+                and '__MACOSX' not in info.filename and not Path(info.filename).name.startswith('._')
+            )
+            if not members:
+                raise ValueError(f"{path.name} contains no CSV files")
+            for member in members:
+                with archive.open(member) as raw:
+                    yield _csv_table(f"{path.name}:{member}", raw)
+    elif extension == '.csv.gz':
+        with gzip.open(path, 'rb') as raw:
+            yield _csv_table(path.name, raw)
+    elif extension == '.xlsx':
+        with zipfile.ZipFile(path) as archive:
+            yield _xlsx_table(path.name, archive)
+    else:
+        with open(path, 'rb') as raw:
+            yield _csv_table(path.name, raw)
+
+
+def _csv_table(name: str, raw) -> Table:
+    reader = csv.DictReader(io.TextIOWrapper(raw, encoding=TEXT_ENCODING, newline=''))
+    return Table(name, reader.fieldnames or [], reader)
+
+
+def _shared_strings(archive: zipfile.ZipFile) -> List[str]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as f:
+        for _, element in ElementTree.iterparse(f):
+            if element.tag == f"{XLSX_MAIN}si":
+                # Plain text or rich-text runs; phonetic hints (rPh) are not cell text
+                texts = element.findall(f"{XLSX_MAIN}t") + element.findall(f"{XLSX_MAIN}r/{XLSX_MAIN}t")
+                strings.append(''.join(t.text or '' for t in texts))
+                element.clear()
+    return strings
+
+
+def _date_styles(archive: zipfile.ZipFile) -> set:
+    """Indexes of cell styles whose number format shows a date or time."""
+    if "xl/styles.xml" not in archive.namelist():
+        return set()
+    styles = ElementTree.fromstring(archive.read("xl/styles.xml"))
+    custom = {}
+    for fmt in styles.iterfind(f"{XLSX_MAIN}numFmts/{XLSX_MAIN}numFmt"):
+        code = XLSX_FORMAT_LITERAL_RE.sub('', fmt.get("formatCode", "")).lower()
+        custom[int(fmt.get("numFmtId"))] = bool(XLSX_DATE_CODE_RE.search(code))
+    dates = set()
+    for index, xf in enumerate(styles.iterfind(f"{XLSX_MAIN}cellXfs/{XLSX_MAIN}xf")):
+        fmt_id = int(xf.get("numFmtId", 0))
+        if custom.get(fmt_id, fmt_id in XLSX_DATE_FORMAT_IDS):
+            dates.add(index)
+    return dates
+
+
+def _first_sheet(archive: zipfile.ZipFile) -> tuple:
+    """(worksheet path, epoch of serial date 0) of the workbook's first sheet."""
+    workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    properties = workbook.find(f"{XLSX_MAIN}workbookPr")
+    date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+    epoch = datetime(1904, 1, 1) if date1904 else datetime(1899, 12, 30)
+
+    sheet = workbook.find(f"{XLSX_MAIN}sheets/{XLSX_MAIN}sheet")
+    if sheet is None:
+        raise ValueError("Workbook has no worksheets")
+    rel_id = sheet.get(f"{XLSX_REL}id")
+    rels = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels.iter(f"{XLSX_PKG_REL}Relationship"):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            return (target.lstrip('/') if target.startswith('/') else f"xl/{target}"), epoch
+    raise ValueError("Worksheet relationship not found")
+
+
+def _column_index(ref: str) -> int:
+    index = 0
+    for char in CELL_REF_RE.match(ref).group():
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def _xlsx_rows(archive: zipfile.ZipFile) -> Iterator[List[str]]:
+    """Cell text of each worksheet row, streamed with iterparse."""
+    sheet_path, epoch = _first_sheet(archive)
+    shared = _shared_strings(archive)
+    date_styles = _date_styles(archive)
+
+    with archive.open(sheet_path) as f:
+        sheet_data = None
+        for event, element in ElementTree.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if element.tag == f"{XLSX_MAIN}sheetData":
+                    sheet_data = element
+                continue
+            if element.tag != f"{XLSX_MAIN}row":
+                continue
+            values = []
+            for cell in element.iterfind(f"{XLSX_MAIN}c"):
+                ref = cell.get("r")
+                position = _column_index(ref) if ref else len(values)
+                values.extend([''] * (position - len(values)))
+                values.append(_cell_text(cell, shared, date_styles, epoch))
+            yield values
+            # Processed rows are dropped so memory stays flat
+            if sheet_data is not None:
+                sheet_data.clear()
+
+
+def _cell_text(cell, shared: List[str], date_styles: set, epoch: datetime) -> str:
+    cell_type = cell.get("t", "n")
+    if cell_type == "inlineStr":
+        return ''.join(t.text or '' for t in cell.iter(f"{XLSX_MAIN}t"))
+    value = cell.findtext(f"{XLSX_MAIN}v")
+    if value is None:
+        return ''
+    if cell_type == "s":
+        return shared[int(value)]
+    if cell_type == "b":
+        return "TRUE" if value == "1" else "FALSE"
+    if cell_type != "n":
+        return value
+    number = float(value)
+    if int(cell.get("s", 0)) in date_styles:
+        moment = epoch + timedelta(seconds=round(number * 86400))
+        return moment.strftime("%Y-%m-%d %H:%M:%S")
+    return str(int(number)) if number.is_integer() else value
+
+
+def _xlsx_table(name: str, archive: zipfile.ZipFile) -> Table:
+    rows = _xlsx_rows(archive)
+    header = []
+    for values in rows:
+        if any(v.strip() for v in values):
+            header = values
+            break
+
+    def records():
+        for values in rows:
+            if not any(v.strip() for v in values):
+                continue
+            values = values + [''] * (len(header) - len(values))
+            yield dict(zip(header, values))
+
+    return Table(name, header, records())
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        limit = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+        for table in iter_tables(sys.argv[1]):
+            print(f"{table.name}: {table.fieldnames}")
+            for i, row in enumerate(table.rows):
+                if i >= limit:
+                    break
+                print(f"  {row}")
+    else:
+        print("Usage: python table_reader.py <file> [rows]")
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Timestamp Parsing and Time Index for Review Data Pipeline
+Parses the raw Time column into epoch seconds once at ingestion and builds a
+sorted, per-HW time index over final_result.json so range queries and
+day/hour activity buckets are binary searches instead of full scans.
+
+Timestamps without a UTC offset (e.g. "9/26/2022 17:49") are stored as
+wall-clock epoch seconds, i.e. as if they were UTC, so buckets line up with
+the times shown in the source export.
+
+Usage:
+    python time_index.py activity <final_result.json> [day|hour]
+    python time_index.py range <final_result.json> <start> <end> [hw]
+"""
+
+import os
+import sys
+import json
+import calendar
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import json_codec
+
+# Candidate formats, in order of preference; detection keeps the one that
+# parses the most sampled values (so a day > 12 settles month/day ambiguity)
+TIMESTAMP_FORMATS = [
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d %H:%M",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y %H:%M:%S",
+    "%m/%d/%Y",
+    "%Y-%m-%d",
+]
+EPOCH_FORMAT = "epoch"
+DETECT_SAMPLE_SIZE = 200
+
+BUCKET_SECONDS = {"hour": 3600, "day": 86400}
+
+
+def _to_epoch(value: str, fmt: str) -> int:
+    if fmt == EPOCH_FORMAT:
+        return int(float(value))
+    parsed = datetime.strptime(value, fmt)
+    if parsed.tzinfo is not None:
+        return int(parsed.timestamp())
+    return calendar.timegm(parsed.timetuple())
+
+
+def _is_missing(value: str) -> bool:
+    return not value or not value.strip() or value.strip().upper() == 'NULL'
+
+
+def detect_timestamp_format(values: Iterable[str]) -> Optional[str]:
+    """
+    Pick the format that parses the most non-empty sampled values (earlier
+    formats win ties); None if no format parses at least half of them.
+    """
+    sample = [v.strip() for v in values if not _is_missing(v)][:DETECT_SAMPLE_SIZE]
+    best, best_hits = None, 0
+    for fmt in TIMESTAMP_FORMATS + [EPOCH_FORMAT]:
+        hits = 0
+        for value in sample:
+            try:
+                _to_epoch(value, fmt)
+                hits += 1
+            except (ValueError, OverflowError):
+                pass
+        if hits > best_hits:
+            best, best_hits = fmt, hits
+        if hits == len(sample):
+            break
+    return best if sample and best_hits * 2 >= len(sample) else None
+
+
+class TimestampParser:
+    """
+    Parse raw timestamps of one file with its detected format.
+
+    Results are memoized per raw string (exports repeat the same minute many
+    times); values in another format fall back to trying every format.
+    """
+
+    def __init__(self, fmt: Optional[str]):
+        self.format = fmt
+        self.failures = 0
+        self._cache = {}
+
+    @classmethod
+    def for_values(cls, values: Iterable[str]) -> "TimestampParser":
+        return cls(detect_timestamp_format(values))
+
+    def parse(self, value: str) -> Optional[int]:
+        if _is_missing(value):
+            return None
+        try:
+            return self._cache[value]
+        except KeyError:
+            pass
+
+        stripped = value.strip()
+        epoch = None
+        for fmt in ([self.format] if self.format else []) + TIMESTAMP_FORMATS:
+            try:
+                epoch = _to_epoch(stripped, fmt)
+                break
+            except (ValueError, OverflowError):
+                continue
+        if epoch is None:
+            self.failures += 1
+        self._cache[value] = epoch
+        return epoch
+
+
+def parse_time_param(value: str) -> int:
+    """Parse a query parameter given as epoch seconds or a timestamp string."""
+    value = value.strip()
+    try:
+        return int(float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            return int(parsed.timestamp())
+        return calendar.timegm(parsed.timetuple())
+    except ValueError:
+        pass
+    epoch = TimestampParser(None).parse(value)
+    if epoch is None:
+        raise ValueError(f"Unrecognized time: {value}")
+    return epoch
+
+
+def format_epoch(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class TimeIndex:
+    """
+    Rounds of a result document sorted by timestamp, globally and per HW.
+
+    Each position refers back to (HW key, assignment index, round index).
+    """
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.missing = 0
+
+        parser = None
+        if any('Timestamp' not in r for r in _iter_rounds(data)):
+            # Results written before timestamps were parsed at ingestion
+            parser = TimestampParser.for_values(r.get('Time', '') for r in _iter_rounds(data))
+
+        entries = {}
+        for hw_key, assignments in data.items():
+            hw_entries = entries.setdefault(hw_key, [])
+            for a_idx, assignment in enumerate(assignments):
+                for r_idx, round_entry in enumerate(assignment.get('Round', [])):
+                    if 'Timestamp' in round_entry:
+                        epoch = round_entry['Timestamp']
+                    else:
+                        epoch = parser.parse(round_entry.get('Time', ''))
+                    if epoch is None:
+                        self.missing += 1
+                        continue
+                    hw_entries.append((epoch, a_idx, r_idx))
+
+        self.by_hw = {}
+        all_entries = []
+        for hw_key, hw_entries in entries.items():
+            hw_entries.sort()
+            self.by_hw[hw_key] = (array('q', (e[0] for e in hw_entries)), [(hw_key, e[1], e[2]) for e in hw_entries])
+            all_entries.extend((e[0], hw_key, e[1], e[2]) for e in hw_entries)
+        all_entries.sort(key=lambda e: e[0])
+        self.times = array('q', (e[0] for e in all_entries))
+        self.refs = [e[1:] for e in all_entries]
+
+    def _column(self, hw: Optional[str]):
+        if hw is None:
+            return self.times, self.refs
+        if hw not in self.by_hw:
+            raise KeyError(f"Unknown assignment: {hw}")
+        return self.by_hw[hw]
+
+    def span(self, hw: Optional[str] = None) -> Optional[tuple]:
+        times, _ = self._column(hw)
+        return (times[0], times[-1]) if times else None
+
+    def count(self, start: int, end: int, hw: Optional[str] = None) -> int:
+        """Number of rounds with start <= timestamp <= end."""
+        times, _ = self._column(hw)
+        return bisect_right(times, end) - bisect_left(times, start)
+
+    def query(self, start: int, end: int, hw: Optional[str] = None, limit: int = None) -> List[dict]:
+        """Rounds with start <= timestamp <= end, oldest first."""
+        times, refs = self._column(hw)
+        lo = bisect_left(times, start)
+        hi = bisect_right(times, end)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        results = []
+        for i in range(lo, hi):
+            hw_key, a_idx, r_idx = refs[i]
+            assignment = self.data[hw_key][a_idx]
+            round_entry = assignment['Round'][r_idx]
+            results.append({
+                "Assignment": hw_key,
+                "Author": assignment.get('Author', ''),
+                "Reviewer": assignment.get('Reviewer', ''),
+                "Round": round_entry.get('Round'),
+                "Time": round_entry.get('Time', ''),
+                "Timestamp": times[i],
+                "Feedback": round_entry.get('Feedback', '')
+            })
+        return results
+
+    def before_deadline(self, hw: str, hours: float = 48, deadline: int = None) -> tuple:
+        """
+        (start, end) window of the last `hours` before the deadline; the
+        deadline defaults to the HW's last review.
+        """
+        if deadline is None:
+            span = self.span(hw)
+            if span is None:
+                raise KeyError(f"No timestamps for {hw}")
+            deadline = span[1]
+        return deadline - int(hours * 3600), deadline
+
+    def activity(self, bucket: str = "day", hw: Optional[str] = None) -> Dict[str, List[dict]]:
+        """
+        Review counts per day/hour bucket for each HW (or one HW).
+
+        Walks bucket boundaries with bisect, so the cost grows with the number
+        of non-empty buckets rather than the number of rounds.
+        """
+        size = BUCKET_SECONDS.get(bucket)
+        if size is None:
+            raise ValueError(f"bucket must be one of: {', '.join(BUCKET_SECONDS)}")
+
+        series = {}
+        for hw_key in ([hw] if hw is not None else list(self.by_hw)):
+            times, _ = self._column(hw_key)
+            buckets = []
+            position = 0
+            while position < len(times):
+                bucket_start = times[position] - times[position] % size
+                following = bisect_left(times, bucket_start + size, position)
+                buckets.append({"start": format_epoch(bucket_start), "count": following - position})
+                position = following
+            series[hw_key] = buckets
+        return series
+
+
+def _iter_rounds(data: dict):
+    for assignments in data.values():
+        for assignment in assignments:
+            yield from assignment.get('Round', [])
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_time_index(result_path) -> TimeIndex:
+    """Return the time index for a result file, rebuilt when the file changes."""
+    result_path = Path(result_path)
+    st = os.stat(result_path)
+    key = (st.st_mtime_ns, st.st_size)
+    with _indexes_lock:
+        cached = _indexes.get(str(result_path))
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    index = TimeIndex(json_codec.load_result(result_path))
+    with _indexes_lock:
+        _indexes[str(result_path)] = (key, index)
+    return index
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == 'activity':
+        bucket = sys.argv[3] if len(sys.argv) > 3 else "day"
+        print(json.dumps(get_time_index(sys.argv[2]).activity(bucket), indent=2))
+    elif len(sys.argv) >= 5 and sys.argv[1] == 'range':
+        index = get_time_index(sys.argv[2])
+        hw = sys.argv[5] if len(sys.argv) > 5 else None
+        start, end = parse_time_param(sys.argv[3]), parse_time_param(sys.argv[4])
+        print(json.dumps(index.query(start, end, hw), indent=2, ensure_ascii=False))
+    else:
+        print("Usage: python time_index.py activity <final_result.json> [day|hour]")
+        print("       python time_index.py range <final_result.json> <start> <end> [hw]")